@@ -3,19 +3,22 @@ Agency management routes for the Digital Signage API
 """
 
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 import os
-import uuid
 from app.core.database import get_db
-from app.core.security import get_current_active_user
+from app.core.security import get_current_active_user, get_current_admin_user
+from app.core.events import broker
+from app.core.media_responses import MediaResponse
 from app.models.agency import Agency
 from app.models.user import User
 from app.models.device import Device
 from app.models.content import Content
-from app.schemas.agency import Agency, AgencyCreate, AgencyUpdate, AgencyResponse
+from app.schemas.agency import Agency as AgencySchema, AgencyCreate, AgencyUpdate, AgencyResponse
+from app.services.agency_counters import repair_agency_counters
+from app.services.media_store import media_store
+from app.services.uploads import UPLOAD_OPENAPI, UploadTooLarge, store_upload
 from app.core.config import settings
 
 router = APIRouter()
@@ -28,21 +31,8 @@ async def get_agencies(
     db: AsyncSession = Depends(get_db)
 ):
     """Get all agencies with counts"""
-    result = await db.execute(
-        select(
-            Agency,
-            func.count(User.id).label("users_count"),
-            func.count(Device.id).label("devices_count"),
-            func.count(Content.id).label("contents_count")
-        )
-        .outerjoin(User, Agency.id == User.agency_id)
-        .outerjoin(Device, Agency.id == Device.agency_id)
-        .outerjoin(Content, Agency.id == Content.agency_id)
-        .group_by(Agency.id)
-        .offset(skip)
-        .limit(limit)
-    )
-    agencies = result.all()
+    result = await db.execute(select(Agency).order_by(Agency.id).offset(skip).limit(limit))
+    agencies = result.scalars().all()
 
     return [
         AgencyResponse(
@@ -62,14 +52,21 @@ async def get_agencies(
             hibernation_end=agency.hibernation_end,
             created_at=agency.created_at,
             updated_at=agency.updated_at,
-            users_count=users_count,
-            devices_count=devices_count,
-            contents_count=contents_count
+            users_count=agency.users_count,
+            devices_count=agency.devices_count,
+            contents_count=agency.contents_count
         )
-        for agency, users_count, devices_count, contents_count in agencies
+        for agency in agencies
     ]
 
-@router.post("/", response_model=Agency)
+@router.post("/recount")
+async def recount_agencies(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Recompute the user, device and content counters of every agency"""
+    return {"repaired_agencies": await repair_agency_counters()}
+
+@router.post("/", response_model=AgencySchema)
 async def create_agency(
     agency_data: AgencyCreate,
     current_user: User = Depends(get_current_active_user),
@@ -103,28 +100,15 @@ async def get_agency(
     db: AsyncSession = Depends(get_db)
 ):
     """Get a specific agency by ID"""
-    result = await db.execute(
-        select(
-            Agency,
-            func.count(User.id).label("users_count"),
-            func.count(Device.id).label("devices_count"),
-            func.count(Content.id).label("contents_count")
-        )
-        .outerjoin(User, Agency.id == User.agency_id)
-        .outerjoin(Device, Agency.id == Device.agency_id)
-        .outerjoin(Content, Agency.id == Content.agency_id)
-        .where(Agency.id == agency_id)
-        .group_by(Agency.id)
-    )
-    agency_data = result.first()
+    result = await db.execute(select(Agency).where(Agency.id == agency_id))
+    agency = result.scalar_one_or_none()
 
-    if not agency_data:
+    if not agency:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Agency not found"
         )
 
-    agency, users_count, devices_count, contents_count = agency_data
     return AgencyResponse(
         id=agency.id,
         name=agency.name,
@@ -142,12 +126,12 @@ async def get_agency(
         hibernation_end=agency.hibernation_end,
         created_at=agency.created_at,
         updated_at=agency.updated_at,
-        users_count=users_count,
-        devices_count=devices_count,
-        contents_count=contents_count
+        users_count=agency.users_count,
+        devices_count=agency.devices_count,
+        contents_count=agency.contents_count
     )
 
-@router.put("/{agency_id}", response_model=Agency)
+@router.put("/{agency_id}", response_model=AgencySchema)
 async def update_agency(
     agency_id: int,
     agency_update: AgencyUpdate,
@@ -164,14 +148,25 @@ async def update_agency(
             detail="Agency not found"
         )
 
+    previous_logo_url = db_agency.logo_url
+
     # Update agency fields
     for field, value in agency_update.dict(exclude_unset=True).items():
         if hasattr(db_agency, field):
             setattr(db_agency, field, value)
 
+    if previous_logo_url != db_agency.logo_url:
+        # A URL set by hand is served with the type of the file it points to
+        db_agency.logo_media_type = None
+
     await db.commit()
     await db.refresh(db_agency)
 
+    if previous_logo_url != db_agency.logo_url:
+        await media_store.release(db, previous_logo_url)
+
+    broker.publish(db_agency.id, "agency", "updated", db_agency.id)
+
     return db_agency
 
 @router.delete("/{agency_id}")
@@ -211,12 +206,16 @@ async def delete_agency(
     await db.delete(db_agency)
     await db.commit()
 
+    await media_store.release(db, db_agency.logo_url)
+
+    broker.publish(agency_id, "agency", "deleted", agency_id)
+
     return {"message": "Agency deleted successfully"}
 
-@router.post("/{agency_id}/upload-logo")
+@router.post("/{agency_id}/upload-logo", openapi_extra=UPLOAD_OPENAPI)
 async def upload_logo(
     agency_id: int,
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -231,30 +230,36 @@ async def upload_logo(
             detail="Agency not found"
         )
 
-    # Validate file type
-    if not file.content_type.startswith("image/"):
+    # Stream the file to disk, checking its type and size on the way
+    try:
+        stored = await store_upload(
+            request,
+            settings.MAX_FILE_SIZE,
+            expected_kind="image"
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File must be an image"
+            detail=str(e)
         )
 
-    # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(settings.UPLOAD_DIR, "logos", unique_filename)
-
-    # Ensure directory exists
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # Point the agency logo to its blob, shared with every identical upload
+    previous_logo_url = db_agency.logo_url
+    async with media_store.lock:
+        db_agency.logo_url = await media_store.put(stored)
+        db_agency.logo_media_type = stored["media_type"]
+        await db.commit()
+    await db.refresh(db_agency)
 
-    # Save file
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    if previous_logo_url != db_agency.logo_url:
+        await media_store.release(db, previous_logo_url)
 
-    # Update agency logo URL
-    db_agency.logo_url = f"/uploads/logos/{unique_filename}"
-    await db.commit()
-    await db.refresh(db_agency)
+    broker.publish(db_agency.id, "agency", "updated", db_agency.id)
 
     return {"message": "Logo uploaded successfully", "logo_url": db_agency.logo_url}
 
@@ -281,4 +286,4 @@ async def get_logo(
             detail="Logo file not found"
         )
 
-    return FileResponse(logo_path)
+    return MediaResponse(logo_path, media_type=db_agency.logo_media_type)
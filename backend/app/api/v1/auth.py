@@ -6,6 +6,7 @@ from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.auth_cache import invalidate_user
 from app.core.database import get_db
 from app.core.security import (
     authenticate_user, create_access_token, get_current_active_user,
@@ -63,7 +64,7 @@ async def register(
         )
 
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     db_user = UserModel(
         username=user_data.username,
         email=user_data.email,
@@ -94,14 +95,18 @@ async def update_current_user(
     db: AsyncSession = Depends(get_db)
 ):
     """Update current user information"""
+    previous_username = current_user.username
+
     # Update user fields
     for field, value in user_update.dict(exclude_unset=True).items():
         if field == "password" and value:
-            setattr(current_user, "hashed_password", get_password_hash(value))
+            setattr(current_user, "hashed_password", await get_password_hash(value))
         elif hasattr(current_user, field):
             setattr(current_user, field, value)
 
     await db.commit()
     await db.refresh(current_user)
 
+    invalidate_user(previous_username, current_user.username)
+
     return current_user
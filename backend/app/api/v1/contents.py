@@ -2,23 +2,55 @@
 Content management routes for the Digital Signage API
 """
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from fastapi.responses import FileResponse
+from datetime import datetime, timezone
+from typing import Dict, List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 import os
-import uuid
 from app.core.database import get_db
 from app.core.security import get_current_active_user
+from app.core.events import broker
+from app.core.http_cache import agency_etag, agency_versions, etag_matches, not_modified, set_etag
+from app.core.media_responses import MediaResponse
 from app.models.content import Content
 from app.models.agency import Agency
 from app.models.schedule import Schedule
-from app.schemas.content import Content, ContentCreate, ContentUpdate, ContentResponse
+from app.models.user import User
+from app.schemas.content import Content as ContentSchema, ContentCreate, ContentUpdate, ContentResponse
+from app.services.media_store import media_store
+from app.services.resumable_uploads import (
+    CHECKSUM_ALGORITHMS, TUS_EXTENSIONS, TUS_VERSION, ChecksumMismatch, UploadConflict,
+    parse_upload_checksum, parse_upload_metadata, upload_expires, upload_sessions
+)
+from app.services.uploads import UPLOAD_OPENAPI, UploadTooLarge, store_upload
 from app.core.config import settings
 
 router = APIRouter()
 
+async def publish_content_change(db: AsyncSession, content: Content, action: str):
+    """Publish a content change to its agency and to every agency that schedules it"""
+    result = await db.execute(
+        select(Schedule.agency_id).where(Schedule.content_id == content.id).distinct()
+    )
+    for agency_id in {content.agency_id, *result.scalars().all()}:
+        broker.publish(agency_id, "content", action, content.id)
+
+async def attach_content_file(db: AsyncSession, content: Content, stored: Dict):
+    """Point a content to the blob of an upload, shared with every identical upload"""
+    previous_file_path = content.file_path
+    async with media_store.lock:
+        content.file_path = await media_store.put(stored)
+        content.checksum = stored["checksum"]
+        content.media_type = stored["media_type"]
+        await db.commit()
+    await db.refresh(content)
+
+    if previous_file_path != content.file_path:
+        await media_store.release(db, previous_file_path)
+
+    await publish_content_change(db, content, "updated")
+
 @router.get("/", response_model=List[ContentResponse])
 async def get_contents(
     skip: int = 0,
@@ -51,6 +83,8 @@ async def get_contents(
             content_type=content.content_type,
             url=content.url,
             file_path=content.file_path,
+            checksum=content.checksum,
+            media_type=content.media_type,
             duration=content.duration,
             is_active=content.is_active,
             agency_id=content.agency_id,
@@ -62,7 +96,7 @@ async def get_contents(
         for content, agency_name, schedules_count in contents
     ]
 
-@router.post("/", response_model=Content)
+@router.post("/", response_model=ContentSchema)
 async def create_content(
     content_data: ContentCreate,
     current_user: User = Depends(get_current_active_user),
@@ -85,15 +119,35 @@ async def create_content(
     await db.commit()
     await db.refresh(db_content)
 
+    broker.publish(db_content.agency_id, "content", "created", db_content.id)
+
     return db_content
 
 @router.get("/{content_id}", response_model=ContentResponse)
 async def get_content(
     content_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Get specific content by ID"""
+    # Validate against the agency version before running the aggregate query
+    result = await db.execute(select(Content.agency_id).where(Content.id == content_id))
+    agency_id = result.scalar_one_or_none()
+
+    if agency_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Content not found"
+        )
+
+    # Schedules of other agencies also change the count, so their generation is part of the tag
+    etag = agency_etag(agency_id, content_id, f"s{agency_versions.schedules}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
     result = await db.execute(
         select(Content, Agency.name.label("agency_name"))
         .join(Agency, Content.agency_id == Agency.id)
@@ -111,6 +165,7 @@ async def get_content(
         )
 
     content, agency_name, schedules_count = content_data
+
     return ContentResponse(
         id=content.id,
         title=content.title,
@@ -118,6 +173,8 @@ async def get_content(
         content_type=content.content_type,
         url=content.url,
         file_path=content.file_path,
+        checksum=content.checksum,
+        media_type=content.media_type,
         duration=content.duration,
         is_active=content.is_active,
         agency_id=content.agency_id,
@@ -127,7 +184,7 @@ async def get_content(
         schedules_count=schedules_count
     )
 
-@router.put("/{content_id}", response_model=Content)
+@router.put("/{content_id}", response_model=ContentSchema)
 async def update_content(
     content_id: int,
     content_update: ContentUpdate,
@@ -144,14 +201,28 @@ async def update_content(
             detail="Content not found"
         )
 
+    previous_agency_id = db_content.agency_id
+    previous_file_path = db_content.file_path
+
     # Update content fields
     for field, value in content_update.dict(exclude_unset=True).items():
         if hasattr(db_content, field):
             setattr(db_content, field, value)
 
+    if previous_file_path != db_content.file_path:
+        # A path set by hand is served with the type of the file it points to
+        db_content.media_type = None
+
     await db.commit()
     await db.refresh(db_content)
 
+    if previous_file_path != db_content.file_path:
+        await media_store.release(db, previous_file_path)
+
+    await publish_content_change(db, db_content, "updated")
+    if previous_agency_id != db_content.agency_id:
+        broker.publish(previous_agency_id, "content", "deleted", db_content.id)
+
     return db_content
 
 @router.delete("/{content_id}")
@@ -184,21 +255,20 @@ async def delete_content(
             detail="Cannot delete content with associated schedules"
         )
 
-    # Delete file if exists
-    if db_content.file_path:
-        file_path = os.path.join(settings.UPLOAD_DIR, db_content.file_path.replace("/uploads/", ""))
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
     await db.delete(db_content)
     await db.commit()
 
+    # Delete the file once no other content or logo uses it
+    await media_store.release(db, db_content.file_path)
+
+    broker.publish(db_content.agency_id, "content", "deleted", content_id)
+
     return {"message": "Content deleted successfully"}
 
-@router.post("/{content_id}/upload")
+@router.post("/{content_id}/upload", openapi_extra=UPLOAD_OPENAPI)
 async def upload_content_file(
     content_id: int,
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -213,37 +283,244 @@ async def upload_content_file(
             detail="Content not found"
         )
 
-    # Validate file type based on content type
-    if db_content.content_type == "image" and not file.content_type.startswith("image/"):
+    # Stream the file to disk, hashing and checking its type and size on the way
+    try:
+        stored = await store_upload(
+            request,
+            settings.MAX_FILE_SIZE,
+            expected_kind=expected_media_kind(db_content)
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    await attach_content_file(db, db_content, stored)
+
+    return {"message": "File uploaded successfully", "file_path": db_content.file_path}
+
+def expected_media_kind(content: Content):
+    """Kind of file an upload for a content must contain"""
+    return content.content_type if content.content_type in ("image", "video") else None
+
+async def get_upload_session(content_id: int, upload_id: str, user: User) -> Dict:
+    """Load an upload session of the user for a content or raise 404"""
+    session = await upload_sessions.get(upload_id)
+    if not session or session["content_id"] != content_id or session["user_id"] != user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    return session
+
+def upload_headers(session: Dict) -> Dict[str, str]:
+    """tus headers describing the state of an upload"""
+    return {
+        "Tus-Resumable": TUS_VERSION,
+        "Upload-Offset": str(session["offset"]),
+        "Upload-Length": str(session["length"]),
+        "Upload-Expires": upload_expires(session),
+        "Cache-Control": "no-store"
+    }
+
+def upload_progress(session: Dict) -> Dict:
+    """JSON view of an upload session"""
+    return {
+        "id": session["id"],
+        "content_id": session["content_id"],
+        "offset": session["offset"],
+        "length": session["length"],
+        "progress": round(session["offset"] / session["length"] * 100, 1) if session["length"] else 100.0,
+        "expires_at": datetime.fromtimestamp(session["expires_at"], timezone.utc).isoformat()
+    }
+
+@router.options("/{content_id}/uploads")
+async def upload_options():
+    """tus discovery"""
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT,
+        headers={
+            "Tus-Resumable": TUS_VERSION,
+            "Tus-Version": TUS_VERSION,
+            "Tus-Extension": TUS_EXTENSIONS,
+            "Tus-Max-Size": str(settings.MAX_RESUMABLE_UPLOAD_SIZE),
+            "Tus-Checksum-Algorithm": ",".join(CHECKSUM_ALGORITHMS)
+        }
+    )
+
+@router.post("/{content_id}/uploads", status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    content_id: int,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Start a resumable upload for a content"""
+    result = await db.execute(select(Content).where(Content.id == content_id))
+    db_content = result.scalar_one_or_none()
+
+    if not db_content:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Content not found"
+        )
+
+    if not expected_media_kind(db_content):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File must be an image for image content"
+            detail="Only image and video contents take uploads"
         )
-    elif db_content.content_type == "video" and not file.content_type.startswith("video/"):
+
+    length = request.headers.get("upload-length", "")
+    if not length.isdigit() or int(length) == 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File must be a video for video content"
+            detail="Upload-Length header must be the file size in bytes"
+        )
+    if int(length) > settings.MAX_RESUMABLE_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the maximum size of {settings.MAX_RESUMABLE_UPLOAD_SIZE} bytes"
         )
 
-    # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(settings.UPLOAD_DIR, "contents", unique_filename)
+    try:
+        metadata = parse_upload_metadata(request.headers.get("upload-metadata", ""))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
 
-    # Ensure directory exists
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    session = await upload_sessions.create(content_id, current_user.id, int(length), metadata)
 
-    # Save file
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    response.headers.update(upload_headers(session))
+    response.headers["Location"] = f"{request.url.path.rstrip('/')}/{session['id']}"
+    return upload_progress(session)
 
-    # Update content
-    db_content.file_path = f"/uploads/contents/{unique_filename}"
-    await db.commit()
-    await db.refresh(db_content)
+@router.head("/{content_id}/uploads/{upload_id}")
+async def get_upload_offset(
+    content_id: int,
+    upload_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Offset to resume an upload from"""
+    session = await get_upload_session(content_id, upload_id, current_user)
+    return Response(headers=upload_headers(session))
 
-    return {"message": "File uploaded successfully", "file_path": db_content.file_path}
+@router.get("/{content_id}/uploads/{upload_id}")
+async def get_upload_progress(
+    content_id: int,
+    upload_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Progress of a resumable upload"""
+    session = await get_upload_session(content_id, upload_id, current_user)
+    return upload_progress(session)
+
+@router.patch("/{content_id}/uploads/{upload_id}")
+async def append_upload_chunk(
+    content_id: int,
+    upload_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Append a chunk to a resumable upload, attaching the file once complete"""
+    session = await get_upload_session(content_id, upload_id, current_user)
+
+    if request.headers.get("content-type", "").split(";")[0].strip() != "application/offset+octet-stream":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Chunks must be sent as application/offset+octet-stream"
+        )
+
+    offset = request.headers.get("upload-offset", "")
+    if not offset.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Upload-Offset header must be the offset of the chunk"
+        )
+
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(offset) + int(content_length) > session["length"]:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Upload exceeds its declared length of {session['length']} bytes"
+        )
+
+    checksum = None
+    if request.headers.get("upload-checksum"):
+        try:
+            checksum = parse_upload_checksum(request.headers["upload-checksum"])
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+
+    try:
+        await upload_sessions.append(session, int(offset), request.stream(), checksum)
+    except UploadConflict as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except ChecksumMismatch as e:
+        # 460 Checksum Mismatch, from the tus checksum extension
+        raise HTTPException(
+            status_code=460,
+            detail=str(e)
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+
+    headers = upload_headers(session)
+    if session["offset"] < session["length"]:
+        return Response(status_code=status.HTTP_204_NO_CONTENT, headers=headers)
+
+    # Last chunk: check the whole file and attach it to the content
+    result = await db.execute(select(Content).where(Content.id == content_id))
+    db_content = result.scalar_one_or_none()
+
+    try:
+        if not db_content:
+            raise ValueError("Content not found")
+        stored = await upload_sessions.finish(session)
+        expected_kind = expected_media_kind(db_content)
+        if expected_kind and stored["kind"] != expected_kind:
+            raise ValueError(f"File content is not a valid {expected_kind}")
+    except ValueError as e:
+        await upload_sessions.delete(session["id"])
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    await attach_content_file(db, db_content, stored)
+    await upload_sessions.delete(session["id"])
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=headers)
+
+@router.delete("/{content_id}/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_upload(
+    content_id: int,
+    upload_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Abort a resumable upload"""
+    session = await get_upload_session(content_id, upload_id, current_user)
+    await upload_sessions.delete(session["id"])
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers={"Tus-Resumable": TUS_VERSION})
 
 @router.get("/{content_id}/file")
 async def get_content_file(
@@ -268,4 +545,8 @@ async def get_content_file(
             detail="Content file not found on disk"
         )
 
-    return FileResponse(file_path)
+    return MediaResponse(
+        file_path,
+        etag=f'"{db_content.checksum}"' if db_content.checksum else None,
+        media_type=db_content.media_type
+    )
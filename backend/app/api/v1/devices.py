@@ -2,19 +2,30 @@
 Device management routes for the Digital Signage API
 """
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from datetime import datetime
 from app.core.database import get_db
+from app.core.device_keys import authorize_agency_websocket, authorize_device, device_keyring
+from app.core.events import broker
+from app.core.http_cache import agency_etag, etag_matches, not_modified, set_etag
 from app.core.security import get_current_active_user
 from app.models.device import Device
 from app.models.agency import Agency
-from app.schemas.device import Device, DeviceCreate, DeviceUpdate, DeviceResponse, DeviceStatusUpdate
+from app.models.user import User
+from app.schemas.device import Device as DeviceSchema, DeviceCreate, DeviceUpdate, DeviceResponse, DeviceStatus, DeviceStatusUpdate
+from app.services.heartbeats import heartbeat_buffer
+from app.services.now_playing import now_playing_cache
+from app.services.presence import presence_tracker
 
 router = APIRouter()
 
+# Idle connections get a ping so proxies and NAT keep them open
+EVENTS_PING_INTERVAL = 30  # seconds
+
 @router.get("/", response_model=List[DeviceResponse])
 async def get_devices(
     skip: int = 0,
@@ -39,8 +50,8 @@ async def get_devices(
             ip_address=device.ip_address,
             mac_address=device.mac_address,
             agency_id=device.agency_id,
-            status=device.status,
-            last_seen=device.last_seen,
+            status=device_status,
+            last_seen=last_seen,
             version=device.version,
             notes=device.notes,
             created_at=device.created_at,
@@ -48,9 +59,22 @@ async def get_devices(
             agency_name=agency_name
         )
         for device, agency_name in devices
+        for device_status, last_seen in [presence_tracker.current(device)]
     ]
 
-@router.post("/", response_model=Device)
+@router.get("/summary")
+async def get_devices_summary(
+    agency_id: Optional[List[int]] = Query(None),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Device counts by status for some agencies (repeat agency_id) or the whole fleet
+
+    Counts come from the presence tracker; page through the devices of an
+    agency with /agency/{agency_id}/status.
+    """
+    return presence_tracker.summary(agency_id)
+
+@router.post("/", response_model=DeviceSchema)
 async def create_device(
     device_data: DeviceCreate,
     current_user: User = Depends(get_current_active_user),
@@ -85,6 +109,9 @@ async def create_device(
     await db.commit()
     await db.refresh(db_device)
 
+    device_keyring.track(db_device.id, db_device.key_serial, db_device.agency_id)
+    presence_tracker.track(db_device)
+
     return db_device
 
 @router.get("/{device_id}", response_model=DeviceResponse)
@@ -108,14 +135,15 @@ async def get_device(
         )
 
     device, agency_name = device_data
+    device_status, last_seen = presence_tracker.current(device)
     return DeviceResponse(
         id=device.id,
         name=device.name,
         ip_address=device.ip_address,
         mac_address=device.mac_address,
         agency_id=device.agency_id,
-        status=device.status,
-        last_seen=device.last_seen,
+        status=device_status,
+        last_seen=last_seen,
         version=device.version,
         notes=device.notes,
         created_at=device.created_at,
@@ -123,7 +151,7 @@ async def get_device(
         agency_name=agency_name
     )
 
-@router.put("/{device_id}", response_model=Device)
+@router.put("/{device_id}", response_model=DeviceSchema)
 async def update_device(
     device_id: int,
     device_update: DeviceUpdate,
@@ -140,6 +168,10 @@ async def update_device(
             detail="Device not found"
         )
 
+    # An explicit status wins over a status change not yet written
+    if device_update.status is not None:
+        heartbeat_buffer.discard(device_id)
+
     # Update device fields
     for field, value in device_update.dict(exclude_unset=True).items():
         if hasattr(db_device, field):
@@ -148,6 +180,12 @@ async def update_device(
     await db.commit()
     await db.refresh(db_device)
 
+    now_playing_cache.forget_device(device_id)
+    device_keyring.track(db_device.id, db_device.key_serial, db_device.agency_id)
+    presence_tracker.track(db_device)
+    if device_update.status is not None:
+        presence_tracker.set_status(device_id, db_device.status)
+
     return db_device
 
 @router.delete("/{device_id}")
@@ -169,16 +207,24 @@ async def delete_device(
     await db.delete(db_device)
     await db.commit()
 
+    now_playing_cache.forget_device(device_id)
+    device_keyring.forget(device_id)
+    presence_tracker.forget(device_id)
+    heartbeat_buffer.discard(device_id)
+
     return {"message": "Device deleted successfully"}
 
-@router.post("/{device_id}/status", response_model=Device)
-async def update_device_status(
+@router.post("/{device_id}/key")
+async def issue_device_key(
     device_id: int,
-    status_update: DeviceStatusUpdate,
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Update device status (used by Raspberry Pi devices)"""
+    """Issue the API key of a device, revoking its previous one
+
+    The key is only shown in this response; provision it as device_key in
+    the player configuration.
+    """
     result = await db.execute(select(Device).where(Device.id == device_id))
     db_device = result.scalar_one_or_none()
 
@@ -188,44 +234,150 @@ async def update_device_status(
             detail="Device not found"
         )
 
-    # Update status and last seen
-    db_device.status = status_update.status
-    db_device.last_seen = status_update.last_seen or datetime.utcnow()
+    db_device.key_serial = (db_device.key_serial or 0) + 1
+    await db.commit()
+
+    device_keyring.track(db_device.id, db_device.key_serial, db_device.agency_id)
+
+    return {"device_id": device_id, "device_key": device_keyring.issue(db_device.id, db_device.key_serial)}
+
+@router.delete("/{device_id}/key")
+async def revoke_device_key(
+    device_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Revoke the API key of a device"""
+    result = await db.execute(select(Device).where(Device.id == device_id))
+    db_device = result.scalar_one_or_none()
+
+    if not db_device:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Device not found"
+        )
 
+    # The new serial is never handed out, so no key matches it
+    db_device.key_serial = (db_device.key_serial or 0) + 1
     await db.commit()
-    await db.refresh(db_device)
 
-    return db_device
+    device_keyring.track(db_device.id, db_device.key_serial, db_device.agency_id)
+
+    return {"message": "Device key revoked"}
+
+@router.post("/{device_id}/status", response_model=DeviceSchema)
+async def update_device_status(
+    device_id: int,
+    status_update: DeviceStatusUpdate,
+    caller = Depends(authorize_device)
+):
+    """Update device status (used by Raspberry Pi devices, with their device key)
+
+    Heartbeats refresh the presence of the device in memory and are written
+    with the others a few seconds later.
+    """
+    last_seen = status_update.last_seen or datetime.utcnow()
+    entry = presence_tracker.heartbeat(device_id, status_update.status.value, last_seen)
+
+    if entry is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Device not found"
+        )
+
+    return presence_tracker.get(device_id)
+
+@router.get("/{device_id}/now")
+async def get_device_now_playing(
+    device_id: int,
+    request: Request,
+    response: Response,
+    caller = Depends(authorize_device),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the content a device should play now and how long it stays valid"""
+    agency_id = await now_playing_cache.get_device_agency(db, device_id)
+
+    if agency_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Device not found"
+        )
+
+    now = datetime.now()
+    answer = await now_playing_cache.get(db, agency_id, now)
+
+    etag = agency_etag(agency_id, answer["schedule_id"] or 0)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    return {
+        "device_id": device_id,
+        "agency_id": agency_id,
+        "schedule_id": answer["schedule_id"],
+        "content": answer["content"],
+        "valid_until": answer["valid_until"].isoformat(),
+        "seconds_until_change": int((answer["valid_until"] - now).total_seconds())
+    }
 
 @router.get("/agency/{agency_id}/status")
 async def get_agency_devices_status(
     agency_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    skip: int = 0,
+    limit: int = 100,
+    device_status: Optional[DeviceStatus] = Query(None, alias="status"),
+    current_user: User = Depends(get_current_active_user)
 ):
-    """Get status of all devices for an agency"""
-    result = await db.execute(
-        select(Device)
-        .where(Device.agency_id == agency_id)
-        .order_by(Device.last_seen.desc())
-    )
-    devices = result.scalars().all()
+    """Get status of the devices of an agency (from the presence tracker)
+
+    The counts cover every device; the list is a page of them, most recently
+    seen first, optionally only those with the given status.
+    """
+    counts = presence_tracker.agency_counts(agency_id)
+    devices = presence_tracker.agency_devices(agency_id, device_status.value if device_status else None)
 
     return {
         "agency_id": agency_id,
-        "total_devices": len(devices),
-        "online_devices": len([d for d in devices if d.status == "online"]),
-        "offline_devices": len([d for d in devices if d.status == "offline"]),
-        "maintenance_devices": len([d for d in devices if d.status == "maintenance"]),
+        "total_devices": counts["total"],
+        "online_devices": counts["online"],
+        "offline_devices": counts["offline"],
+        "maintenance_devices": counts["maintenance"],
+        "matching_devices": len(devices),
         "devices": [
             {
-                "id": device.id,
-                "name": device.name,
-                "ip_address": device.ip_address,
-                "status": device.status,
-                "last_seen": device.last_seen,
-                "version": device.version
+                "id": device["id"],
+                "name": device["name"],
+                "ip_address": device["ip_address"],
+                "status": device["status"],
+                "last_seen": device["last_seen"],
+                "version": device["version"]
             }
-            for device in devices
+            for device in devices[skip:skip + limit]
         ]
     }
+
+@router.websocket("/agency/{agency_id}/events")
+async def agency_events(websocket: WebSocket, agency_id: int):
+    """Push change events of an agency to its devices (device key of the agency or user JWT)"""
+    if not await authorize_agency_websocket(websocket, agency_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    queue = broker.subscribe(agency_id)
+
+    try:
+        await websocket.send_json({"type": "hello", "agency_id": agency_id})
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), EVENTS_PING_INTERVAL)
+            except asyncio.TimeoutError:
+                await websocket.send_json({"type": "ping"})
+                continue
+            await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        broker.unsubscribe(agency_id, queue)
@@ -3,40 +3,62 @@ Schedule management routes for the Digital Signage API
 """
 
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_
+from sqlalchemy import select
 from datetime import datetime, time
 from app.core.database import get_db
+from app.core.device_keys import authorize_agency_reader
 from app.core.security import get_current_active_user
-from app.models.schedule import Schedule
+from app.core.events import broker
+from app.core.http_cache import agency_etag, agency_versions, etag_matches, not_modified, set_etag
+from app.models.schedule import Schedule, days_to_mask
 from app.models.content import Content
 from app.models.agency import Agency
-from app.schemas.schedule import Schedule, ScheduleCreate, ScheduleUpdate, ScheduleResponse, ScheduleConflict
+from app.models.user import User
+from app.schemas.schedule import Schedule as ScheduleSchema, ScheduleCreate, ScheduleUpdate, ScheduleResponse
+from app.services.manifest import agency_manifest_version, build_agency_manifest, manifest_versions
+from app.services.schedule_conflicts import (
+    analyze, candidate_conflicts, conflict_entry, describe_conflicts, load_conflict_entries,
+    load_overlapping_entries, operating_window
+)
+from app.services.schedule_import import import_schedules, parse_import_body, report_lines
+from app.services.schedule_index import schedule_index
 
 router = APIRouter()
 
-def check_schedule_conflict(
+async def check_schedule_conflict(
+    db: AsyncSession,
     start_time: time,
     end_time: time,
     days_of_week: str,
     agency_id: int,
+    content_id: int,
+    priority: int,
     exclude_schedule_id: int = None
 ) -> str:
     """Check for schedule conflicts"""
-    # This would be implemented with database queries to check for overlapping schedules
-    # For now, return empty string if no conflict
-    return ""
+    days_mask = days_to_mask(days_of_week)
+    entries = await load_overlapping_entries(db, agency_id, start_time, end_time, days_mask, exclude_schedule_id)
+
+    # Existing schedules have positive ids, so 0 stands for a new one
+    candidate_id = exclude_schedule_id or 0
+    candidate = conflict_entry(candidate_id, content_id, priority, start_time, end_time, days_mask)
+
+    conflicts = candidate_conflicts(entries, candidate)
+    return describe_conflicts(candidate_id, conflicts) if conflicts else ""
 
 @router.get("/", response_model=List[ScheduleResponse])
 async def get_schedules(
     skip: int = 0,
     limit: int = 100,
     agency_id: int = None,
+    weekday: int = None,
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all schedules with optional agency filter"""
+    """Get all schedules with optional agency and weekday (Monday = 1) filters"""
     query = select(Schedule, Content.title.label("content_title"), Agency.name.label("agency_name")) \
         .join(Content, Schedule.content_id == Content.id) \
         .join(Agency, Schedule.agency_id == Agency.id)
@@ -44,6 +66,9 @@ async def get_schedules(
     if agency_id:
         query = query.where(Schedule.agency_id == agency_id)
 
+    if weekday:
+        query = query.where(Schedule.runs_on(weekday))
+
     result = await db.execute(query.offset(skip).limit(limit))
     schedules = result.all()
 
@@ -65,7 +90,7 @@ async def get_schedules(
         for schedule, content_title, agency_name in schedules
     ]
 
-@router.post("/", response_model=Schedule)
+@router.post("/", response_model=ScheduleSchema)
 async def create_schedule(
     schedule_data: ScheduleCreate,
     current_user: User = Depends(get_current_active_user),
@@ -96,12 +121,17 @@ async def create_schedule(
         )
 
     # Check for conflicts
-    conflict_message = check_schedule_conflict(
-        schedule_data.start_time,
-        schedule_data.end_time,
-        schedule_data.days_of_week,
-        schedule_data.agency_id
-    )
+    conflict_message = ""
+    if schedule_data.is_active:
+        conflict_message = await check_schedule_conflict(
+            db,
+            schedule_data.start_time,
+            schedule_data.end_time,
+            schedule_data.days_of_week,
+            schedule_data.agency_id,
+            schedule_data.content_id,
+            schedule_data.priority
+        )
 
     if conflict_message:
         raise HTTPException(
@@ -115,8 +145,29 @@ async def create_schedule(
     await db.commit()
     await db.refresh(db_schedule)
 
+    broker.publish(db_schedule.agency_id, "schedule", "created", db_schedule.id)
+
     return db_schedule
 
+@router.post("/bulk")
+async def bulk_import_schedules(
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Import many schedules from a JSON or CSV body, streaming back one result line per row"""
+    try:
+        rows = parse_import_body(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    results, summary = await import_schedules(db, rows)
+
+    return StreamingResponse(report_lines(results, summary), media_type="application/x-ndjson")
+
 @router.get("/{schedule_id}", response_model=ScheduleResponse)
 async def get_schedule(
     schedule_id: int,
@@ -154,7 +205,7 @@ async def get_schedule(
         agency_name=agency_name
     )
 
-@router.put("/{schedule_id}", response_model=Schedule)
+@router.put("/{schedule_id}", response_model=ScheduleSchema)
 async def update_schedule(
     schedule_id: int,
     schedule_update: ScheduleUpdate,
@@ -171,14 +222,44 @@ async def update_schedule(
             detail="Schedule not found"
         )
 
+    previous_agency_id = db_schedule.agency_id
+    changes = schedule_update.dict(exclude_unset=True)
+
+    # Check the schedule as it will be after the update
+    updated = {
+        field: changes.get(field, getattr(db_schedule, field))
+        for field in ("start_time", "end_time", "days_of_week", "agency_id", "content_id", "priority", "is_active")
+    }
+    if updated["is_active"]:
+        conflict_message = await check_schedule_conflict(
+            db,
+            updated["start_time"],
+            updated["end_time"],
+            updated["days_of_week"],
+            updated["agency_id"],
+            updated["content_id"],
+            updated["priority"],
+            exclude_schedule_id=schedule_id
+        )
+
+        if conflict_message:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=conflict_message
+            )
+
     # Update schedule fields
-    for field, value in schedule_update.dict(exclude_unset=True).items():
+    for field, value in changes.items():
         if hasattr(db_schedule, field):
             setattr(db_schedule, field, value)
 
     await db.commit()
     await db.refresh(db_schedule)
 
+    broker.publish(db_schedule.agency_id, "schedule", "updated", db_schedule.id)
+    if previous_agency_id != db_schedule.agency_id:
+        broker.publish(previous_agency_id, "schedule", "deleted", db_schedule.id)
+
     return db_schedule
 
 @router.delete("/{schedule_id}")
@@ -200,50 +281,119 @@ async def delete_schedule(
     await db.delete(db_schedule)
     await db.commit()
 
+    broker.publish(db_schedule.agency_id, "schedule", "deleted", schedule_id)
+
     return {"message": "Schedule deleted successfully"}
 
 @router.get("/agency/{agency_id}/current")
 async def get_current_schedule(
     agency_id: int,
-    current_user: User = Depends(get_current_active_user),
+    request: Request,
+    response: Response,
+    caller = Depends(authorize_agency_reader),
     db: AsyncSession = Depends(get_db)
 ):
     """Get current schedule for an agency based on current time and day"""
-    now = datetime.now()
-    current_time = now.time()
-    current_weekday = now.weekday() + 1  # Monday = 1, Sunday = 7
+    entry, _ = await schedule_index.lookup(db, agency_id, datetime.now())
 
-    # Get active schedules for this agency and day
-    result = await db.execute(
-        select(Schedule, Content.title.label("content_title"), Content.content_type, Content.url, Content.file_path)
-        .join(Content, Schedule.content_id == Content.id)
-        .where(
-            and_(
-                Schedule.agency_id == agency_id,
-                Schedule.is_active == True,
-                Schedule.start_time <= current_time,
-                Schedule.end_time >= current_time,
-                Schedule.days_of_week.contains(str(current_weekday))
-            )
+    # The answer only depends on the slot in effect and on the agency data
+    etag = agency_etag(agency_id, entry["schedule_id"] if entry else 0)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    if not entry:
+        return {"message": "No active schedule found for current time"}
+
+    # The index already holds the highest priority schedule
+    content = entry["content"]
+    return {
+        "schedule_id": entry["schedule_id"],
+        "content_id": content["id"],
+        "content_title": content["title"],
+        "content_type": content["content_type"],
+        "url": content["url"],
+        "file_path": content["file_path"],
+        "duration": content["duration"],
+        "start_time": entry["start_time"],
+        "end_time": entry["end_time"]
+    }
+
+@router.get("/agency/{agency_id}/manifest")
+async def get_agency_manifest(
+    agency_id: int,
+    request: Request,
+    response: Response,
+    caller = Depends(authorize_agency_reader),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the weekly playlist manifest resolved locally by the agency players"""
+    etag = agency_etag(agency_id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    agency_version = agency_versions.get(agency_id)
+    manifest = await build_agency_manifest(db, agency_id)
+
+    if not manifest:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Agency not found"
         )
-        .order_by(Schedule.priority.desc())
-    )
 
-    schedules = result.all()
+    manifest_versions.remember(agency_id, agency_version, manifest["version"])
+    set_etag(response, etag)
+    return manifest
 
-    if not schedules:
-        return {"message": "No active schedule found for current time"}
+@router.get("/agency/{agency_id}/manifest/version")
+async def get_agency_manifest_version(
+    agency_id: int,
+    request: Request,
+    response: Response,
+    caller = Depends(authorize_agency_reader),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the current manifest version so players only download it when it changed"""
+    etag = agency_etag(agency_id, "version")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    version = await agency_manifest_version(db, agency_id)
+
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Agency not found"
+        )
+
+    set_etag(response, etag)
+    return {"agency_id": agency_id, "version": version}
+
+@router.get("/agency/{agency_id}/validate")
+async def validate_agency_schedules(
+    agency_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Report overlaps, same-priority conflicts and uncovered gaps of the schedules of an agency"""
+    result = await db.execute(select(Agency).where(Agency.id == agency_id))
+    agency = result.scalar_one_or_none()
+
+    if not agency:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Agency not found"
+        )
+
+    entries = await load_conflict_entries(db, agency_id)
+    report = analyze(
+        entries,
+        operating_window(agency.hibernation_enabled, agency.hibernation_start, agency.hibernation_end)
+    )
 
-    # Return the highest priority schedule
-    schedule, content_title, content_type, url, file_path = schedules[0]
     return {
-        "schedule_id": schedule.id,
-        "content_id": schedule.content_id,
-        "content_title": content_title,
-        "content_type": content_type,
-        "url": url,
-        "file_path": file_path,
-        "duration": 30,  # Default duration, should come from content
-        "start_time": str(schedule.start_time),
-        "end_time": str(schedule.end_time)
+        "agency_id": agency_id,
+        "schedules_count": len(entries),
+        "conflicts_count": len(report["conflicts"]),
+        **report
     }
@@ -6,6 +6,7 @@ from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
+from app.core.auth_cache import auth_cache_stats, invalidate_user
 from app.core.database import get_db
 from app.core.security import get_current_admin_user, get_password_hash
 from app.models.user import User as UserModel
@@ -70,7 +71,7 @@ async def create_user(
         )
 
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     db_user = UserModel(
         username=user_data.username,
         email=user_data.email,
@@ -138,16 +139,20 @@ async def update_user(
             detail="User not found"
         )
 
+    previous_username = db_user.username
+
     # Update user fields
     for field, value in user_update.dict(exclude_unset=True).items():
         if field == "password" and value:
-            setattr(db_user, "hashed_password", get_password_hash(value))
+            setattr(db_user, "hashed_password", await get_password_hash(value))
         elif hasattr(db_user, field):
             setattr(db_user, field, value)
 
     await db.commit()
     await db.refresh(db_user)
 
+    invalidate_user(previous_username, db_user.username)
+
     return db_user
 
 @router.delete("/{user_id}")
@@ -176,4 +181,13 @@ async def delete_user(
     await db.delete(db_user)
     await db.commit()
 
+    invalidate_user(db_user.username)
+
     return {"message": "User deleted successfully"}
+
+@router.get("/auth-cache/stats")
+async def get_auth_cache_stats(
+    current_user: UserModel = Depends(get_current_admin_user)
+):
+    """Hit and miss counts of the authentication caches"""
+    return auth_cache_stats()
@@ -0,0 +1,87 @@
+"""
+In-process caches for request authentication
+
+Every protected route decodes the bearer token and loads its user. Both
+results are kept in small TTL-bounded LRU caches: decoded tokens until they
+expire (or TOKEN_CACHE_TTL), users for USER_CACHE_TTL or until the user
+routes invalidate them on update or deletion. The TTL bounds how long a
+change made outside the API (or by another process) can go unnoticed.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+TOKEN_CACHE_SIZE = 4096
+TOKEN_CACHE_TTL = 300  # seconds
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 60  # seconds
+
+class TTLCache:
+    """Least recently used cache whose entries also expire after a TTL"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached value of a key, or None when missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value, for at most the cache TTL"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Forget a key"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Forget everything"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit rate of the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+# Decoded JWT claims by token
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+# Detached User rows by username
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+def invalidate_user(*usernames: Optional[str]):
+    """Drop cached users after they were updated, deactivated or deleted"""
+    for username in usernames:
+        if username:
+            user_cache.invalidate(username)
+
+def auth_cache_stats() -> Dict[str, Dict]:
+    """Statistics of the authentication caches"""
+    return {"tokens": token_cache.stats(), "users": user_cache.stats()}
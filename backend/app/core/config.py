@@ -3,7 +3,7 @@ Configuration settings for the Digital Signage API
 """
 
 import os
-from typing import List
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 from pydantic import validator
 
@@ -31,9 +31,24 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # Password Hashing Configuration
+    BCRYPT_ROUNDS: int = 12  # cost factor of new hashes; existing hashes keep theirs
+    PASSWORD_HASH_WORKERS: int = 2  # bcrypt checks running at once
+    PASSWORD_HASH_QUEUE: int = 32  # checks allowed to wait for a worker
+    PASSWORD_HASH_QUEUE_TIMEOUT: float = 5.0  # seconds
+
+    # Device Key Configuration
+    DEVICE_KEYRING: Dict[str, str] = {}  # key id -> HMAC secret; derived from SECRET_KEY when empty
+    DEVICE_KEY_ID: str = ""  # keyring entry that signs new device keys
+
+    # Device Presence Configuration
+    DEVICE_OFFLINE_AFTER: int = 900  # seconds without a heartbeat before a device is offline (3 player status intervals)
+
     # File Upload Configuration
     UPLOAD_DIR: str = "./uploads"
+    UPLOAD_INCOMING_DIR: str = "./uploads-incoming"  # Unfinished uploads, never served; same filesystem as UPLOAD_DIR
     MAX_FILE_SIZE: int = 104857600  # 100MB
+    MAX_RESUMABLE_UPLOAD_SIZE: int = 10737418240  # 10GB, for uploads through /contents/{id}/uploads
 
     # CORS Origins
     CORS_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:3001"]
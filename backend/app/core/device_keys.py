@@ -0,0 +1,190 @@
+"""
+Device API keys
+
+Players authenticate with a long-lived key issued when the device is
+provisioned instead of a user JWT:
+
+    dk1.<device_id>.<serial>.<key_id>.<mac>
+
+where mac is the HMAC-SHA256 of "<device_id>.<serial>" under the keyring
+secret named key_id. Checking a key is an HMAC computation and a dictionary
+lookup, with no database access. Issuing a new key bumps the serial stored
+on the device, which revokes every older key of that device; revoking bumps
+it without handing out a key. The current serial and agency of every device
+are loaded at startup and updated by the device routes on every change.
+
+Secrets come from DEVICE_KEYRING ({"key_id": "secret"}); new keys are signed
+with DEVICE_KEY_ID. Keeping retired secrets in the keyring lets existing
+keys verify during a rotation. Without a keyring, a secret is derived from
+SECRET_KEY.
+"""
+
+import base64
+import hashlib
+import hmac
+from typing import Dict, Optional, Tuple, Union
+from fastapi import Depends, HTTPException, Request, WebSocket, status
+from starlette.requests import HTTPConnection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_db
+from app.core.security import get_current_active_user, get_current_user, oauth2_scheme
+from app.models.device import Device
+from app.models.user import User
+
+DEVICE_KEY_PREFIX = "dk1"
+DEVICE_AUTH_SCHEME = "device"
+
+class DeviceKeyring:
+    """HMAC secrets plus the current key serial and agency of every device"""
+
+    def __init__(self, secrets: Dict[str, str], active_key_id: str):
+        self.secrets = {key_id: secret.encode() for key_id, secret in secrets.items()}
+        self.active_key_id = active_key_id
+        self._devices: Dict[int, Tuple[int, int]] = {}
+
+    def sign(self, key_id: str, device_id: int, serial: int) -> str:
+        """MAC of a device key"""
+        mac = hmac.new(self.secrets[key_id], f"{device_id}.{serial}".encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(mac).rstrip(b"=").decode()
+
+    def issue(self, device_id: int, serial: int) -> str:
+        """Build the key of a device for the given serial"""
+        mac = self.sign(self.active_key_id, device_id, serial)
+        return f"{DEVICE_KEY_PREFIX}.{device_id}.{serial}.{self.active_key_id}.{mac}"
+
+    def verify(self, key: str) -> Optional[Tuple[int, int]]:
+        """Return (device_id, agency_id) of a valid, unrevoked key"""
+        # Header values may carry any latin-1 text; keys are plain ASCII
+        if not key.isascii():
+            return None
+        parts = key.split(".")
+        if len(parts) != 5 or parts[0] != DEVICE_KEY_PREFIX:
+            return None
+        _, device_id, serial, key_id, mac = parts
+        if not device_id.isdigit() or not serial.isdigit() or key_id not in self.secrets:
+            return None
+        if not hmac.compare_digest(mac, self.sign(key_id, int(device_id), int(serial))):
+            return None
+
+        current = self._devices.get(int(device_id))
+        # Serial 0 is never handed out
+        if current is None or current[0] != int(serial) or current[0] == 0:
+            return None
+        return int(device_id), current[1]
+
+    def track(self, device_id: int, serial: int, agency_id: int):
+        """Record the current serial and agency of a device"""
+        self._devices[device_id] = (serial or 0, agency_id)
+
+    def forget(self, device_id: int):
+        """Revoke every key of a deleted device"""
+        self._devices.pop(device_id, None)
+
+    async def load(self, db: AsyncSession):
+        """Load the serials and agencies of all devices (at startup)"""
+        result = await db.execute(select(Device.id, Device.key_serial, Device.agency_id))
+        self._devices = {device_id: (serial or 0, agency_id) for device_id, serial, agency_id in result.all()}
+
+def default_keyring_secrets() -> Dict[str, str]:
+    """Keyring secrets from the settings, or one derived from SECRET_KEY"""
+    if settings.DEVICE_KEYRING:
+        return settings.DEVICE_KEYRING
+    derived = hmac.new(settings.SECRET_KEY.encode(), b"device-keys", hashlib.sha256).hexdigest()
+    return {"k0": derived}
+
+device_keyring = DeviceKeyring(
+    default_keyring_secrets(),
+    settings.DEVICE_KEY_ID or next(iter(default_keyring_secrets()))
+)
+
+def device_credentials(request: HTTPConnection) -> Optional[str]:
+    """Key sent as "Authorization: Device <key>", if any"""
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == DEVICE_AUTH_SCHEME:
+        return credentials.strip()
+    return None
+
+def verify_device_request(request: Request) -> Optional[Tuple[int, int]]:
+    """Check the device key of a request, None when it has none"""
+    key = device_credentials(request)
+    if key is None:
+        return None
+
+    principal = device_keyring.verify(key)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or revoked device key",
+            headers={"WWW-Authenticate": "Device"},
+        )
+    return principal
+
+async def current_user_from_request(request: Request, db: AsyncSession) -> User:
+    """Resolve the user JWT of a request like get_current_active_user does"""
+    token = await oauth2_scheme(request)
+    user = await get_current_user(token, db)
+    return await get_current_active_user(user)
+
+async def authorize_device(
+    device_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+) -> Union[User, Tuple[int, int]]:
+    """Let a device act on itself with its key, or any active user"""
+    principal = verify_device_request(request)
+    if principal is None:
+        return await current_user_from_request(request, db)
+
+    if principal[0] != device_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Device key belongs to another device"
+        )
+    return principal
+
+async def authorize_agency_reader(
+    agency_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+) -> Union[User, Tuple[int, int]]:
+    """Let the devices of an agency read its playlists with their keys, or any active user"""
+    principal = verify_device_request(request)
+    if principal is None:
+        return await current_user_from_request(request, db)
+
+    if principal[1] != agency_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Device key belongs to another agency"
+        )
+    return principal
+
+async def authorize_agency_websocket(websocket: WebSocket, agency_id: int) -> bool:
+    """Check an events subscription like authorize_agency_reader does
+
+    Device keys are long-lived and only accepted in the headers, never in a
+    URL that proxies and access logs keep. Browsers cannot set headers on a
+    WebSocket, so a user JWT, which expires, may come as the token query
+    parameter.
+    """
+    key = device_credentials(websocket)
+    if key:
+        principal = device_keyring.verify(key)
+        return principal is not None and principal[1] == agency_id
+
+    scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        token = websocket.query_params.get("token", "")
+    if not token:
+        return False
+
+    # A session only for the check, not held for the life of the connection
+    async with AsyncSessionLocal() as db:
+        try:
+            user = await get_current_user(token.strip(), db)
+            await get_current_active_user(user)
+        except HTTPException:
+            return False
+    return True
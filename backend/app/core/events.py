@@ -0,0 +1,76 @@
+"""
+In-process change events for agencies
+
+Writes to schedules, contents and agency settings publish a change event for
+the agency. Devices subscribed through the push endpoint receive it as a
+signal to resync, and in-process listeners (caches, indexes) use it to
+invalidate their data for that agency.
+
+Events live in this process only, so the API must run as a single worker
+for every device to see every change.
+"""
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+# Events are only resync signals, so a slow device just needs the latest few
+SUBSCRIBER_QUEUE_SIZE = 16
+
+class AgencyEventBroker:
+    """Publish/subscribe of change events keyed by agency"""
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._listeners: List[Callable[[Dict], None]] = []
+
+    def add_listener(self, listener: Callable[[Dict], None]):
+        """Register a function called synchronously for every published event"""
+        self._listeners.append(listener)
+
+    def subscribe(self, agency_id: int) -> asyncio.Queue:
+        """Open a queue that receives the events of an agency"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[agency_id].add(queue)
+        return queue
+
+    def unsubscribe(self, agency_id: int, queue: asyncio.Queue):
+        """Close a subscription"""
+        subscribers = self._subscribers.get(agency_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[agency_id]
+
+    def subscriber_count(self, agency_id: Optional[int] = None) -> int:
+        """Number of open subscriptions, for one agency or in total"""
+        if agency_id is not None:
+            return len(self._subscribers.get(agency_id, ()))
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, agency_id: int, entity: str, action: str, entity_id: Optional[int] = None):
+        """Publish a change of an agency entity ("schedule", "content" or "agency")"""
+        if agency_id is None:
+            return
+
+        event = {
+            "type": "changed",
+            "agency_id": agency_id,
+            "entity": entity,
+            "action": action,
+            "entity_id": entity_id,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+
+        for listener in self._listeners:
+            listener(event)
+
+        for queue in self._subscribers.get(agency_id, ()):
+            if queue.full():
+                # Drop the oldest signal; the device resyncs everything anyway
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+# Broker shared by the whole application
+broker = AgencyEventBroker()
@@ -0,0 +1,75 @@
+"""
+Conditional GET support for device-facing endpoints
+
+Every agency has a version counter that is bumped by the change events of
+app.core.events. ETags are built from that counter, so a route can answer
+304 Not Modified before loading or serialising anything that did not change.
+The process start time is part of every ETag because the counters restart
+from zero with the process.
+"""
+
+import time
+from collections import defaultdict
+from typing import Dict
+from fastapi import Request, Response, status
+from app.core.events import broker
+
+PROCESS_EPOCH = format(int(time.time()), "x")
+
+class AgencyVersions:
+    """Per-agency version counters bumped on every change event"""
+
+    def __init__(self):
+        self._versions: Dict[int, int] = defaultdict(int)
+        # Bumped by schedule events of any agency, which can reference contents of others
+        self.schedules = 0
+
+    def get(self, agency_id: int) -> int:
+        """Current version of an agency"""
+        return self._versions.get(agency_id, 0)
+
+    def bump(self, agency_id: int):
+        """Mark the data of an agency as changed"""
+        self._versions[agency_id] += 1
+
+    def on_event(self, event: Dict):
+        """Broker listener"""
+        self.bump(event["agency_id"])
+        if event["entity"] == "schedule":
+            self.schedules += 1
+
+agency_versions = AgencyVersions()
+broker.add_listener(agency_versions.on_event)
+
+def agency_etag(agency_id: int, *parts) -> str:
+    """Build a strong ETag for a resource of an agency"""
+    tag = f"{PROCESS_EPOCH}-{agency_id}-{agency_versions.get(agency_id)}"
+    for part in parts:
+        tag += f"-{part}"
+    return f'"{tag}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the If-None-Match header of a request against an ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def set_etag(response: Response, etag: str):
+    """Attach the validator, asking clients to revalidate before reusing the body"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+def not_modified(etag: str) -> Response:
+    """Build an empty 304 answer"""
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_etag(response, etag)
+    return response
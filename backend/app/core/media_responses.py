@@ -0,0 +1,256 @@
+"""
+Resumable delivery of media files
+
+Media files are served with strong ETags derived from their SHA-256 and
+support Range requests: a single range is answered with 206 Partial Content,
+several ranges with a multipart/byteranges body, and If-Range makes a client
+resuming a download receive the whole file again if it changed since the
+first part. Players on slow branch links can resume an interrupted video
+download where it stopped instead of starting over.
+
+Blobs are named after their hash alone; their Content-Type is the media type
+recorded on the row that references them, or sniffed from their first bytes
+when they are served from the static mount.
+"""
+
+import hashlib
+import mimetypes
+import os
+import uuid
+from email.utils import formatdate
+from typing import Dict, List, Optional, Tuple
+import anyio
+from fastapi import Request, Response, status
+from fastapi.staticfiles import StaticFiles
+from app.core.http_cache import etag_matches
+from app.core.media_types import SHA256_NAME, blob_media_type
+
+MEDIA_CHUNK_SIZE = 256 * 1024
+
+# More ranges than this are answered with the whole file
+MAX_RANGES = 16
+
+# SHA-256 ETags of files that are not content-addressed, by path
+_file_etags: Dict[str, Tuple[int, int, str]] = {}
+
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a Range header into sorted, coalesced inclusive byte ranges
+
+    Returns None when the header must be ignored (unknown unit, bad syntax
+    or too many ranges) and an empty list when no range is satisfiable.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        first, dash, last = spec.strip().partition("-")
+        if not dash or not (first.isdigit() or last.isdigit()) or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+        ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    coalesced: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if coalesced and start <= coalesced[-1][1] + 1:
+            coalesced[-1] = (coalesced[-1][0], max(coalesced[-1][1], end))
+        else:
+            coalesced.append((start, end))
+    return coalesced
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def file_etag(path: str, stat_result: os.stat_result) -> str:
+    """Strong ETag of a file: its SHA-256, from the name of blobs or hashed once"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if SHA256_NAME.match(name):
+        return f'"{name}"'
+
+    cached = _file_etags.get(path)
+    if cached and cached[:2] == (stat_result.st_mtime_ns, stat_result.st_size):
+        return cached[2]
+
+    etag = f'"{await anyio.to_thread.run_sync(hash_file, path)}"'
+    _file_etags[path] = (stat_result.st_mtime_ns, stat_result.st_size, etag)
+    return etag
+
+class MediaResponse(Response):
+    """File response with strong ETags, conditional requests and byte ranges"""
+
+    def __init__(
+        self,
+        path: str,
+        etag: Optional[str] = None,
+        media_type: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stat_result: Optional[os.stat_result] = None
+    ):
+        self.path = path
+        self.etag = etag
+        # Blobs have no extension to guess from, their type is sniffed when served
+        self.media_type = media_type or mimetypes.guess_type(path)[0]
+        self.stat_result = stat_result
+        self.status_code = status.HTTP_200_OK
+        self.background = None
+        self.body = b""
+        self.raw_headers = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in (headers or {}).items()
+        ]
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope)
+        stat_result = self.stat_result or await anyio.Path(self.path).stat()
+        size = stat_result.st_size
+        etag = self.etag or await file_etag(self.path, stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+
+        headers = list(self.raw_headers) + [
+            (b"accept-ranges", b"bytes"),
+            (b"etag", etag.encode("latin-1")),
+            (b"last-modified", last_modified.encode("latin-1"))
+        ]
+
+        if etag_matches(request, etag):
+            await self.send_head(send, status.HTTP_304_NOT_MODIFIED, headers)
+            return
+
+        if not self.media_type:
+            self.media_type = await anyio.to_thread.run_sync(blob_media_type, self.path)
+
+        ranges = None
+        range_header = request.headers.get("range")
+        if range_header and request.method in ("GET", "HEAD") and self.if_range_allows(request, etag, last_modified):
+            ranges = parse_range(range_header, size)
+
+        if ranges == []:
+            headers.append((b"content-range", f"bytes */{size}".encode("latin-1")))
+            await self.send_head(send, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers + [(b"content-length", b"0")])
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if not ranges:
+            parts = [(None, 0, size - 1)]
+            status_code = status.HTTP_200_OK
+            headers += [(b"content-type", self.content_type_header()), (b"content-length", str(size).encode("latin-1"))]
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            parts = [(None, start, end)]
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers += [
+                (b"content-type", self.content_type_header()),
+                (b"content-range", f"bytes {start}-{end}/{size}".encode("latin-1")),
+                (b"content-length", str(end - start + 1).encode("latin-1"))
+            ]
+        else:
+            boundary = uuid.uuid4().hex
+            parts = [
+                (
+                    (
+                        f"--{boundary}\r\n"
+                        f"Content-Type: {self.media_type}\r\n"
+                        f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                    ).encode("latin-1"),
+                    start,
+                    end
+                )
+                for start, end in ranges
+            ]
+            closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+            length = sum(len(head) + end - start + 1 for head, start, end in parts)
+            # Every part after the first is preceded by a line break
+            length += 2 * (len(parts) - 1) + len(closing)
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers += [
+                (b"content-type", f"multipart/byteranges; boundary={boundary}".encode("latin-1")),
+                (b"content-length", str(length).encode("latin-1"))
+            ]
+
+        await self.send_head(send, status_code, headers)
+
+        if request.method == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+        else:
+            async with await anyio.open_file(self.path, "rb") as f:
+                for position, (head, start, end) in enumerate(parts):
+                    if head:
+                        prefix = b"\r\n" + head if position else head
+                        await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                    await f.seek(start)
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        chunk = await f.read(min(MEDIA_CHUNK_SIZE, remaining))
+                        if not chunk:
+                            break
+                        remaining -= len(chunk)
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            closing_body = closing if len(parts) > 1 else b""
+            await send({"type": "http.response.body", "body": closing_body})
+
+        if self.background is not None:
+            await self.background()
+
+    def content_type_header(self) -> bytes:
+        """Content-Type of the whole file"""
+        if self.media_type.startswith("text/"):
+            return f"{self.media_type}; charset=utf-8".encode("latin-1")
+        return self.media_type.encode("latin-1")
+
+    @staticmethod
+    def if_range_allows(request: Request, etag: str, last_modified: str) -> bool:
+        """Check that the file a client resumes is still the one it started"""
+        if_range = request.headers.get("if-range")
+        if not if_range:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"'):
+            # Strong comparison only: weak validators never allow a range
+            return if_range == etag
+        return if_range == last_modified
+
+    @staticmethod
+    async def send_head(send, status_code: int, headers: List[Tuple[bytes, bytes]]):
+        """Send the status line and headers"""
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        if status_code == status.HTTP_304_NOT_MODIFIED:
+            await send({"type": "http.response.body", "body": b""})
+
+class MediaStaticFiles(StaticFiles):
+    """Static files served through MediaResponse"""
+
+    cache_control: Optional[str] = None
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = status.HTTP_200_OK) -> Response:
+        if status_code != status.HTTP_200_OK:
+            # HTML mode error pages
+            return super().file_response(full_path, stat_result, scope, status_code)
+        headers = {"Cache-Control": self.cache_control} if self.cache_control else None
+        return MediaResponse(str(full_path), headers=headers, stat_result=stat_result)
+
+class ImmutableStaticFiles(MediaStaticFiles):
+    """Static files whose URL changes whenever their bytes do, cacheable forever"""
+
+    cache_control = "public, max-age=31536000, immutable"
@@ -0,0 +1,71 @@
+"""
+Media types of uploaded files
+
+Blobs are named after their SHA-256 alone, so their media type cannot be
+guessed from the file name. It is sniffed from the magic bytes when a file
+is uploaded and kept on the row that references the blob; blobs served
+straight from the static mount are sniffed once and remembered.
+"""
+
+import os
+import re
+from typing import Dict, Optional
+
+# Longest prefix needed by sniff_media_type
+SNIFF_SIZE = 16
+
+SHA256_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+# Sniffed media types of blobs, by name
+_blob_media_types: Dict[str, str] = {}
+
+def sniff_media_type(head: bytes) -> Optional[str]:
+    """MIME type of an image or video told by its magic bytes"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith((b"II*\x00", b"MM\x00*")):
+        return "image/tiff"
+    if head.startswith(b"\x00\x00\x01\x00"):
+        return "image/vnd.microsoft.icon"
+    if head.startswith((b"<svg", b"<?xml")):
+        # SVG logos
+        return "image/svg+xml"
+    if head[4:8] == b"ftyp":
+        # ISO base media: MP4, MOV, M4V and the HEIF/AVIF still images
+        brand = head[8:12]
+        if brand in (b"heic", b"heix", b"mif1"):
+            return "image/heic"
+        if brand == b"avif":
+            return "image/avif"
+        return "video/quicktime" if brand == b"qt  " else "video/mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        # Matroska and WebM share the EBML header
+        return "video/webm"
+    if head.startswith((b"\x00\x00\x01\xba", b"\x00\x00\x01\xb3")):
+        return "video/mpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "video/x-msvideo"
+    return None
+
+def media_kind(media_type: Optional[str]) -> Optional[str]:
+    """"image" or "video" part of a sniffed media type"""
+    return media_type.split("/")[0] if media_type else None
+
+def blob_media_type(path: str) -> str:
+    """Media type of a file named without an extension, sniffed once per blob"""
+    name = os.path.basename(path)
+    media_type = _blob_media_types.get(name)
+    if media_type is None:
+        with open(path, "rb") as f:
+            media_type = sniff_media_type(f.read(SNIFF_SIZE)) or "application/octet-stream"
+        if SHA256_NAME.match(name):
+            _blob_media_types[name] = media_type
+    return media_type
@@ -0,0 +1,75 @@
+"""
+In-place upgrades of existing databases
+
+Tables are created with create_all, which never alters a table that already
+exists. The steps below bring databases created by older versions up to the
+current models; each one checks the live schema first, so running them on
+every startup is safe.
+"""
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from app.models.agency import Agency
+from app.models.content import Content
+from app.models.schedule import Schedule, days_to_mask
+
+def add_content_checksum(connection: Connection):
+    """Add the checksum column of uploaded contents"""
+    columns = {column["name"] for column in inspect(connection).get_columns("contents")}
+    if "checksum" not in columns:
+        connection.execute(text("ALTER TABLE contents ADD COLUMN checksum VARCHAR(64)"))
+
+def convert_schedule_days(connection: Connection):
+    """Replace the "1,2,3,4,5" days_of_week strings with the days_mask bitmask"""
+    columns = {column["name"] for column in inspect(connection).get_columns("schedules")}
+
+    if "days_mask" not in columns:
+        connection.execute(text("ALTER TABLE schedules ADD COLUMN days_mask INTEGER NOT NULL DEFAULT 0"))
+
+    if "days_of_week" in columns:
+        rows = connection.execute(text("SELECT id, days_of_week FROM schedules")).all()
+        if rows:
+            connection.execute(
+                text("UPDATE schedules SET days_mask = :days_mask WHERE id = :id"),
+                [{"id": row.id, "days_mask": days_to_mask(row.days_of_week or "")} for row in rows]
+            )
+        connection.execute(text("ALTER TABLE schedules DROP COLUMN days_of_week"))
+
+    for index in Schedule.__table__.indexes:
+        index.create(bind=connection, checkfirst=True)
+
+def index_media_references(connection: Connection):
+    """Index the columns the media store counts blob references on"""
+    for table in (Content.__table__, Agency.__table__):
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+def add_media_types(connection: Connection):
+    """Add the MIME types of uploaded files, which blob names do not carry"""
+    for table, name in (("contents", "media_type"), ("agencies", "logo_media_type")):
+        columns = {column["name"] for column in inspect(connection).get_columns(table)}
+        if name not in columns:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} VARCHAR(100)"))
+
+def add_device_key_serial(connection: Connection):
+    """Add the serial of the current device API key"""
+    columns = {column["name"] for column in inspect(connection).get_columns("devices")}
+    if "key_serial" not in columns:
+        connection.execute(text("ALTER TABLE devices ADD COLUMN key_serial INTEGER NOT NULL DEFAULT 0"))
+
+def add_agency_counters(connection: Connection):
+    """Add the user, device and content counter caches of agencies"""
+    columns = {column["name"] for column in inspect(connection).get_columns("agencies")}
+    for column in ("users_count", "devices_count", "contents_count"):
+        if column not in columns:
+            # Filled in by the counter repair that runs at startup
+            connection.execute(text(f"ALTER TABLE agencies ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"))
+
+def upgrade_schema(connection: Connection):
+    """Run every upgrade step (called after create_all)"""
+    add_content_checksum(connection)
+    convert_schedule_days(connection)
+    index_media_references(connection)
+    add_media_types(connection)
+    add_device_key_serial(connection)
+    add_agency_counters(connection)
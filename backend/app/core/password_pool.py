@@ -0,0 +1,54 @@
+"""
+Bounded worker pool for password hashing
+
+bcrypt is slow on purpose, and running it inside an async route blocks the
+event loop for the whole check, stalling every other request. Hashes and
+verifications run in a small thread pool instead (the bcrypt library
+releases the GIL while hashing). At most PASSWORD_HASH_WORKERS checks run
+at once and PASSWORD_HASH_QUEUE more may wait; beyond that, or after
+waiting PASSWORD_HASH_QUEUE_TIMEOUT seconds, callers are turned away with
+PasswordPoolBusy so a login storm cannot pile up unbounded work.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from app.core.config import settings
+
+class PasswordPoolBusy(Exception):
+    """Too many password checks are already running or waiting"""
+
+class PasswordPool:
+    """Thread pool with a bounded admission queue"""
+
+    def __init__(self, workers: int, queue_size: int, queue_timeout: float):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = asyncio.Semaphore(workers + queue_size)
+        self._running = asyncio.Semaphore(workers)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) in the pool once a slot is free"""
+        if self._slots.locked():
+            raise PasswordPoolBusy()
+
+        async with self._slots:
+            try:
+                await asyncio.wait_for(self._running.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise PasswordPoolBusy()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            finally:
+                self._running.release()
+
+    def shutdown(self):
+        """Stop the worker threads"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+password_pool = PasswordPool(
+    settings.PASSWORD_HASH_WORKERS,
+    settings.PASSWORD_HASH_QUEUE,
+    settings.PASSWORD_HASH_QUEUE_TIMEOUT
+)
@@ -2,6 +2,7 @@
 Security utilities for JWT authentication
 """
 
+import time
 from datetime import datetime, timedelta
 from typing import Any, Union
 from jose import jwt
@@ -9,24 +10,38 @@ from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.core.auth_cache import token_cache, user_cache
 from app.core.config import settings
 from app.core.database import get_db
+from app.core.password_pool import PasswordPoolBusy, password_pool
 from app.models.user import User
 from app.schemas.user import UserResponse
 
 # Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+async def run_password_job(fn, *args):
+    """Run a bcrypt job in the password pool, answering 503 when it is saturated"""
+    try:
+        return await password_pool.run(fn, *args)
+    except PasswordPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password checks in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash, off the event loop"""
+    return await run_password_job(pwd_context.verify, plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    """Hash a password"""
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    """Hash a password, off the event loop"""
+    return await run_password_job(pwd_context.hash, password)
 
 def create_access_token(subject: Union[str, Any], expires_delta: timedelta = None) -> str:
     """Create JWT access token"""
@@ -41,15 +56,49 @@ def create_access_token(subject: Union[str, Any], expires_delta: timedelta = Non
 
 async def authenticate_user(db: AsyncSession, username: str, password: str) -> Union[User, None]:
     """Authenticate a user"""
-    result = await db.execute(User.__table__.select().where(User.username == username))
+    result = await db.execute(select(User).where(User.username == username))
     user = result.scalar_one_or_none()
 
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return None
     return user
 
+def decode_token(token: str) -> Union[dict, None]:
+    """Decode and verify a JWT, reusing the claims of recently seen tokens"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except jwt.JWTError:
+        return None
+
+    # Never keep claims past the expiry of the token
+    expires = payload.get("exp")
+    ttl = expires - time.time() if isinstance(expires, (int, float)) else None
+    token_cache.put(token, payload, ttl)
+    return payload
+
+async def load_user(db: AsyncSession, username: str) -> Union[User, None]:
+    """Load a user by username, from the user cache when possible
+
+    The cache holds detached rows; each request gets its own copy attached
+    to its session without a query, so routes can still modify and commit it.
+    """
+    user = user_cache.get(username)
+    if user is None:
+        result = await db.execute(select(User).where(User.username == username))
+        user = result.scalar_one_or_none()
+        if user is None:
+            return None
+        db.expunge(user)
+        user_cache.put(username, user)
+
+    return await db.merge(user, load=False)
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_db)
@@ -61,16 +110,12 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except jwt.JWTError:
+    payload = decode_token(token)
+    username: str = payload.get("sub") if payload else None
+    if username is None:
         raise credentials_exception
 
-    result = await db.execute(User.__table__.select().where(User.username == username))
-    user = result.scalar_one_or_none()
+    user = await load_user(db, username)
 
     if user is None:
         raise credentials_exception
@@ -84,18 +129,13 @@ async def get_current_user_optional(
     if not token:
         return None
 
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-
-        result = await db.execute(User.__table__.select().where(User.username == username))
-        user = result.scalar_one_or_none()
-        return user
-    except jwt.JWTError:
+    payload = decode_token(token)
+    username: str = payload.get("sub") if payload else None
+    if username is None:
         return None
 
+    return await load_user(db, username)
+
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     """Get current active user"""
     if not current_user.is_active:
@@ -5,16 +5,28 @@ API REST principal construída com FastAPI
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse
+import asyncio
+import os
+import re
 import structlog
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from app.core.config import settings
-from app.core.database import engine
+from app.core.database import AsyncSessionLocal, engine
+from app.core.device_keys import device_keyring
+from app.core.migrations import upgrade_schema
 from app.models import base
 from app.api.v1.api import api_router
 from app.core.security import get_current_user_optional
+from app.core.media_responses import ImmutableStaticFiles, MediaStaticFiles
+from app.core.password_pool import password_pool
+from app.services.agency_counters import run_counter_repair
+from app.services.heartbeats import heartbeat_buffer
+from app.services.media_store import media_store
+from app.services.presence import presence_tracker
+from app.services.resumable_uploads import upload_sessions
+from app.services.uploads import MULTIPART_OVERHEAD
 
 # Configure structured logging
 logger = structlog.get_logger()
@@ -25,12 +37,36 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Digital Signage API", version="1.0.0")
 
-    # Create database tables
+    # Create database tables and upgrade the ones created by older versions
     async with engine.begin() as conn:
         await conn.run_sync(base.Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+    # Device keys and presence are kept in memory from the rows loaded here
+    async with AsyncSessionLocal() as db:
+        await device_keyring.load(db)
+        await presence_tracker.load(db)
+
+    upload_gc = asyncio.create_task(upload_sessions.run_garbage_collector())
+    heartbeat_flusher = asyncio.create_task(heartbeat_buffer.run_flusher())
+    presence_sweeper = asyncio.create_task(presence_tracker.run_sweeper())
+    counter_repair = asyncio.create_task(run_counter_repair())
 
     yield
 
+    upload_gc.cancel()
+    counter_repair.cancel()
+    presence_sweeper.cancel()
+    heartbeat_flusher.cancel()
+    with suppress(asyncio.CancelledError):
+        await heartbeat_flusher
+    # Write the status changes still buffered
+    try:
+        await heartbeat_buffer.flush()
+    except Exception as e:
+        logger.error("Error writing device status changes on shutdown", error=str(e))
+    password_pool.shutdown()
+
     # Shutdown
     logger.info("Shutting down Digital Signage API")
 
@@ -52,10 +88,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the admin panel read the state of resumable uploads
+    expose_headers=["Location", "Tus-Resumable", "Upload-Offset", "Upload-Length", "Upload-Expires"],
 )
 
-# Mount static files
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Multipart upload routes, limited to MAX_FILE_SIZE
+UPLOAD_PATHS = re.compile(
+    rf"^{re.escape(settings.API_V1_STR)}/(contents/\d+/upload|agencies/\d+/upload-logo)/?$"
+)
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse uploads announced larger than the limit before reading their body"""
+    content_length = request.headers.get("content-length", "")
+    if (
+        request.method == "POST"
+        and UPLOAD_PATHS.match(request.url.path)
+        and content_length.isdigit()
+        and int(content_length) > settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD
+    ):
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"File exceeds the maximum size of {settings.MAX_FILE_SIZE} bytes"}
+        )
+    return await call_next(request)
+
+# Mount static files; content-addressed blobs first, they never change
+os.makedirs(media_store.root, exist_ok=True)
+os.makedirs(media_store.incoming, exist_ok=True)
+app.mount("/uploads/blobs", ImmutableStaticFiles(directory=media_store.root), name="blobs")
+app.mount("/uploads", MediaStaticFiles(directory="uploads"), name="uploads")
 
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
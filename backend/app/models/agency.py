@@ -2,7 +2,7 @@
 Agency model for managing different Sicoob branches
 """
 
-from sqlalchemy import Column, String, Text, Enum
+from sqlalchemy import Column, Integer, Boolean, String, Text, Enum
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 
@@ -18,13 +18,19 @@ class Agency(Base):
     state = Column(String(2), nullable=True)  # State abbreviation (e.g., "SP", "RJ")
     phone = Column(String(20), nullable=True)
     email = Column(String(100), nullable=True)
-    logo_url = Column(String(255), nullable=True)  # Path to agency logo
+    logo_url = Column(String(255), nullable=True, index=True)  # Path to agency logo
+    logo_media_type = Column(String(100), nullable=True)  # MIME type of the logo
     raspberry_pi_ip = Column(String(45), nullable=True)  # IP address of Raspberry Pi
     orientation = Column(Enum("horizontal", "vertical", name="screen_orientations"), default="horizontal")
     hibernation_enabled = Column(Boolean, default=True)
     hibernation_start = Column(String(5), default="18:00")  # HH:MM format
     hibernation_end = Column(String(5), default="08:00")    # HH:MM format
 
+    # Counter caches, kept by app.services.agency_counters
+    users_count = Column(Integer, nullable=False, default=0)
+    devices_count = Column(Integer, nullable=False, default=0)
+    contents_count = Column(Integer, nullable=False, default=0)
+
     # Relationships
     users = relationship("User", back_populates="agency")
     devices = relationship("Device", back_populates="agency")
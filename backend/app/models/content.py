@@ -2,7 +2,7 @@
 Content model for managing digital signage content
 """
 
-from sqlalchemy import Column, String, Text, Enum, DateTime
+from sqlalchemy import Column, Integer, Boolean, String, Text, Enum, DateTime
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 
@@ -15,7 +15,9 @@ class Content(Base):
     description = Column(Text, nullable=True)
     content_type = Column(Enum("link", "image", "video", name="content_types"), nullable=False)
     url = Column(String(500), nullable=True)  # For links and media files
-    file_path = Column(String(255), nullable=True)  # Local file path for uploaded content
+    file_path = Column(String(255), nullable=True, index=True)  # Local file path for uploaded content
+    checksum = Column(String(64), nullable=True)  # SHA-256 of the uploaded file
+    media_type = Column(String(100), nullable=True)  # MIME type of the uploaded file
     duration = Column(Integer, default=30)  # Duration in seconds (for videos and images)
     is_active = Column(Boolean, default=True)
     agency_id = Column(Integer, nullable=False)  # Foreign key to agencies table
@@ -2,7 +2,7 @@
 Device model for managing Raspberry Pi devices
 """
 
-from sqlalchemy import Column, String, Text, Enum, DateTime
+from sqlalchemy import Column, Integer, String, Text, Enum, DateTime
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 
@@ -19,6 +19,7 @@ class Device(Base):
     last_seen = Column(DateTime(timezone=True), nullable=True)
     version = Column(String(20), default="1.0.0")
     notes = Column(Text, nullable=True)
+    key_serial = Column(Integer, nullable=False, default=0)  # Serial of the current device key, 0 when none was issued
 
     # Relationships
     agency = relationship("Agency", back_populates="devices")
@@ -2,10 +2,28 @@
 Schedule model for managing content display schedules
 """
 
-from sqlalchemy import Column, String, Boolean, DateTime, Time
+from typing import List
+from sqlalchemy import Column, Integer, Boolean, DateTime, Time, Index
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 
+def weekday_bit(weekday: int) -> int:
+    """Bit of a weekday (Monday = 1, Sunday = 7) in a days mask"""
+    return 1 << (weekday - 1)
+
+def days_to_mask(days_of_week: str) -> int:
+    """Convert a "1,2,3,4,5" string into a days mask"""
+    mask = 0
+    for day in days_of_week.split(","):
+        day = day.strip()
+        if day.isdigit() and 1 <= int(day) <= 7:
+            mask |= weekday_bit(int(day))
+    return mask
+
+def mask_to_days(mask: int) -> List[int]:
+    """Convert a days mask into a sorted list of weekdays (Monday = 1)"""
+    return [weekday for weekday in range(1, 8) if mask & weekday_bit(weekday)]
+
 class Schedule(Base):
     """Schedule model"""
 
@@ -15,7 +33,7 @@ class Schedule(Base):
     agency_id = Column(Integer, nullable=False)   # Foreign key to agencies table
     start_time = Column(Time, nullable=False)     # HH:MM format
     end_time = Column(Time, nullable=False)       # HH:MM format
-    days_of_week = Column(String(20), nullable=False)  # e.g., "1,2,3,4,5" for Mon-Fri
+    days_mask = Column(Integer, nullable=False, default=0)  # bit 0 = Monday ... bit 6 = Sunday
     is_active = Column(Boolean, default=True)
     priority = Column(Integer, default=1)         # Higher number = higher priority
 
@@ -23,5 +41,24 @@ class Schedule(Base):
     agency = relationship("Agency", back_populates="schedules")
     content = relationship("Content", back_populates="schedules")
 
+    __table_args__ = (
+        # Serves "active schedules of an agency on a weekday at a time" lookups
+        Index("ix_schedules_agency_active_days_time", "agency_id", "is_active", "days_mask", "start_time", "end_time"),
+    )
+
+    @property
+    def days_of_week(self) -> str:
+        """Days as a "1,2,3,4,5" string, as used by the API"""
+        return ",".join(str(day) for day in mask_to_days(self.days_mask or 0))
+
+    @days_of_week.setter
+    def days_of_week(self, value: str):
+        self.days_mask = days_to_mask(value)
+
+    @classmethod
+    def runs_on(cls, weekday: int):
+        """SQL condition matching schedules that run on a weekday"""
+        return cls.days_mask.op("&")(weekday_bit(weekday)) != 0
+
     def __repr__(self):
         return f"<Schedule(id={self.id}, content_id={self.content_id}, days={self.days_of_week})>"
@@ -2,7 +2,7 @@
 User model for authentication and authorization
 """
 
-from sqlalchemy import Column, String, Boolean, Enum
+from sqlalchemy import Column, Integer, String, Boolean, Enum
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 
@@ -41,6 +41,8 @@ class ContentUpdate(BaseModel):
 class ContentInDBBase(ContentBase):
     """Base schema for content in database"""
     id: int
+    checksum: Optional[str] = None
+    media_type: Optional[str] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
@@ -0,0 +1,118 @@
+"""
+Counter caches of the users, devices and contents of each agency
+
+The agency routes used to count these with one query outer-joining the
+three tables, which multiplies the rows of each agency (users × devices ×
+contents) and inflated every count. The counts are now columns of the
+agencies table, adjusted in the same transaction as the rows they count:
+a before_flush hook turns every insert, delete or agency change of a user,
+device or content into an increment on the agencies involved. Bulk
+statements and writes from outside the API bypass the hook, so a repair job
+recomputes the counts at startup and every AGENCY_RECOUNT_INTERVAL (or on
+demand through POST /agencies/recount) and reports how many agencies drifted.
+"""
+
+import asyncio
+from collections import Counter
+from typing import Optional
+import structlog
+from sqlalchemy import event, func, inspect, or_, select, update
+from sqlalchemy.orm import Session
+from app.core.database import AsyncSessionLocal
+from app.models.agency import Agency
+from app.models.content import Content
+from app.models.device import Device
+from app.models.user import User
+
+logger = structlog.get_logger()
+
+AGENCY_RECOUNT_INTERVAL = 6 * 60 * 60  # seconds
+
+# Counted model -> counter column of its agency
+AGENCY_COUNTERS = {
+    User: "users_count",
+    Device: "devices_count",
+    Content: "contents_count",
+}
+
+def original_agency_id(instance) -> Optional[int]:
+    """Agency a loaded row belonged to before the pending changes"""
+    history = inspect(instance).attrs.agency_id.history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return None
+
+@event.listens_for(Session, "before_flush")
+def adjust_agency_counters(session: Session, flush_context, instances):
+    """Turn the pending inserts, deletes and moves into counter increments"""
+    deltas = Counter()
+
+    for instance in session.new:
+        column = AGENCY_COUNTERS.get(type(instance))
+        if column and instance.agency_id is not None:
+            deltas[instance.agency_id, column] += 1
+
+    for instance in session.deleted:
+        column = AGENCY_COUNTERS.get(type(instance))
+        if column:
+            agency_id = original_agency_id(instance)
+            if agency_id is not None:
+                deltas[agency_id, column] -= 1
+
+    for instance in session.dirty:
+        column = AGENCY_COUNTERS.get(type(instance))
+        if column and inspect(instance).attrs.agency_id.history.has_changes():
+            previous = original_agency_id(instance)
+            if previous != instance.agency_id:
+                if previous is not None:
+                    deltas[previous, column] -= 1
+                if instance.agency_id is not None:
+                    deltas[instance.agency_id, column] += 1
+
+    agencies = Agency.__table__
+    for (agency_id, column), delta in deltas.items():
+        if delta:
+            session.connection().execute(
+                update(agencies)
+                .where(agencies.c.id == agency_id)
+                # Keep updated_at for real edits of the agency (it has an onupdate)
+                .values({column: agencies.c[column] + delta, "updated_at": agencies.c.updated_at})
+            )
+
+def actual_count(model):
+    """Correlated count of the rows of a model belonging to each agency"""
+    return (
+        select(func.count(model.id))
+        .where(model.agency_id == Agency.__table__.c.id)
+        .scalar_subquery()
+    )
+
+def recount_statement():
+    """UPDATE setting every drifted counter to the real count"""
+    agencies = Agency.__table__
+    counts = {column: actual_count(model) for model, column in AGENCY_COUNTERS.items()}
+    return (
+        update(agencies)
+        .where(or_(*(agencies.c[column] != count for column, count in counts.items())))
+        .values({**counts, "updated_at": agencies.c.updated_at})
+    )
+
+async def repair_agency_counters() -> int:
+    """Recompute the counters, returning the number of agencies that were wrong"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(recount_statement())
+        await db.commit()
+    return result.rowcount
+
+async def run_counter_repair():
+    """Repair the counters every AGENCY_RECOUNT_INTERVAL (runs for the process lifetime)"""
+    while True:
+        try:
+            repaired = await repair_agency_counters()
+            if repaired:
+                logger.warning("Repaired drifted agency counters", agencies=repaired)
+        except Exception as e:
+            logger.error("Error repairing agency counters", error=str(e))
+        await asyncio.sleep(AGENCY_RECOUNT_INTERVAL)
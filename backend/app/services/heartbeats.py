@@ -0,0 +1,89 @@
+"""
+Write-behind buffer for device status changes
+
+Writing every heartbeat straight away costs an UPDATE and a commit, and on
+SQLite every commit takes the single writer lock. The status and last_seen
+of each device are kept in memory, the last heartbeat winning, and written
+every HEARTBEAT_FLUSH_INTERVAL as a single batched UPDATE, so a device costs
+at most one row write per interval however often it reports. The presence
+tracker feeds it every heartbeat and the offline transitions of missed
+heartbeats; the database lags by at most one interval (plus whatever was
+pending at a crash).
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, Tuple
+import structlog
+from sqlalchemy import update
+from app.core.database import AsyncSessionLocal
+from app.models.device import Device
+
+logger = structlog.get_logger()
+
+HEARTBEAT_FLUSH_INTERVAL = 5  # seconds
+
+class HeartbeatBuffer:
+    """Latest unwritten status and last_seen of every device"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending: Dict[int, Tuple[str, datetime]] = {}
+        self.flushes = 0
+        self.written = 0
+        self.coalesced = 0
+
+    def record(self, device_id: int, status: str, last_seen: datetime):
+        """Accept a status change, replacing any unwritten one of the device"""
+        if device_id in self._pending:
+            self.coalesced += 1
+        self._pending[device_id] = (status, last_seen)
+
+    def discard(self, device_id: int):
+        """Drop the unwritten status of a device that was edited or deleted"""
+        self._pending.pop(device_id, None)
+
+    async def flush(self) -> int:
+        """Write the pending changes in one transaction"""
+        if not self._pending:
+            return 0
+
+        # Changes arriving during the write land in the new dict
+        batch, self._pending = self._pending, {}
+        rows = [
+            {"id": device_id, "status": status, "last_seen": last_seen}
+            for device_id, (status, last_seen) in batch.items()
+        ]
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(Device), rows)
+                await db.commit()
+        except BaseException:
+            # Put the batch back, without overwriting newer changes
+            for device_id, change in batch.items():
+                self._pending.setdefault(device_id, change)
+            raise
+
+        self.flushes += 1
+        self.written += len(rows)
+        return len(rows)
+
+    async def run_flusher(self):
+        """Flush every interval (runs for the process lifetime)"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Error writing device status changes", error=str(e), pending=len(self._pending))
+
+    def stats(self) -> Dict[str, int]:
+        """Counters of the buffer"""
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "written": self.written,
+            "coalesced": self.coalesced
+        }
+
+heartbeat_buffer = HeartbeatBuffer(HEARTBEAT_FLUSH_INTERVAL)
@@ -0,0 +1,122 @@
+"""
+Weekly playlist manifest for the Raspberry Pi players
+"""
+
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, and_
+from app.core.http_cache import agency_versions
+from app.models.agency import Agency
+from app.models.content import Content
+from app.models.schedule import Schedule, mask_to_days
+
+# Schedules repeat weekly, so one week covers every slot the player can resolve
+MANIFEST_DAYS = 7
+
+def manifest_version(body: Dict) -> str:
+    """Compute the version of a manifest from its contents"""
+    payload = json.dumps(body, sort_keys=True, default=str).encode()
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+async def build_agency_manifest(db: AsyncSession, agency_id: int) -> Optional[Dict]:
+    """Build the manifest of schedules, contents and hibernation window of an agency"""
+    result = await db.execute(select(Agency).where(Agency.id == agency_id))
+    agency = result.scalar_one_or_none()
+
+    if not agency:
+        return None
+
+    result = await db.execute(
+        select(Schedule, Content)
+        .join(Content, Schedule.content_id == Content.id)
+        .where(
+            and_(
+                Schedule.agency_id == agency_id,
+                Schedule.is_active == True,
+                Content.is_active == True
+            )
+        )
+        .order_by(Schedule.id)
+    )
+    rows = result.all()
+
+    contents = {}
+    schedules = []
+    for schedule, content in rows:
+        changed_at = content.updated_at or content.created_at
+        contents[str(content.id)] = {
+            "id": content.id,
+            "title": content.title,
+            "content_type": content.content_type,
+            "url": content.url,
+            "file_path": content.file_path,
+            "duration": content.duration,
+            "checksum": content.checksum,
+            "media_type": content.media_type,
+            "updated_at": changed_at.isoformat() if changed_at else None
+        }
+        schedules.append({
+            "id": schedule.id,
+            "content_id": schedule.content_id,
+            "start_time": str(schedule.start_time),
+            "end_time": str(schedule.end_time),
+            "days_of_week": mask_to_days(schedule.days_mask),
+            "priority": schedule.priority
+        })
+
+    body = {
+        "agency_id": agency.id,
+        "agency": {
+            "orientation": agency.orientation,
+            "hibernation_enabled": agency.hibernation_enabled,
+            "hibernation_start": agency.hibernation_start,
+            "hibernation_end": agency.hibernation_end
+        },
+        "contents": contents,
+        "schedules": schedules
+    }
+
+    now = datetime.utcnow()
+    return {
+        **body,
+        "version": manifest_version(body),
+        "generated_at": now.isoformat(),
+        "valid_until": (now + timedelta(days=MANIFEST_DAYS)).isoformat()
+    }
+
+class ManifestVersions:
+    """Manifest version of each agency, kept until the agency version moves"""
+
+    def __init__(self):
+        self._versions: Dict[int, Tuple[int, str]] = {}
+
+    def get(self, agency_id: int) -> Optional[str]:
+        """Cached version of an agency manifest, None when its data changed since"""
+        cached = self._versions.get(agency_id)
+        if cached and cached[0] == agency_versions.get(agency_id):
+            return cached[1]
+        return None
+
+    def remember(self, agency_id: int, agency_version: int, version: str):
+        """Store the version of a manifest built at agency_version"""
+        self._versions[agency_id] = (agency_version, version)
+
+manifest_versions = ManifestVersions()
+
+async def agency_manifest_version(db: AsyncSession, agency_id: int) -> Optional[str]:
+    """Version of an agency manifest, building the manifest only after a change"""
+    version = manifest_versions.get(agency_id)
+    if version is not None:
+        return version
+
+    # Read the agency version first, so a change during the build leaves the entry stale
+    agency_version = agency_versions.get(agency_id)
+    manifest = await build_agency_manifest(db, agency_id)
+    if not manifest:
+        return None
+
+    manifest_versions.remember(agency_id, agency_version, manifest["version"])
+    return manifest["version"]
@@ -0,0 +1,101 @@
+"""
+Content-addressed media store
+
+Uploaded files are stored once, named after their SHA-256 alone in a
+fanned-out tree (blobs/ab/cd/abcd...ef), so the same video uploaded for every
+agency, whatever the name it had, is kept on disk once and served from a
+single URL that device and HTTP caches share. The media type sniffed at
+upload is kept on the referencing row (Content.media_type and
+Agency.logo_media_type). Blob URLs never change meaning, which lets them be
+served as immutable.
+
+A blob is referenced by the Content.file_path and Agency.logo_url columns
+holding its URL; the references are counted there when a row lets go of a
+blob, and the file is removed once nothing points to it anymore. Placing a
+blob and committing the row that references it happen under the store lock,
+so a concurrent release cannot remove a blob that is about to be referenced.
+
+Files still being received (temporary files and resumable upload sessions)
+live in UPLOAD_INCOMING_DIR, outside the served tree, and only reach the
+blob tree once they are complete and checked.
+"""
+
+import asyncio
+import os
+import uuid
+from typing import Dict, Optional
+import anyio
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from app.core.config import settings
+from app.models.agency import Agency
+from app.models.content import Content
+
+BLOB_URL_PREFIX = "/uploads/blobs/"
+
+def local_path(url: str) -> str:
+    """Path on disk of an /uploads/... URL"""
+    return os.path.join(settings.UPLOAD_DIR, url.replace("/uploads/", "", 1))
+
+class MediaStore:
+    """SHA-256 named blobs under UPLOAD_DIR/blobs"""
+
+    def __init__(self, root: str, incoming: str):
+        self.root = root
+        self.incoming = incoming
+        self.lock = asyncio.Lock()
+
+    def blob_url(self, checksum: str) -> str:
+        """Stable URL of a blob"""
+        return f"{BLOB_URL_PREFIX}{checksum[:2]}/{checksum[2:4]}/{checksum}"
+
+    async def temp_path(self) -> str:
+        """Fresh temporary file path, outside the served tree"""
+        directory = os.path.join(self.incoming, "tmp")
+        await anyio.Path(directory).mkdir(parents=True, exist_ok=True)
+        return os.path.join(directory, f"{uuid.uuid4()}.part")
+
+    async def put(self, stored: Dict) -> str:
+        """Move an upload from store_upload into place, returning its blob URL
+
+        Must be called with the store lock held until the referencing row is
+        committed. An identical blob already in the store is reused.
+        """
+        url = self.blob_url(stored["checksum"])
+        path = local_path(url)
+
+        if await anyio.Path(path).exists():
+            await anyio.Path(stored["temp_path"]).unlink(missing_ok=True)
+            stored["deduplicated"] = True
+        else:
+            await anyio.Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+            await anyio.to_thread.run_sync(os.replace, stored["temp_path"], path)
+            stored["deduplicated"] = False
+
+        return url
+
+    async def references(self, db: AsyncSession, url: str) -> int:
+        """Number of contents and agency logos pointing to a file"""
+        contents = await db.execute(select(func.count(Content.id)).where(Content.file_path == url))
+        logos = await db.execute(select(func.count(Agency.id)).where(Agency.logo_url == url))
+        return contents.scalar() + logos.scalar()
+
+    async def release(self, db: AsyncSession, url: Optional[str]):
+        """Remove a file once no row references it (call after committing the change)"""
+        if not url or not url.startswith("/uploads/"):
+            return
+
+        # Paths may come from updates, never follow them out of the upload directory
+        path = os.path.realpath(local_path(url))
+        if not path.startswith(os.path.realpath(settings.UPLOAD_DIR) + os.sep):
+            return
+
+        async with self.lock:
+            if await self.references(db, url):
+                return
+            await anyio.Path(path).unlink(missing_ok=True)
+
+media_store = MediaStore(
+    os.path.join(settings.UPLOAD_DIR, "blobs"),
+    settings.UPLOAD_INCOMING_DIR
+)
@@ -0,0 +1,76 @@
+"""
+Precomputed "what should I play now" answers for the devices
+
+The answer of an agency only changes at schedule boundaries or when its data
+is written, so it is computed once per agency and time slot from the
+schedule index and served from memory until the slot ends or a change event
+for the agency arrives.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.core.events import broker
+from app.models.device import Device
+from app.services.manifest import MANIFEST_DAYS
+from app.services.schedule_index import schedule_index
+
+class NowPlayingCache:
+    """Per-agency answers valid until the next schedule boundary"""
+
+    def __init__(self):
+        self._answers: Dict[int, Dict] = {}
+        self._device_agencies: Dict[int, int] = {}
+        self._generations: Dict[int, int] = defaultdict(int)
+
+    def on_event(self, event: Dict):
+        """Broker listener: forget everything derived from the changed agency"""
+        agency_id = event["agency_id"]
+        self._generations[agency_id] += 1
+        self._answers.pop(agency_id, None)
+
+        if event["entity"] == "agency" and event["action"] == "deleted":
+            for device_id, device_agency_id in list(self._device_agencies.items()):
+                if device_agency_id == agency_id:
+                    del self._device_agencies[device_id]
+
+    def forget_device(self, device_id: int):
+        """Drop the cached agency of a device after it was moved or deleted"""
+        self._device_agencies.pop(device_id, None)
+
+    async def get_device_agency(self, db: AsyncSession, device_id: int) -> Optional[int]:
+        """Agency of a device, loaded once"""
+        agency_id = self._device_agencies.get(device_id)
+        if agency_id is None:
+            result = await db.execute(select(Device.agency_id).where(Device.id == device_id))
+            agency_id = result.scalar_one_or_none()
+            if agency_id is not None:
+                self._device_agencies[device_id] = agency_id
+        return agency_id
+
+    async def get(self, db: AsyncSession, agency_id: int, now: datetime) -> Dict:
+        """Answer for an agency at now, computing it only when the slot changed"""
+        cached = self._answers.get(agency_id)
+        if cached and cached["valid_from"] <= now < cached["valid_until"]:
+            return cached
+
+        generation = self._generations[agency_id]
+        entry, next_change = await schedule_index.lookup(db, agency_id, now)
+
+        answer = {
+            "valid_from": now,
+            # Without any transition ahead, the answer holds for the whole manifest window
+            "valid_until": next_change or now + timedelta(days=MANIFEST_DAYS),
+            "schedule_id": entry["schedule_id"] if entry else None,
+            "content": entry["content"] if entry else None
+        }
+
+        # A write while the index was loading makes this answer stale already
+        if self._generations[agency_id] == generation:
+            self._answers[agency_id] = answer
+        return answer
+
+now_playing_cache = NowPlayingCache()
+broker.add_listener(now_playing_cache.on_event)
@@ -0,0 +1,210 @@
+"""
+Device presence derived from heartbeats
+
+A device used to be "offline" only if its player managed to say so before
+shutting down, so a Pi that lost power stayed "online" forever. Every device
+now has a presence entry in memory with its status and the last time it was
+heard from. Online devices sit in a timer wheel slot DEVICE_OFFLINE_AFTER
+seconds ahead, moved forward by each heartbeat; a sweep every PRESENCE_TICK
+expires the slot that came due and flips its devices to offline. Heartbeats
+and transitions are written to the database through the heartbeat buffer,
+which keeps last_seen advancing at one write per device and flush window.
+Dashboards read the entries, and per-agency status counts kept up to date
+on every transition, instead of scanning the devices table.
+
+Entries are loaded at startup and kept current by the device routes;
+devices online at startup get a full window to check in again.
+"""
+
+import asyncio
+import math
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import structlog
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.core.config import settings
+from app.models.device import Device
+from app.services.heartbeats import heartbeat_buffer
+
+logger = structlog.get_logger()
+
+PRESENCE_TICK = 5  # seconds per timer wheel slot
+
+PRESENCE_FIELDS = (
+    "id", "name", "ip_address", "mac_address", "agency_id", "status", "last_seen",
+    "version", "notes", "created_at", "updated_at"
+)
+# Fields owned by the device routes rather than by presence
+ROW_FIELDS = tuple(field for field in PRESENCE_FIELDS if field not in ("status", "last_seen"))
+DEVICE_STATUSES = ("online", "offline", "maintenance")
+
+def seen_key(entry: Dict) -> float:
+    """Sort key of an entry by last_seen, naive datetimes being UTC"""
+    last_seen = entry["last_seen"]
+    if last_seen is None:
+        return float("-inf")
+    if last_seen.tzinfo is None:
+        last_seen = last_seen.replace(tzinfo=timezone.utc)
+    return last_seen.timestamp()
+
+class PresenceTracker:
+    """Presence entries of all devices, expired by a timer wheel"""
+
+    def __init__(self, offline_after: float, tick: float, persist: Callable[[int, str, datetime], None]):
+        self.tick = tick
+        self.window = max(1, math.ceil(offline_after / tick))
+        self.persist = persist
+        self._slots: List[Set[int]] = [set() for _ in range(self.window + 1)]
+        self._devices: Dict[int, Dict] = {}
+        self._agencies: Dict[int, Set[int]] = defaultdict(set)
+        self._counts: Dict[int, Counter] = defaultdict(Counter)
+        self._origin = time.monotonic()
+        self._cursor = 0
+
+    def current_tick(self) -> int:
+        return int((time.monotonic() - self._origin) / self.tick)
+
+    def _unschedule(self, entry: Dict):
+        if entry["slot"] is not None:
+            self._slots[entry["slot"]].discard(entry["id"])
+            entry["slot"] = None
+
+    def _set_status(self, entry: Dict, status: str):
+        """Change the status of an entry and the counts of its agency"""
+        counts = self._counts[entry["agency_id"]]
+        counts[entry["status"]] -= 1
+        counts[status] += 1
+        entry["status"] = status
+
+    def _schedule(self, entry: Dict):
+        """Put an online device in the slot where its window ends"""
+        self._unschedule(entry)
+        if entry["status"] == "online":
+            entry["expires"] = self.current_tick() + self.window
+            entry["slot"] = entry["expires"] % len(self._slots)
+            self._slots[entry["slot"]].add(entry["id"])
+
+    def track(self, device):
+        """Create or refresh the entry of a device row, keeping its presence"""
+        entry = self._devices.get(device.id)
+        if entry is None:
+            entry = {field: getattr(device, field) for field in PRESENCE_FIELDS}
+            entry.update(slot=None, expires=None)
+            self._devices[device.id] = entry
+            self._schedule(entry)
+        else:
+            self._agencies[entry["agency_id"]].discard(device.id)
+            self._counts[entry["agency_id"]][entry["status"]] -= 1
+            entry.update((field, getattr(device, field)) for field in ROW_FIELDS)
+        self._agencies[entry["agency_id"]].add(device.id)
+        self._counts[entry["agency_id"]][entry["status"]] += 1
+
+    def forget(self, device_id: int):
+        """Drop the entry of a deleted device"""
+        entry = self._devices.pop(device_id, None)
+        if entry is not None:
+            self._unschedule(entry)
+            self._agencies[entry["agency_id"]].discard(device_id)
+            self._counts[entry["agency_id"]][entry["status"]] -= 1
+
+    def set_status(self, device_id: int, status: str):
+        """Apply a status written by an admin (already in the database)"""
+        entry = self._devices.get(device_id)
+        if entry is not None:
+            self._set_status(entry, status)
+            self._schedule(entry)
+
+    def heartbeat(self, device_id: int, status: str, last_seen: datetime) -> Optional[Dict]:
+        """Record a heartbeat and hand it to the write buffer
+
+        Returns the entry of the device, None when it is unknown.
+        """
+        entry = self._devices.get(device_id)
+        if entry is None:
+            return None
+
+        self._set_status(entry, status)
+        entry["last_seen"] = last_seen
+        self._schedule(entry)
+        self.persist(device_id, status, last_seen)
+        return entry
+
+    def sweep(self) -> int:
+        """Flip the devices whose window ended to offline"""
+        current = self.current_tick()
+        # After a long stall every slot is visited once
+        start = max(self._cursor + 1, current - len(self._slots) + 1)
+        expired = 0
+        for tick in range(start, current + 1):
+            slot = self._slots[tick % len(self._slots)]
+            for device_id in [device_id for device_id in slot if self._devices[device_id]["expires"] <= current]:
+                entry = self._devices[device_id]
+                self._unschedule(entry)
+                self._set_status(entry, "offline")
+                self.persist(device_id, "offline", entry["last_seen"])
+                expired += 1
+        self._cursor = max(self._cursor, current)
+        return expired
+
+    def current(self, device) -> Tuple[str, Optional[datetime]]:
+        """Status and last_seen of a device row as presence knows them"""
+        entry = self._devices.get(device.id)
+        if entry is None:
+            return device.status, device.last_seen
+        return entry["status"], entry["last_seen"]
+
+    def get(self, device_id: int) -> Optional[Dict]:
+        """Public fields of the entry of a device"""
+        entry = self._devices.get(device_id)
+        if entry is None:
+            return None
+        return {field: entry[field] for field in PRESENCE_FIELDS}
+
+    def agency_devices(self, agency_id: int, status: Optional[str] = None) -> List[Dict]:
+        """Entries of the devices of an agency, most recently seen first"""
+        entries = [self.get(device_id) for device_id in self._agencies.get(agency_id, ())]
+        if status is not None:
+            entries = [entry for entry in entries if entry["status"] == status]
+        return sorted(entries, key=seen_key, reverse=True)
+
+    def agency_counts(self, agency_id: int) -> Dict[str, int]:
+        """Number of devices of an agency in total and by status"""
+        counts = self._counts.get(agency_id, Counter())
+        summary = {"total": len(self._agencies.get(agency_id, ()))}
+        summary.update((status, counts[status]) for status in DEVICE_STATUSES)
+        return summary
+
+    def summary(self, agency_ids: Optional[Iterable[int]] = None) -> Dict:
+        """Status counts of some agencies (all of them by default) and their totals"""
+        if agency_ids is None:
+            agency_ids = [agency_id for agency_id, devices in self._agencies.items() if devices]
+
+        agencies = [{"agency_id": agency_id, **self.agency_counts(agency_id)} for agency_id in sorted(set(agency_ids))]
+        totals = {key: sum(agency[key] for agency in agencies) for key in ("total",) + DEVICE_STATUSES}
+        return {"totals": totals, "agencies": agencies}
+
+    async def load(self, db: AsyncSession):
+        """Load the entries of all devices (at startup)"""
+        result = await db.execute(select(*(getattr(Device, field) for field in PRESENCE_FIELDS)))
+        self._slots = [set() for _ in range(self.window + 1)]
+        self._devices = {}
+        self._agencies = defaultdict(set)
+        self._counts = defaultdict(Counter)
+        for device in result.all():
+            self.track(device)
+
+    async def run_sweeper(self):
+        """Sweep the wheel every tick (runs for the process lifetime)"""
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                expired = self.sweep()
+                if expired:
+                    logger.info("Devices went offline after missing their heartbeats", count=expired)
+            except Exception as e:
+                logger.error("Error sweeping device presence", error=str(e))
+
+presence_tracker = PresenceTracker(settings.DEVICE_OFFLINE_AFTER, PRESENCE_TICK, heartbeat_buffer.record)
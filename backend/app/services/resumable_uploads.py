@@ -0,0 +1,253 @@
+"""
+Resumable uploads (tus 1.0 core protocol with the checksum and expiration extensions)
+
+Large videos are sent as a session: the client declares the total size,
+then PATCHes chunks at the offset the server reports, optionally with a
+checksum per chunk. Chunks are streamed to a part file in the incoming
+directory of the media store (never served), so an interrupted upload
+resumes from the last byte received instead of starting over, and the size
+limit is no longer bound by what a single request can carry. Sessions are
+kept as a JSON file next to their part file, so they survive restarts;
+sessions idle past UPLOAD_SESSION_TTL are removed by a periodic garbage
+collection.
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import defaultdict
+from email.utils import formatdate
+from typing import AsyncIterator, Dict, Optional, Tuple
+import anyio
+import structlog
+from app.core.media_responses import hash_file
+from app.core.media_types import SNIFF_SIZE, media_kind, sniff_media_type
+from app.services.media_store import media_store
+from app.services.uploads import UploadTooLarge
+
+logger = structlog.get_logger()
+
+TUS_VERSION = "1.0.0"
+TUS_EXTENSIONS = "creation,checksum,expiration,termination"
+
+UPLOAD_SESSION_TTL = 24 * 60 * 60  # seconds since the last chunk
+UPLOAD_GC_INTERVAL = 15 * 60  # seconds
+
+CHECKSUM_ALGORITHMS = ("md5", "sha1", "sha256")
+
+class UploadConflict(ValueError):
+    """The chunk does not start at the current offset of the upload"""
+
+class ChecksumMismatch(ValueError):
+    """The chunk does not match its Upload-Checksum"""
+
+def parse_upload_metadata(header: str) -> Dict[str, str]:
+    """Decode an Upload-Metadata header ("key base64value,key2 base64value2")"""
+    metadata = {}
+    for pair in filter(None, (part.strip() for part in header.split(","))):
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode("utf-8") if value else ""
+        except (binascii.Error, UnicodeDecodeError):
+            raise ValueError(f"Invalid Upload-Metadata value for {key}")
+    return metadata
+
+def parse_upload_checksum(header: str) -> Tuple[str, bytes]:
+    """Decode an Upload-Checksum header ("sha256 base64digest")"""
+    algorithm, _, value = header.strip().partition(" ")
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError(f"Unsupported checksum algorithm, use one of {', '.join(CHECKSUM_ALGORITHMS)}")
+    try:
+        return algorithm, base64.b64decode(value, validate=True)
+    except binascii.Error:
+        raise ValueError("Invalid Upload-Checksum digest")
+
+def upload_expires(session: Dict) -> str:
+    """Upload-Expires header value of a session"""
+    return formatdate(session["expires_at"], usegmt=True)
+
+class UploadSessions:
+    """Upload sessions stored as <id>.json and <id>.part files"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, f"{upload_id}.json")
+
+    def part_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, f"{upload_id}.part")
+
+    async def save(self, session: Dict):
+        """Persist the session metadata atomically"""
+        data = {key: value for key, value in session.items() if key != "offset"}
+        temp_path = self.meta_path(session["id"]) + ".tmp"
+        async with await anyio.open_file(temp_path, "w") as f:
+            await f.write(json.dumps(data))
+        await anyio.to_thread.run_sync(os.replace, temp_path, self.meta_path(session["id"]))
+
+    async def create(self, content_id: int, user_id: int, length: int, metadata: Dict[str, str]) -> Dict:
+        """Open a new upload session with an empty part file"""
+        await anyio.Path(self.root).mkdir(parents=True, exist_ok=True)
+
+        now = time.time()
+        session = {
+            "id": uuid.uuid4().hex,
+            "content_id": content_id,
+            "user_id": user_id,
+            "length": length,
+            "filename": metadata.get("filename", ""),
+            "sha256": metadata.get("sha256"),
+            "created_at": now,
+            "expires_at": now + UPLOAD_SESSION_TTL,
+            "offset": 0
+        }
+        await anyio.Path(self.part_path(session["id"])).touch()
+        await self.save(session)
+        return session
+
+    async def get(self, upload_id: str) -> Optional[Dict]:
+        """Load a live session, with its offset taken from the part file"""
+        if not upload_id.isalnum():
+            return None
+        try:
+            async with await anyio.open_file(self.meta_path(upload_id)) as f:
+                session = json.loads(await f.read())
+            session["offset"] = (await anyio.Path(self.part_path(upload_id)).stat()).st_size
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if session["expires_at"] <= time.time():
+            await self.delete(upload_id)
+            return None
+        return session
+
+    async def append(
+        self,
+        session: Dict,
+        offset: int,
+        chunks: AsyncIterator[bytes],
+        checksum: Optional[Tuple[str, bytes]] = None
+    ) -> int:
+        """Write a chunk at offset, returning the new offset
+
+        Without a checksum, the bytes received before an interruption are
+        kept; with one, a chunk that is incomplete or does not match is
+        discarded.
+        """
+        async with self._locks[session["id"]]:
+            part_path = self.part_path(session["id"])
+            current = (await anyio.Path(part_path).stat()).st_size
+            if offset != current:
+                raise UploadConflict(f"Upload is at offset {current}, not {offset}")
+
+            digest = hashlib.new(checksum[0]) if checksum else None
+            written = offset
+
+            async with await anyio.open_file(part_path, "r+b") as f:
+                await f.seek(offset)
+                try:
+                    async for chunk in chunks:
+                        if written + len(chunk) > session["length"]:
+                            raise UploadTooLarge(f"Upload exceeds its declared length of {session['length']} bytes")
+                        if digest:
+                            digest.update(chunk)
+                        await f.write(chunk)
+                        written += len(chunk)
+
+                    if digest and digest.digest() != checksum[1]:
+                        raise ChecksumMismatch("Chunk does not match its Upload-Checksum")
+                except BaseException as e:
+                    with anyio.CancelScope(shield=True):
+                        if digest or isinstance(e, UploadTooLarge):
+                            await f.truncate(offset)
+                        else:
+                            await f.flush()
+                            await self.touch(session)
+                    raise
+                await f.flush()
+
+            session["offset"] = written
+            await self.touch(session)
+            return written
+
+    async def touch(self, session: Dict):
+        """Push back the expiry of an active session"""
+        session["expires_at"] = time.time() + UPLOAD_SESSION_TTL
+        await self.save(session)
+
+    async def finish(self, session: Dict) -> Dict:
+        """Hash and sniff a complete upload, returning it in the store_upload format"""
+        part_path = self.part_path(session["id"])
+        checksum = await anyio.to_thread.run_sync(hash_file, part_path)
+        if session.get("sha256") and session["sha256"].lower() != checksum:
+            raise ChecksumMismatch("Uploaded file does not match its sha256 metadata")
+
+        async with await anyio.open_file(part_path, "rb") as f:
+            media_type = sniff_media_type(await f.read(SNIFF_SIZE))
+
+        return {
+            "temp_path": part_path,
+            "size": session["length"],
+            "checksum": checksum,
+            "media_type": media_type,
+            "kind": media_kind(media_type)
+        }
+
+    async def delete(self, upload_id: str):
+        """Remove a session and its part file"""
+        await anyio.Path(self.part_path(upload_id)).unlink(missing_ok=True)
+        await anyio.Path(self.meta_path(upload_id)).unlink(missing_ok=True)
+        self._locks.pop(upload_id, None)
+
+    async def collect_garbage(self) -> int:
+        """Remove expired sessions and orphaned part files"""
+        if not await anyio.Path(self.root).exists():
+            return 0
+
+        now = time.time()
+        removed = 0
+        async for path in anyio.Path(self.root).iterdir():
+            upload_id, extension = os.path.splitext(path.name)
+            if extension == ".json":
+                try:
+                    session = json.loads(await path.read_text())
+                    expired = session["expires_at"] <= now
+                except (OSError, ValueError, KeyError):
+                    expired = True
+            elif extension == ".part":
+                # Parts whose metadata is gone, with some slack for a session being created
+                try:
+                    expired = (
+                        not await anyio.Path(self.meta_path(upload_id)).exists()
+                        and (await path.stat()).st_mtime + UPLOAD_SESSION_TTL <= now
+                    )
+                except FileNotFoundError:
+                    # Removed along with its session earlier in this pass
+                    continue
+            else:
+                continue
+
+            if expired and not self._locks.get(upload_id, asyncio.Lock()).locked():
+                await self.delete(upload_id)
+                removed += 1
+        return removed
+
+    async def run_garbage_collector(self):
+        """Collect expired sessions every UPLOAD_GC_INTERVAL (runs for the process lifetime)"""
+        while True:
+            try:
+                removed = await self.collect_garbage()
+                if removed:
+                    logger.info("Removed expired upload sessions", count=removed)
+            except Exception as e:
+                logger.error("Error collecting upload sessions", error=str(e))
+            await asyncio.sleep(UPLOAD_GC_INTERVAL)
+
+upload_sessions = UploadSessions(os.path.join(media_store.incoming, "sessions"))
@@ -0,0 +1,254 @@
+"""
+Sweep-line conflict engine for the schedules of an agency
+
+The active schedules of an agency are loaded once and, for every weekday,
+their start and end points are sorted and swept in order. Each schedule that
+starts overlaps exactly the schedules active at that point, so all overlaps
+are found in O(n log n + k) for k overlaps, and the moments where nothing is
+active are the uncovered gaps.
+
+Overlaps are normal when one schedule is meant to override another with a
+higher priority. Overlaps of different contents with the same priority are
+ambiguous, since the player cannot tell which one should win, and are
+reported as conflicts.
+
+Creating or updating one schedule only needs the conflicts of that schedule:
+candidate_conflicts compares it with the schedules sharing one of its
+weekdays and part of its interval, which the database selects, instead of
+analyzing every pair of the agency.
+"""
+
+from collections import defaultdict
+from datetime import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, and_
+from app.models.schedule import Schedule, mask_to_days, weekday_bit
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+WEEKDAY_NAMES = {1: "Mon", 2: "Tue", 3: "Wed", 4: "Thu", 5: "Fri", 6: "Sat", 7: "Sun"}
+
+def parse_seconds(value: Union[time, str]) -> int:
+    """Seconds since midnight of a time or "HH:MM[:SS]" string"""
+    if isinstance(value, str):
+        parts = [int(part) for part in value.split(":")]
+        value = time(*parts)
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+def format_seconds(seconds: int) -> str:
+    """Format seconds since midnight as HH:MM:SS"""
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def conflict_entry(
+    schedule_id: int,
+    content_id: int,
+    priority: int,
+    start_time: Union[time, str],
+    end_time: Union[time, str],
+    days_mask: int
+) -> Dict:
+    """Entry checked by the engine; end times are inclusive, as in the API"""
+    return {
+        "schedule_id": schedule_id,
+        "content_id": content_id,
+        "priority": priority or 0,
+        "start": parse_seconds(start_time),
+        "end": parse_seconds(end_time) + 1,
+        "days_mask": days_mask
+    }
+
+def conflict_entries_query(agency_id: int, exclude_schedule_id: int = None):
+    """Query of the entries of the active schedules of an agency"""
+    query = select(
+        Schedule.id, Schedule.content_id, Schedule.priority,
+        Schedule.start_time, Schedule.end_time, Schedule.days_mask
+    ).where(
+        and_(
+            Schedule.agency_id == agency_id,
+            Schedule.is_active == True
+        )
+    )
+    if exclude_schedule_id:
+        query = query.where(Schedule.id != exclude_schedule_id)
+    return query
+
+async def load_conflict_entries(db: AsyncSession, agency_id: int, exclude_schedule_id: int = None) -> List[Dict]:
+    """Load the active schedules of an agency with a single query"""
+    result = await db.execute(conflict_entries_query(agency_id, exclude_schedule_id))
+    return [conflict_entry(*row) for row in result.all()]
+
+async def load_overlapping_entries(
+    db: AsyncSession,
+    agency_id: int,
+    start_time: time,
+    end_time: time,
+    days_mask: int,
+    exclude_schedule_id: int = None
+) -> List[Dict]:
+    """Load the active schedules sharing a weekday and part of an interval (end times inclusive)"""
+    query = conflict_entries_query(agency_id, exclude_schedule_id).where(
+        and_(
+            Schedule.days_mask.op("&")(days_mask) != 0,
+            Schedule.start_time <= end_time,
+            Schedule.end_time >= start_time
+        )
+    )
+    result = await db.execute(query)
+    return [conflict_entry(*row) for row in result.all()]
+
+async def load_agencies_conflict_entries(db: AsyncSession, agency_ids: Iterable[int]) -> Dict[int, List[Dict]]:
+    """Load the active schedules of several agencies with a single query"""
+    result = await db.execute(
+        select(
+            Schedule.agency_id, Schedule.id, Schedule.content_id, Schedule.priority,
+            Schedule.start_time, Schedule.end_time, Schedule.days_mask
+        ).where(
+            and_(
+                Schedule.agency_id.in_(list(agency_ids)),
+                Schedule.is_active == True
+            )
+        )
+    )
+
+    entries: Dict[int, List[Dict]] = defaultdict(list)
+    for agency_id, *row in result.all():
+        entries[agency_id].append(conflict_entry(*row))
+    return entries
+
+def sweep_weekday(entries: List[Dict], weekday: int, window: Tuple[int, int]) -> Tuple[List[Tuple], List[Tuple[int, int]]]:
+    """Find the overlapping pairs and the uncovered gaps of one weekday"""
+    bit = weekday_bit(weekday)
+    events = []
+    for entry in entries:
+        if entry["days_mask"] & bit and entry["start"] < entry["end"]:
+            # Ends sort before starts at the same second: touching slots do not overlap
+            events.append((entry["start"], 1, entry["schedule_id"], entry))
+            events.append((entry["end"], 0, entry["schedule_id"], entry))
+    events.sort(key=lambda event: event[:3])
+
+    window_start, window_end = window
+    pairs = []
+    gaps = []
+    active: Dict[int, Dict] = {}
+    uncovered_since = window_start
+
+    for point, is_start, schedule_id, entry in events:
+        if is_start:
+            if not active and uncovered_since is not None:
+                if min(point, window_end) > uncovered_since:
+                    gaps.append((uncovered_since, min(point, window_end)))
+                uncovered_since = None
+            for other in active.values():
+                pairs.append((other, entry, point, min(other["end"], entry["end"])))
+            active[schedule_id] = entry
+        else:
+            del active[schedule_id]
+            if not active:
+                uncovered_since = max(point, window_start)
+
+    if uncovered_since is not None and uncovered_since < window_end:
+        gaps.append((uncovered_since, window_end))
+
+    return pairs, gaps
+
+def analyze(entries: List[Dict], window: Tuple[int, int] = (0, SECONDS_PER_DAY)) -> Dict:
+    """Report every overlap, its priority tie status and the uncovered gaps of the week
+
+    Reported ranges include their end time, like the schedules themselves.
+    """
+    overlaps: Dict[Tuple, Dict] = {}
+    gaps: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+    for weekday in range(1, 8):
+        pairs, day_gaps = sweep_weekday(entries, weekday, window)
+
+        for first, second, start, end in pairs:
+            first, second = sorted((first, second), key=lambda entry: entry["schedule_id"])
+            key = (first["schedule_id"], second["schedule_id"], start, end)
+            if key not in overlaps:
+                overlaps[key] = {
+                    "schedule_ids": [first["schedule_id"], second["schedule_id"]],
+                    "weekdays": [],
+                    "start": format_seconds(start),
+                    "end": format_seconds(end - 1),
+                    "priority_tie": first["priority"] == second["priority"],
+                    "same_content": first["content_id"] == second["content_id"]
+                }
+            overlaps[key]["weekdays"].append(weekday)
+
+        for gap in day_gaps:
+            gaps[gap].append(weekday)
+
+    overlap_list = list(overlaps.values())
+    return {
+        "overlaps": overlap_list,
+        "conflicts": [
+            overlap for overlap in overlap_list
+            if overlap["priority_tie"] and not overlap["same_content"]
+        ],
+        "gaps": [
+            {"weekdays": weekdays, "start": format_seconds(start), "end": format_seconds(end - 1)}
+            for (start, end), weekdays in sorted(gaps.items())
+        ]
+    }
+
+def candidate_conflicts(entries: List[Dict], candidate: Dict) -> List[Dict]:
+    """Conflicts of one schedule with the others, reported like analyze does
+
+    Each other entry is compared once with the candidate, in O(n).
+    """
+    conflicts = []
+    for other in entries:
+        if other["schedule_id"] == candidate["schedule_id"]:
+            continue
+        if other["priority"] != candidate["priority"] or other["content_id"] == candidate["content_id"]:
+            continue
+
+        days_mask = other["days_mask"] & candidate["days_mask"]
+        start, end = max(other["start"], candidate["start"]), min(other["end"], candidate["end"])
+        # Touching slots (one ends the second before the other starts) do not overlap
+        if not days_mask or start >= end:
+            continue
+
+        conflicts.append({
+            "schedule_ids": sorted((other["schedule_id"], candidate["schedule_id"])),
+            "weekdays": mask_to_days(days_mask),
+            "start": format_seconds(start),
+            "end": format_seconds(end - 1),
+            "priority_tie": True,
+            "same_content": False
+        })
+    return conflicts
+
+def conflicts_of(report: Dict, schedule_ids: Iterable[int]) -> Dict[int, List[Dict]]:
+    """Group the conflicts of a report by the given schedules they involve"""
+    wanted = set(schedule_ids)
+    grouped: Dict[int, List[Dict]] = defaultdict(list)
+    for conflict in report["conflicts"]:
+        for schedule_id in conflict["schedule_ids"]:
+            if schedule_id in wanted:
+                grouped[schedule_id].append(conflict)
+    return grouped
+
+def describe_conflicts(schedule_id: int, conflicts: List[Dict]) -> str:
+    """Human readable message for the conflicts of one schedule"""
+    details = []
+    for conflict in conflicts:
+        other = next(
+            (other_id for other_id in conflict["schedule_ids"] if other_id != schedule_id),
+            schedule_id
+        )
+        days = ", ".join(WEEKDAY_NAMES[day] for day in conflict["weekdays"])
+        # Rows of a bulk import take negative ids
+        label = f"schedule {other}" if other > 0 else f"imported row {-other}"
+        details.append(f"{label} ({days} {conflict['start']}-{conflict['end']})")
+    return "Schedule overlaps with the same priority as " + "; ".join(details)
+
+def operating_window(hibernation_enabled: Optional[bool], hibernation_start: Optional[str], hibernation_end: Optional[str]) -> Tuple[int, int]:
+    """Part of the day the screens are on, where uncovered gaps matter"""
+    if hibernation_enabled and hibernation_start and hibernation_end:
+        wake, sleep = parse_seconds(hibernation_end), parse_seconds(hibernation_start)
+        if wake < sleep:
+            return wake, sleep
+    return 0, SECONDS_PER_DAY
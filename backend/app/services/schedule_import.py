@@ -0,0 +1,180 @@
+"""
+Bulk schedule import
+
+A whole campaign is imported in one request: rows are validated one by one,
+content and agency references are checked with one IN query each, conflicts
+are found in memory by the sweep-line engine and the valid rows are inserted
+in batched executemany statements inside a single transaction.
+"""
+
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import time
+from typing import Dict, Iterator, List, Tuple
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert
+from app.core.events import broker
+from app.models.agency import Agency
+from app.models.content import Content
+from app.models.schedule import Schedule, days_to_mask
+from app.schemas.schedule import ScheduleCreate
+from app.services.schedule_conflicts import (
+    analyze, conflict_entry, conflicts_of, describe_conflicts, load_agencies_conflict_entries
+)
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ROWS = 50000
+
+def parse_import_body(body: bytes, content_type: str) -> List[Dict]:
+    """Read the rows of a JSON array (or {"schedules": [...]}) or CSV with a header line"""
+    text = body.decode("utf-8-sig")
+
+    if "json" in content_type:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("schedules")
+        if not isinstance(data, list):
+            raise ValueError("Expected a JSON array of schedules")
+        rows = data
+    elif "csv" in content_type or "text/plain" in content_type:
+        rows = list(csv.DictReader(io.StringIO(text)))
+    else:
+        raise ValueError("Send the schedules as application/json or text/csv")
+
+    if len(rows) > IMPORT_MAX_ROWS:
+        raise ValueError(f"At most {IMPORT_MAX_ROWS} schedules can be imported at once")
+    return rows
+
+def validate_row(row) -> Tuple[Dict, List[str]]:
+    """Validate one row, returning the column values to insert or the errors"""
+    if not isinstance(row, dict):
+        return {}, ["Row must be an object"]
+
+    # Empty CSV cells fall back to the schema defaults
+    row = {key: value for key, value in row.items() if key and value not in ("", None)}
+    if isinstance(row.get("days_of_week"), list):
+        row["days_of_week"] = ",".join(str(day) for day in row["days_of_week"])
+    elif isinstance(row.get("days_of_week"), str):
+        row["days_of_week"] = row["days_of_week"].replace(";", ",").replace("|", ",")
+
+    try:
+        schedule = ScheduleCreate(**row)
+    except ValidationError as e:
+        return {}, [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+
+    errors = []
+    try:
+        start_time = time.fromisoformat(schedule.start_time)
+        end_time = time.fromisoformat(schedule.end_time)
+        if start_time >= end_time:
+            errors.append("End time must be after start time")
+    except ValueError:
+        errors.append("Times must use the HH:MM or HH:MM:SS format")
+
+    days_mask = days_to_mask(schedule.days_of_week)
+    if not days_mask:
+        errors.append("days_of_week must list at least one day between 1 (Monday) and 7 (Sunday)")
+
+    if errors:
+        return {}, errors
+
+    return {
+        "content_id": schedule.content_id,
+        "agency_id": schedule.agency_id,
+        "start_time": start_time,
+        "end_time": end_time,
+        "days_mask": days_mask,
+        "is_active": schedule.is_active,
+        "priority": schedule.priority
+    }, []
+
+async def import_schedules(db: AsyncSession, rows: List) -> Tuple[List[Dict], Dict]:
+    """Validate and insert a batch of schedules, returning one result per row and a summary"""
+    results = [{"row": number, "status": "error", "errors": []} for number in range(1, len(rows) + 1)]
+    values: Dict[int, Dict] = {}
+
+    for index, row in enumerate(rows):
+        row_values, errors = validate_row(row)
+        if errors:
+            results[index]["errors"] = errors
+        else:
+            values[index] = row_values
+
+    # Reference checks: one IN query for contents and one for agencies
+    content_ids = {row_values["content_id"] for row_values in values.values()}
+    agency_ids = {row_values["agency_id"] for row_values in values.values()}
+
+    existing_contents = set()
+    if content_ids:
+        result = await db.execute(select(Content.id).where(Content.id.in_(content_ids)))
+        existing_contents = set(result.scalars().all())
+
+    existing_agencies = set()
+    if agency_ids:
+        result = await db.execute(select(Agency.id).where(Agency.id.in_(agency_ids)))
+        existing_agencies = set(result.scalars().all())
+
+    for index, row_values in list(values.items()):
+        errors = []
+        if row_values["content_id"] not in existing_contents:
+            errors.append("Content not found")
+        if row_values["agency_id"] not in existing_agencies:
+            errors.append("Agency not found")
+        if errors:
+            results[index]["errors"] = errors
+            del values[index]
+
+    # Conflicts against the existing schedules and between the imported rows,
+    # imported rows taking negative ids so they never collide with real ones
+    rows_by_agency: Dict[int, List[int]] = defaultdict(list)
+    for index, row_values in values.items():
+        if row_values["is_active"]:
+            rows_by_agency[row_values["agency_id"]].append(index)
+
+    existing_entries = {}
+    if rows_by_agency:
+        existing_entries = await load_agencies_conflict_entries(db, rows_by_agency)
+
+    for agency_id, indexes in rows_by_agency.items():
+        entries = list(existing_entries.get(agency_id, []))
+        for index in indexes:
+            row_values = values[index]
+            entries.append(conflict_entry(
+                -(index + 1), row_values["content_id"], row_values["priority"],
+                row_values["start_time"], row_values["end_time"], row_values["days_mask"]
+            ))
+
+        report = analyze(entries)
+        for row_id, conflicts in conflicts_of(report, [-(index + 1) for index in indexes]).items():
+            index = -row_id - 1
+            results[index]["errors"] = [describe_conflicts(row_id, conflicts)]
+            values.pop(index, None)
+
+    # Batched inserts, committed together
+    batch = [values[index] for index in sorted(values)]
+    for start in range(0, len(batch), IMPORT_BATCH_SIZE):
+        await db.execute(insert(Schedule), batch[start:start + IMPORT_BATCH_SIZE])
+    if batch:
+        await db.commit()
+
+    for index in values:
+        results[index] = {"row": index + 1, "status": "created"}
+
+    for agency_id in {row_values["agency_id"] for row_values in batch}:
+        broker.publish(agency_id, "schedule", "imported")
+
+    summary = {
+        "rows": len(rows),
+        "created": len(batch),
+        "failed": len(rows) - len(batch)
+    }
+    return results, summary
+
+def report_lines(results: List[Dict], summary: Dict) -> Iterator[str]:
+    """Render the import report as newline-delimited JSON"""
+    for result in results:
+        yield json.dumps(result) + "\n"
+    yield json.dumps({"summary": summary}) + "\n"
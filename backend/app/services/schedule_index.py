@@ -0,0 +1,172 @@
+"""
+In-memory index of the active schedules of each agency
+
+For every weekday the schedules of an agency are flattened into a sorted
+boundary table: each boundary starts a segment with a single winning
+schedule (highest priority, then lowest id). Resolving what plays at a given
+moment is a binary search without database access, and the next boundary is
+the next transition. The index of an agency is dropped on every change event
+for it and rebuilt on the next lookup, leaving the other agencies untouched.
+"""
+
+import asyncio
+import heapq
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, and_
+from app.core.events import broker
+from app.models.content import Content
+from app.models.schedule import Schedule, mask_to_days
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+def seconds_of(value: time) -> int:
+    """Seconds since midnight of a time of day"""
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+def content_payload(content: Content) -> Dict:
+    """Fields a device needs to play a content"""
+    changed_at = content.updated_at or content.created_at
+    return {
+        "id": content.id,
+        "title": content.title,
+        "content_type": content.content_type,
+        "url": content.url,
+        "file_path": content.file_path,
+        "duration": content.duration,
+        "checksum": content.checksum,
+        "updated_at": changed_at.isoformat() if changed_at else None
+    }
+
+def schedule_entry(schedule: Schedule, content: Content) -> Dict:
+    """Indexed form of a schedule, with the end made exclusive"""
+    return {
+        "schedule_id": schedule.id,
+        "priority": schedule.priority or 0,
+        "start": seconds_of(schedule.start_time),
+        "end": seconds_of(schedule.end_time) + 1,
+        "days": set(mask_to_days(schedule.days_mask)),
+        "start_time": str(schedule.start_time),
+        "end_time": str(schedule.end_time),
+        "content": content_payload(content)
+    }
+
+class AgencyScheduleIndex:
+    """Sorted boundary tables of one agency, one per weekday (Monday = 1)"""
+
+    def __init__(self, entries: List[Dict]):
+        self.tables = {
+            weekday: self.build_table([entry for entry in entries if weekday in entry["days"]])
+            for weekday in range(1, 8)
+        }
+
+    @staticmethod
+    def build_table(entries: List[Dict]) -> Tuple[List[int], List[Optional[Dict]]]:
+        """Sweep the boundaries of a day, keeping the winning schedule of each segment"""
+        # Schedules crossing midnight never match start <= now <= end, as in the API
+        entries = [entry for entry in entries if entry["start"] < entry["end"]]
+        starts = sorted(entries, key=lambda entry: entry["start"])
+        ends = sorted(entries, key=lambda entry: entry["end"])
+        points = sorted(
+            {0}
+            | {entry["start"] for entry in entries}
+            | {entry["end"] for entry in entries if entry["end"] < SECONDS_PER_DAY}
+        )
+
+        heap = []
+        active = set()
+        boundaries: List[int] = []
+        winners: List[Optional[Dict]] = []
+        next_start = next_end = 0
+
+        for point in points:
+            while next_start < len(starts) and starts[next_start]["start"] <= point:
+                entry = starts[next_start]
+                active.add(entry["schedule_id"])
+                heapq.heappush(heap, (-entry["priority"], entry["schedule_id"], entry))
+                next_start += 1
+            while next_end < len(ends) and ends[next_end]["end"] <= point:
+                active.discard(ends[next_end]["schedule_id"])
+                next_end += 1
+            while heap and heap[0][1] not in active:
+                heapq.heappop(heap)
+
+            winner = heap[0][2] if heap else None
+            if winners and winners[-1] is winner:
+                continue
+            boundaries.append(point)
+            winners.append(winner)
+
+        return boundaries, winners
+
+    def lookup(self, now: datetime) -> Tuple[Optional[Dict], Optional[datetime]]:
+        """Get the schedule in effect at now and when the next one takes over"""
+        weekday = now.isoweekday()
+        boundaries, winners = self.tables[weekday]
+        segment = bisect_right(boundaries, seconds_of(now.time())) - 1
+        current = winners[segment]
+
+        midnight = datetime.combine(now.date(), time())
+        for offset in range(8):
+            boundaries, winners = self.tables[(weekday - 1 + offset) % 7 + 1]
+            for position in range(segment + 1 if offset == 0 else 0, len(boundaries)):
+                if winners[position] is not current:
+                    return current, midnight + timedelta(days=offset, seconds=boundaries[position])
+
+        return current, None
+
+class ScheduleIndex:
+    """Per-agency indexes, built on first use and dropped on change events"""
+
+    def __init__(self):
+        self._agencies: Dict[int, AgencyScheduleIndex] = {}
+        self._generations: Dict[int, int] = defaultdict(int)
+        self._locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def on_event(self, event: Dict):
+        """Broker listener"""
+        self._generations[event["agency_id"]] += 1
+        self._agencies.pop(event["agency_id"], None)
+
+    async def get(self, db: AsyncSession, agency_id: int) -> AgencyScheduleIndex:
+        """Index of an agency, loading its active schedules when needed"""
+        index = self._agencies.get(agency_id)
+        if index is not None:
+            return index
+
+        async with self._locks[agency_id]:
+            index = self._agencies.get(agency_id)
+            if index is not None:
+                return index
+
+            generation = self._generations[agency_id]
+            result = await db.execute(
+                select(Schedule, Content)
+                .join(Content, Schedule.content_id == Content.id)
+                .where(
+                    and_(
+                        Schedule.agency_id == agency_id,
+                        Schedule.is_active == True,
+                        Content.is_active == True
+                    )
+                )
+            )
+            index = AgencyScheduleIndex([
+                schedule_entry(schedule, content) for schedule, content in result.all()
+            ])
+
+            # A write during the query makes this index stale already
+            if self._generations[agency_id] == generation:
+                self._agencies[agency_id] = index
+            return index
+
+    async def lookup(self, db: AsyncSession, agency_id: int, now: datetime) -> Tuple[Optional[Dict], Optional[datetime]]:
+        """Get the schedule of an agency in effect at now and the next transition"""
+        index = await self.get(db, agency_id)
+        return index.lookup(now)
+
+schedule_index = ScheduleIndex()
+broker.add_listener(schedule_index.on_event)
@@ -0,0 +1,196 @@
+"""
+Streaming storage of uploaded files
+
+Multipart uploads are parsed incrementally from the request stream, so the
+body is never spooled by the framework before the route runs. The file part
+is written once, straight to a temporary file of the media store through
+async file I/O; memory use does not grow with the file size and the event
+loop is never blocked on disk writes. The SHA-256, the size and the media
+type sniffed from the magic bytes are computed while parsing, and the size
+limit stops reading the request as soon as it is exceeded. The finished file
+is then renamed into place atomically by the media store.
+"""
+
+import hashlib
+from typing import Dict, List, Optional
+import anyio
+from fastapi import Request
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from app.core.media_types import SNIFF_SIZE, media_kind, sniff_media_type
+from app.services.media_store import media_store
+
+# Room for the multipart boundaries and headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Request body of the upload routes, for the API docs
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
+
+class UploadTooLarge(ValueError):
+    """The upload exceeded the size limit"""
+
+class _FilePart:
+    """Parser callbacks picking the data of one file field out of a multipart body
+
+    The callbacks run synchronously inside MultipartParser.write, so the data
+    is only collected there and written out by store_upload after each chunk.
+    """
+
+    def __init__(self, field_name: str):
+        self.field_name = field_name
+        self.headers: Dict[bytes, bytes] = {}
+        self.header_field = b""
+        self.header_value = b""
+        self.active = False
+        self.found = False
+        self.content_type = ""
+        self.pending: List[bytes] = []
+
+    def callbacks(self) -> Dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end
+        }
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        # Only the first file sent under the field name is kept
+        self.active = (
+            not self.found
+            and options.get(b"name") == self.field_name.encode()
+            and b"filename" in options
+        )
+        if self.active:
+            self.found = True
+            self.content_type = self.headers.get(b"content-type", b"").decode("latin-1")
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.active:
+            self.pending.append(data[start:end])
+
+    def on_part_end(self):
+        self.active = False
+
+async def store_upload(
+    request: Request,
+    max_size: int,
+    expected_kind: Optional[str] = None,
+    field_name: str = "file"
+) -> Dict:
+    """Stream the file field of a multipart request into a temporary file of the media store
+
+    Raises UploadTooLarge as soon as the file passes max_size bytes, or the
+    body max_size plus MULTIPART_OVERHEAD, and ValueError for a malformed
+    body, a missing file or one whose declared or sniffed media kind does not
+    match expected_kind. Nothing is left on disk when the upload is rejected;
+    accepted uploads are moved into place by media_store.put.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise ValueError("Upload must be sent as multipart/form-data")
+
+    part = _FilePart(field_name)
+    parser = MultipartParser(boundary, part.callbacks())
+    temp_path = await media_store.temp_path()
+
+    digest = hashlib.sha256()
+    received = 0
+    size = 0
+    head = b""
+    media_type = None
+
+    try:
+        async with await anyio.open_file(temp_path, "wb") as buffer:
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > max_size + MULTIPART_OVERHEAD:
+                    raise UploadTooLarge(f"File exceeds the maximum size of {max_size} bytes")
+
+                try:
+                    parser.write(chunk)
+                except MultipartParseError:
+                    raise ValueError("Malformed multipart body")
+
+                if part.pending and size == 0 and expected_kind:
+                    if not part.content_type.startswith(f"{expected_kind}/"):
+                        raise ValueError(f"File must be of type {expected_kind}")
+
+                for data in part.pending:
+                    if len(head) < SNIFF_SIZE:
+                        head += data[:SNIFF_SIZE - len(head)]
+                        if len(head) == SNIFF_SIZE:
+                            media_type = sniff_media_type(head)
+                            if expected_kind and media_kind(media_type) != expected_kind:
+                                raise ValueError(f"File content is not a valid {expected_kind}")
+
+                    size += len(data)
+                    if size > max_size:
+                        raise UploadTooLarge(f"File exceeds the maximum size of {max_size} bytes")
+
+                    digest.update(data)
+                    await buffer.write(data)
+                part.pending.clear()
+
+            await buffer.flush()
+
+        try:
+            parser.finalize()
+        except MultipartParseError:
+            raise ValueError("Malformed multipart body")
+
+        if not part.found:
+            raise ValueError(f"No file was sent in the {field_name} field")
+        if size == 0:
+            raise ValueError("File is empty")
+
+        if len(head) < SNIFF_SIZE:
+            # Files shorter than the longest magic prefix
+            media_type = sniff_media_type(head)
+            if expected_kind and media_kind(media_type) != expected_kind:
+                raise ValueError(f"File content is not a valid {expected_kind}")
+    except BaseException:
+        # Also covers cancellation when the client disconnects mid-upload
+        with anyio.CancelScope(shield=True):
+            await anyio.Path(temp_path).unlink(missing_ok=True)
+        raise
+
+    return {
+        "temp_path": temp_path,
+        "size": size,
+        "checksum": digest.hexdigest(),
+        "media_type": media_type,
+        "kind": media_kind(media_type)
+    }
@@ -0,0 +1,97 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_FLUSH_INTERVAL = 5  # seconds
+
+
+class HeartbeatBuffer:
+    """
+    Latest unwritten heartbeat of every device. Heartbeats used to cost a
+    save each, and on SQLite every write takes the single writer lock; they
+    are now kept here, the last one of a device winning, and written by a
+    background thread every few seconds as one batched UPDATE.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, device_id, status, last_seen, version=None):
+        """
+        Accept a heartbeat, replacing any unwritten one of the device.
+        """
+        with self._lock:
+            previous = self._pending.get(device_id)
+            if not version and previous:
+                # Keep the version of an earlier heartbeat that had one
+                version = previous[2]
+            self._pending[device_id] = (status, last_seen, version)
+            if self._thread is None:
+                self._start()
+
+    def apply(self, device):
+        """
+        Set the unwritten heartbeat of a device on its loaded row.
+        """
+        with self._lock:
+            pending = self._pending.get(device.pk)
+        if pending:
+            device.status, device.last_seen = pending[0], pending[1]
+            if pending[2]:
+                device.version = pending[2]
+        return device
+
+    def flush(self):
+        """
+        Write the pending heartbeats in one transaction.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        from .models import Device
+
+        rows = [
+            Device(pk=device_id, status=status, last_seen=last_seen, version=version or '')
+            for device_id, (status, last_seen, version) in batch.items()
+        ]
+        try:
+            with transaction.atomic():
+                Device.objects.bulk_update(rows, ['status', 'last_seen'])
+                Device.objects.bulk_update([row for row in rows if row.version], ['version'])
+        except Exception:
+            # Put the batch back, without overwriting newer heartbeats
+            with self._lock:
+                for device_id, heartbeat in batch.items():
+                    self._pending.setdefault(device_id, heartbeat)
+            raise
+        return len(rows)
+
+    def _start(self):
+        """
+        Start the flushing thread on the first heartbeat of the process.
+        """
+        self._thread = threading.Thread(target=self._run, name='heartbeat-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Error writing device heartbeats')
+
+
+heartbeat_buffer = HeartbeatBuffer(HEARTBEAT_FLUSH_INTERVAL)
@@ -93,37 +93,29 @@ class Device(models.Model):
 
     def update_status(self, status, version=None):
         """
-        Update device status and last seen time.
+        Update device status and last seen time. The change is buffered and
+        written with the heartbeats of other devices a few seconds later.
         """
         from django.utils import timezone
+        from .heartbeats import heartbeat_buffer
         self.status = status
         self.last_seen = timezone.now()
         if version:
             self.version = version
-        self.save(update_fields=['status', 'last_seen', 'version'])
+        heartbeat_buffer.record(self.pk, self.status, self.last_seen, version)
 
     def get_current_content(self):
         """
         Get the content that should be displayed now based on schedules.
         """
         from django.utils import timezone
-        from schedules.models import Schedule
-
-        now = timezone.now()
-        current_time = now.time()
-        current_day = now.weekday()  # 0=Monday, 6=Sunday
-
-        # Find active schedules for this agency's content that match current time and day
-        schedules = Schedule.objects.filter(
-            content__agency=self.agency,
-            content__is_active=True,
-            is_active=True,
-            days_of_week__contains=[current_day],
-            start_time__lte=current_time,
-            end_time__gte=current_time
-        ).select_related('content').order_by('-priority')
-
-        if schedules.exists():
-            return schedules.first().content
+        from apps.schedules.index import schedule_index
+
+        # Schedule times are local wall-clock times
+        now = timezone.localtime().replace(tzinfo=None)
+        schedule, _ = schedule_index.lookup(self.agency_id, now)
+
+        if schedule:
+            return schedule.content
 
         return None
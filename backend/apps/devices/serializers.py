@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from .heartbeats import heartbeat_buffer
 from .models import Device
 
 
@@ -15,6 +16,10 @@ class DeviceSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at', 'last_seen']
 
+    def to_representation(self, instance):
+        # Show heartbeats that are not written yet
+        return super().to_representation(heartbeat_buffer.apply(instance))
+
     def get_current_content(self, obj):
         content = obj.get_current_content()
         if content:
@@ -0,0 +1,200 @@
+import heapq
+import threading
+import time as clock
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Other worker processes only learn about writes through this expiry
+INDEX_MAX_AGE = 300  # seconds
+
+
+def seconds_of(value):
+    """
+    Seconds since midnight of a time of day.
+    """
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+class AgencyScheduleIndex:
+    """
+    Sorted boundary tables of the active schedules of one agency, one per
+    weekday (0=Monday). Each boundary starts a segment with a single winning
+    schedule, so a lookup is a binary search and the next boundary is the
+    next transition.
+    """
+
+    def __init__(self, schedules):
+        self.built_at = clock.monotonic()
+        entries = [
+            {
+                'schedule': schedule,
+                'priority': schedule.priority,
+                'start': seconds_of(schedule.start_time),
+                'end': seconds_of(schedule.end_time) + 1,  # end time is inclusive
+                'days': set(schedule.days_of_week),
+            }
+            for schedule in schedules
+        ]
+        self.tables = {
+            day: self.build_table([entry for entry in entries if day in entry['days']])
+            for day in range(7)
+        }
+
+    @staticmethod
+    def build_table(entries):
+        """
+        Sweep the boundaries of a day, keeping the winning schedule of each segment.
+        """
+        entries = [entry for entry in entries if entry['start'] < entry['end']]
+        starts = sorted(entries, key=lambda entry: entry['start'])
+        ends = sorted(entries, key=lambda entry: entry['end'])
+        points = sorted(
+            {0}
+            | {entry['start'] for entry in entries}
+            | {entry['end'] for entry in entries if entry['end'] < SECONDS_PER_DAY}
+        )
+
+        heap = []
+        active = set()
+        boundaries = []
+        winners = []
+        next_start = next_end = 0
+
+        for point in points:
+            while next_start < len(starts) and starts[next_start]['start'] <= point:
+                entry = starts[next_start]
+                active.add(entry['schedule'].pk)
+                heapq.heappush(heap, (-entry['priority'], entry['schedule'].pk, entry['schedule']))
+                next_start += 1
+            while next_end < len(ends) and ends[next_end]['end'] <= point:
+                active.discard(ends[next_end]['schedule'].pk)
+                next_end += 1
+            while heap and heap[0][1] not in active:
+                heapq.heappop(heap)
+
+            winner = heap[0][2] if heap else None
+            if winners and winners[-1] is winner:
+                continue
+            boundaries.append(point)
+            winners.append(winner)
+
+        return boundaries, winners
+
+    def lookup(self, now):
+        """
+        Return the schedule in effect at now (naive local time) and the
+        moment the next one takes over, or None when nothing changes.
+        """
+        day = now.weekday()
+        boundaries, winners = self.tables[day]
+        segment = bisect_right(boundaries, seconds_of(now.time())) - 1
+        current = winners[segment]
+
+        midnight = datetime.combine(now.date(), time())
+        for offset in range(8):
+            boundaries, winners = self.tables[(day + offset) % 7]
+            for position in range(segment + 1 if offset == 0 else 0, len(boundaries)):
+                if winners[position] is not current:
+                    return current, midnight + timedelta(days=offset, seconds=boundaries[position])
+
+        return current, None
+
+
+class ScheduleIndex:
+    """
+    Per-agency indexes, built on first use and dropped when a schedule or
+    content of the agency is written. Every drop bumps the generation of the
+    agency, so an index built from rows read before a write is never kept.
+    """
+
+    def __init__(self):
+        self._agencies = {}
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def invalidate(self, agency_id):
+        """
+        Drop the index of an agency; it is rebuilt on the next lookup.
+        """
+        with self._lock:
+            self._generations[agency_id] += 1
+            self._agencies.pop(agency_id, None)
+
+    def get(self, agency_id):
+        """
+        Return the index of an agency, rebuilding it when missing or expired.
+        """
+        with self._lock:
+            index = self._agencies.get(agency_id)
+            generation = self._generations[agency_id]
+        if index is not None and clock.monotonic() - index.built_at < INDEX_MAX_AGE:
+            return index
+
+        from .models import Schedule
+
+        schedules = Schedule.objects.filter(
+            content__agency_id=agency_id,
+            content__is_active=True,
+            is_active=True
+        ).select_related('content')
+        index = AgencyScheduleIndex(schedules)
+
+        with self._lock:
+            # A write during the rebuild may not be in the rows read above
+            if self._generations[agency_id] == generation:
+                self._agencies[agency_id] = index
+        return index
+
+    def lookup(self, agency_id, now):
+        """
+        Return the schedule of an agency in effect at now and the next transition.
+        """
+        return self.get(agency_id).lookup(now)
+
+
+schedule_index = ScheduleIndex()
+
+
+@receiver(pre_save, sender='schedules.Schedule')
+@receiver(pre_save, sender='content.Content')
+def remember_previous_agency(sender, instance, **kwargs):
+    """
+    Keep the agency a row belonged to, so moving it invalidates both agencies.
+    """
+    if not instance.pk:
+        return
+    if sender.__name__ == 'Schedule':
+        previous = sender.objects.filter(pk=instance.pk).values_list('content__agency_id', flat=True).first()
+    else:
+        previous = sender.objects.filter(pk=instance.pk).values_list('agency_id', flat=True).first()
+    instance._previous_agency_id = previous
+
+
+@receiver(post_save, sender='schedules.Schedule')
+@receiver(post_delete, sender='schedules.Schedule')
+@receiver(post_save, sender='content.Content')
+@receiver(post_delete, sender='content.Content')
+def invalidate_schedule_index(sender, instance, **kwargs):
+    """
+    Drop the index of the agency a schedule or content belongs to.
+    """
+    if sender.__name__ == 'Schedule':
+        try:
+            agency_id = instance.content.agency_id
+        except ObjectDoesNotExist:
+            # Deleted along with its content, whose own signal covers the agency
+            return
+    else:
+        agency_id = instance.agency_id
+
+    schedule_index.invalidate(agency_id)
+    previous = getattr(instance, '_previous_agency_id', None)
+    if previous is not None and previous != agency_id:
+        schedule_index.invalidate(previous)
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+
+def days_to_mask(apps, schema_editor):
+    Schedule = apps.get_model('schedules', 'Schedule')
+    schedules = list(Schedule.objects.only('pk', 'days_of_week'))
+    for schedule in schedules:
+        mask = 0
+        for day in schedule.days_of_week or []:
+            if 0 <= int(day) <= 6:
+                mask |= 1 << int(day)
+        schedule.days_mask = mask
+    Schedule.objects.bulk_update(schedules, ['days_mask'], batch_size=500)
+
+
+def mask_to_days(apps, schema_editor):
+    Schedule = apps.get_model('schedules', 'Schedule')
+    schedules = list(Schedule.objects.only('pk', 'days_mask'))
+    for schedule in schedules:
+        schedule.days_of_week = [day for day in range(7) if schedule.days_mask & (1 << day)]
+    Schedule.objects.bulk_update(schedules, ['days_of_week'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='days_mask',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Bitmask of days (bit 0=Monday, bit 6=Sunday)', verbose_name='Days of Week'),
+        ),
+        migrations.RunPython(days_to_mask, mask_to_days),
+        migrations.RemoveField(
+            model_name='schedule',
+            name='days_of_week',
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['content', 'is_active', 'days_mask', 'start_time', 'end_time'], name='schedule_match_idx'),
+        ),
+    ]
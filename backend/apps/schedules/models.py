@@ -3,6 +3,24 @@ from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 
 
+def days_to_mask(days):
+    """
+    Convert a list of days (0=Monday, 6=Sunday) into a bitmask.
+    """
+    mask = 0
+    for day in days:
+        if 0 <= int(day) <= 6:
+            mask |= 1 << int(day)
+    return mask
+
+
+def mask_to_days(mask):
+    """
+    Convert a bitmask into a sorted list of days (0=Monday, 6=Sunday).
+    """
+    return [day for day in range(7) if mask & (1 << day)]
+
+
 class Schedule(models.Model):
     """
     Model for content scheduling.
@@ -32,9 +50,9 @@ class Schedule(models.Model):
         verbose_name=_('End Time')
     )
 
-    days_of_week = models.JSONField(
-        default=list,
-        help_text=_('List of days (0=Monday, 6=Sunday)'),
+    days_mask = models.PositiveSmallIntegerField(
+        default=0,
+        help_text=_('Bitmask of days (bit 0=Monday, bit 6=Sunday)'),
         verbose_name=_('Days of Week')
     )
 
@@ -63,10 +81,36 @@ class Schedule(models.Model):
         verbose_name = _('Schedule')
         verbose_name_plural = _('Schedules')
         ordering = ['-priority', 'start_time']
+        indexes = [
+            models.Index(
+                fields=['content', 'is_active', 'days_mask', 'start_time', 'end_time'],
+                name='schedule_match_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.content.title} - {self.start_time} to {self.end_time}"
 
+    @property
+    def days_of_week(self):
+        """
+        List of days (0=Monday, 6=Sunday).
+        """
+        return mask_to_days(self.days_mask)
+
+    @days_of_week.setter
+    def days_of_week(self, days):
+        self.days_mask = days_to_mask(days)
+
+    @classmethod
+    def on_days(cls, queryset, mask):
+        """
+        Filter a queryset to the schedules running on any day of a bitmask.
+        """
+        return queryset.annotate(
+            matching_days=models.F('days_mask').bitand(mask)
+        ).filter(matching_days__gt=0)
+
     def clean(self):
         if self.start_time >= self.end_time:
             raise ValidationError(_('End time must be after start time.'))
@@ -79,12 +123,15 @@ class Schedule(models.Model):
             models.Q(start_time__lt=self.end_time, end_time__gt=self.start_time)
         )
 
-        for schedule in overlapping:
-            if set(self.days_of_week) & set(schedule.days_of_week):
-                raise ValidationError(_('Schedule overlaps with existing schedule.'))
+        if Schedule.on_days(overlapping, self.days_mask).exists():
+            raise ValidationError(_('Schedule overlaps with existing schedule.'))
 
     def get_days_display(self):
         """
         Return human-readable days of week.
         """
         return [dict(self.DAYS_OF_WEEK)[day] for day in self.days_of_week if day in dict(self.DAYS_OF_WEEK)]
+
+
+# Registers the signals that keep the schedule index up to date
+from .index import schedule_index  # noqa: E402,F401
@@ -1,8 +1,12 @@
 from rest_framework import serializers
-from .models import Schedule
+from .models import Schedule, days_to_mask
 
 
 class ScheduleSerializer(serializers.ModelSerializer):
+    days_of_week = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6),
+        default=list
+    )
     content_title = serializers.CharField(source='content.title', read_only=True)
     agency_name = serializers.CharField(source='content.agency.name', read_only=True)
     days_display = serializers.SerializerMethodField()
@@ -41,8 +45,7 @@ class ScheduleSerializer(serializers.ModelSerializer):
             Q(start_time__lt=end_time, end_time__gt=start_time)
         )
 
-        for schedule in overlapping:
-            if set(days_of_week) & set(schedule.days_of_week):
-                raise serializers.ValidationError("Schedule overlaps with existing schedule.")
+        if Schedule.on_days(overlapping, days_to_mask(days_of_week)).exists():
+            raise serializers.ValidationError("Schedule overlaps with existing schedule.")
 
         return data
@@ -51,12 +51,11 @@ class ScheduleViewSet(viewsets.ModelViewSet):
         current_time = now.time()
         current_day = now.weekday()
 
-        schedules = self.get_queryset().filter(
+        schedules = Schedule.on_days(self.get_queryset().filter(
             is_active=True,
-            days_of_week__contains=[current_day],
             start_time__lte=current_time,
             end_time__gte=current_time
-        ).order_by('-priority')
+        ), 1 << current_day).order_by('-priority')
 
         serializer = self.get_serializer(schedules, many=True)
         return Response(serializer.data)
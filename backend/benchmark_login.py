@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Login storm benchmark for the Digital Signage API
+
+Simulates the burst of logins at branch opening time against a running API
+and measures, at the same time, the latency of an unrelated endpoint that
+devices keep polling. With bcrypt off the event loop the unrelated p99 stays
+close to its idle value while logins are limited by the password pool.
+
+Usage:
+    python benchmark_login.py --username admin --password secret \\
+        --concurrency 50 --duration 20
+"""
+
+import argparse
+import asyncio
+import math
+import statistics
+import time
+from typing import List
+import httpx
+from app.core.config import settings
+
+BASE_URL = f"http://{settings.API_HOST}:{settings.API_PORT}"
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def describe(name: str, samples: List[float]) -> str:
+    """One line summary of latencies in milliseconds"""
+    if not samples:
+        return f"{name}: no samples"
+    return (
+        f"{name}: n={len(samples)} "
+        f"p50={percentile(samples, 0.50) * 1000:.1f}ms "
+        f"p99={percentile(samples, 0.99) * 1000:.1f}ms "
+        f"max={max(samples) * 1000:.1f}ms "
+        f"mean={statistics.mean(samples) * 1000:.1f}ms"
+    )
+
+async def login_worker(client: httpx.AsyncClient, args, deadline: float, latencies: List[float], statuses: dict):
+    """Log in repeatedly until the deadline"""
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            response = await client.post(
+                f"{settings.API_V1_STR}/auth/login",
+                data={"username": args.username, "password": args.password}
+            )
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                latencies.append(time.monotonic() - started)
+            elif response.status_code == 503:
+                await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+        except httpx.HTTPError:
+            statuses["error"] = statuses.get("error", 0) + 1
+
+async def probe_worker(client: httpx.AsyncClient, path: str, deadline: float, latencies: List[float], interval: float):
+    """Poll an unrelated endpoint until the deadline"""
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            await client.get(path)
+            latencies.append(time.monotonic() - started)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+async def measure_probe(client: httpx.AsyncClient, path: str, seconds: float, interval: float) -> List[float]:
+    """Latencies of the unrelated endpoint without load"""
+    latencies: List[float] = []
+    await probe_worker(client, path, time.monotonic() + seconds, latencies, interval)
+    return latencies
+
+async def run_benchmark(args):
+    """Run the idle baseline, then the login storm"""
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        print(f"Login storm against {args.base_url} ({args.concurrency} clients, {args.duration}s)")
+
+        baseline = await measure_probe(client, args.probe_path, args.baseline, args.probe_interval)
+        print(describe(f"{args.probe_path} idle", baseline))
+
+        login_latencies: List[float] = []
+        probe_latencies: List[float] = []
+        statuses: dict = {}
+        started = time.monotonic()
+        deadline = started + args.duration
+
+        await asyncio.gather(
+            probe_worker(client, args.probe_path, deadline, probe_latencies, args.probe_interval),
+            *(
+                login_worker(client, args, deadline, login_latencies, statuses)
+                for _ in range(args.concurrency)
+            )
+        )
+        elapsed = time.monotonic() - started
+
+        print(f"Logins: {len(login_latencies)} ok in {elapsed:.1f}s = {len(login_latencies) / elapsed:.1f} logins/s")
+        print(f"Login status codes: {statuses}")
+        print(describe("login", login_latencies))
+        print(describe(f"{args.probe_path} during storm", probe_latencies))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure login throughput and unrelated endpoint latency during a login storm")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of login storm")
+    parser.add_argument("--baseline", type=float, default=5, help="seconds of idle probing before the storm")
+    parser.add_argument("--probe-path", default="/health", help="unrelated endpoint to time")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="seconds between probes")
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Checks of the schedule conflict engine (pure functions, no database)
+"""
+
+import random
+from datetime import time
+from app.models.schedule import days_to_mask
+from app.services.schedule_conflicts import (
+    analyze, candidate_conflicts, conflict_entry, conflicts_of, operating_window
+)
+
+def entry(schedule_id, start, end, days="1,2,3,4,5", priority=1, content_id=None):
+    return conflict_entry(schedule_id, content_id or schedule_id, priority, start, end, days_to_mask(days))
+
+def test_touching_slots_do_not_overlap():
+    entries = [entry(1, "08:00", "09:59:59"), entry(2, "10:00", "12:00")]
+    assert analyze(entries)["overlaps"] == []
+    assert candidate_conflicts(entries[:1], entries[1]) == []
+
+def test_end_time_is_inclusive():
+    entries = [entry(1, "08:00", "10:00"), entry(2, "10:00", "12:00")]
+    conflicts = analyze(entries)["conflicts"]
+    assert [(c["start"], c["end"]) for c in conflicts] == [("10:00:00", "10:00:00")]
+
+def test_only_priority_ties_of_different_contents_conflict():
+    base = entry(1, "08:00", "12:00")
+    assert candidate_conflicts([base], entry(2, "09:00", "10:00", priority=2)) == []
+    assert candidate_conflicts([base], entry(2, "09:00", "10:00", content_id=1)) == []
+
+    conflicts = candidate_conflicts([base], entry(2, "09:00", "10:00", days="5,6"))
+    assert conflicts == [{
+        "schedule_ids": [1, 2],
+        "weekdays": [5],
+        "start": "09:00:00",
+        "end": "10:00:00",
+        "priority_tie": True,
+        "same_content": False
+    }]
+
+def test_candidate_conflicts_match_the_full_analysis():
+    rng = random.Random(7)
+    for _ in range(200):
+        entries = []
+        for schedule_id in range(1, 9):
+            start = rng.randrange(0, 23 * 3600, 900)
+            end = start + rng.randrange(0, 4 * 3600, 900)
+            days = ",".join(str(day) for day in range(1, 8) if rng.random() < 0.4)
+            entries.append(conflict_entry(
+                schedule_id, rng.randint(1, 3), rng.randint(1, 2),
+                time(start // 3600, start % 3600 // 60), time(min(end // 3600, 23), end % 3600 // 60),
+                days_to_mask(days)
+            ))
+        candidate, others = entries[0], entries[1:]
+
+        expected = conflicts_of(analyze(entries), [1]).get(1, [])
+        assert sorted(map(repr, candidate_conflicts(others, candidate))) == sorted(map(repr, expected))
+
+def test_gaps_are_only_reported_inside_the_operating_window():
+    window = operating_window(True, "18:00", "08:00")
+    report = analyze([entry(1, "09:00", "12:00", days="1")], window)
+    assert report["gaps"] == [
+        {"weekdays": [1], "start": "08:00:00", "end": "08:59:59"},
+        {"weekdays": [2, 3, 4, 5, 6, 7], "start": "08:00:00", "end": "17:59:59"},
+        {"weekdays": [1], "start": "12:00:01", "end": "17:59:59"}
+    ]
+
+def test_a_window_crossing_midnight_covers_the_whole_day():
+    assert operating_window(True, "08:00", "18:00") == (0, 24 * 60 * 60)
+    assert operating_window(False, "18:00", "08:00") == (0, 24 * 60 * 60)
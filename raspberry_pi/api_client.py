@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Asynchronous API client for the Raspberry Pi player
+Sicoob Credisete - Sistema de Sinalização Digital
+
+All player requests share one pooled keep-alive connection set, so status,
+manifest and content calls run concurrently on the event loop without
+opening a new TCP connection each time. Failed calls are retried with
+jittered exponential backoff. JSON documents are revalidated with their
+ETag, so an unchanged document costs a header round trip only. Requests
+carry the device API key issued at provisioning.
+"""
+
+import asyncio
+import logging
+import random
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10  # seconds
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 10  # seconds
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def device_auth_headers(device_key: Optional[str]) -> Dict[str, str]:
+    """Authorization header carrying the device API key, if one is provisioned"""
+    return {"Authorization": f"Device {device_key}"} if device_key else {}
+
+
+def device_id_from_key(device_key: Optional[str]) -> Optional[int]:
+    """Server id of the device a key was issued to (keys look like dk1.<id>.<serial>.<kid>.<mac>)"""
+    parts = (device_key or "").split(".")
+    if len(parts) == 5 and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
+
+class ApiClient:
+    """Pooled async HTTP client with per-call timeouts and retries"""
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        max_connections: int = 4,
+        device_key: Optional[str] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.device_key = device_key
+        self.timeout = timeout
+        self.retries = retries
+        # ETag and parsed body of the last 200 answer of each GET path
+        self._validators: Dict[str, Tuple[str, Any]] = {}
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=device_auth_headers(device_key),
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=120,
+            ),
+        )
+
+    @staticmethod
+    def backoff_delay(attempt: int) -> float:
+        """Full-jitter exponential backoff for the given attempt"""
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        **kwargs
+    ) -> Optional[httpx.Response]:
+        """Send a request, retrying connection errors and transient server errors"""
+        retries = self.retries if retries is None else retries
+        timeout = self.timeout if timeout is None else timeout
+
+        for attempt in range(retries + 1):
+            try:
+                response = await self._client.request(method, path, timeout=timeout, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                    return response
+                logger.warning(f"{method} {path} returned {response.status_code}, retrying")
+            except httpx.HTTPError as e:
+                if attempt == retries:
+                    logger.error(f"{method} {path} failed after {retries + 1} attempts: {e}")
+                    return None
+                logger.warning(f"{method} {path} failed ({e.__class__.__name__}), retrying")
+
+            await asyncio.sleep(self.backoff_delay(attempt))
+
+        return None
+
+    async def get_json(self, path: str, **kwargs) -> Optional[Any]:
+        """GET a JSON document, returning None on any failure"""
+        validator = self._validators.get(path)
+        if validator:
+            kwargs["headers"] = {**kwargs.get("headers", {}), "If-None-Match": validator[0]}
+
+        response = await self.request("GET", path, **kwargs)
+        if response is None:
+            return None
+        if response.status_code == 304 and validator:
+            return validator[1]
+        if response.status_code != 200:
+            logger.warning(f"GET {path} returned {response.status_code}")
+            return None
+
+        body = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self._validators[path] = (etag, body)
+        else:
+            self._validators.pop(path, None)
+        return body
+
+    async def post_json(self, path: str, payload: Dict, **kwargs) -> Optional[httpx.Response]:
+        """POST a JSON payload"""
+        return await self.request("POST", path, json=payload, **kwargs)
+
+    async def close(self):
+        """Close the pooled connections"""
+        await self._client.aclose()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+HDMI-CEC controller for the Raspberry Pi player
+Sicoob Credisete - Sistema de Sinalização Digital
+
+Keeps one cec-client session open and tracks the known TV power state, so
+standby/on commands are only sent when the desired state changes. A fake
+backend allows running the player on a normal Linux box without a TV.
+"""
+
+import asyncio
+import logging
+import re
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+POWER_ON = "on"
+POWER_STANDBY = "standby"
+POWER_UNKNOWN = "unknown"
+
+QUERY_TIMEOUT = 5  # seconds
+
+POWER_STATUS_PATTERN = re.compile(r"power status:\s*(\S+)")
+
+
+class CecClientBackend:
+    """Persistent cec-client process fed through its standard input"""
+
+    def __init__(self, executable: str = "cec-client", device_address: int = 0):
+        self.executable = executable
+        self.device_address = device_address
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._power_reply: Optional[asyncio.Future] = None
+
+    @property
+    def is_running(self) -> bool:
+        """Check if the cec-client session is alive"""
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        """Open the cec-client session (log level 1: errors only)"""
+        self.process = await asyncio.create_subprocess_exec(
+            self.executable, "-d", "1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader_task = asyncio.create_task(self._read_output())
+        logger.info("cec-client session started")
+
+    async def _read_output(self):
+        """Consume cec-client output, picking up power status replies"""
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                break
+            match = POWER_STATUS_PATTERN.search(line.decode(errors="replace"))
+            if match and self._power_reply and not self._power_reply.done():
+                self._power_reply.set_result(match.group(1))
+
+    async def send(self, command: str):
+        """Send a command line to the session, restarting it if needed"""
+        if not self.is_running:
+            await self.start()
+        self.process.stdin.write(f"{command}\n".encode())
+        await self.process.stdin.drain()
+
+    async def standby(self):
+        """Put the TV in standby"""
+        await self.send(f"standby {self.device_address}")
+
+    async def power_on(self):
+        """Turn the TV on"""
+        await self.send(f"on {self.device_address}")
+
+    async def query_power(self) -> str:
+        """Ask the TV for its power status"""
+        self._power_reply = asyncio.get_running_loop().create_future()
+        await self.send(f"pow {self.device_address}")
+        try:
+            status = await asyncio.wait_for(self._power_reply, QUERY_TIMEOUT)
+        except asyncio.TimeoutError:
+            return POWER_UNKNOWN
+        finally:
+            self._power_reply = None
+
+        if status == POWER_ON or status.endswith("on"):
+            return POWER_ON
+        if status == POWER_STANDBY or status.endswith("standby"):
+            return POWER_STANDBY
+        return POWER_UNKNOWN
+
+    async def close(self):
+        """Close the session"""
+        if self._reader_task:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self.is_running:
+            try:
+                self.process.stdin.write(b"q\n")
+                await self.process.stdin.drain()
+                await asyncio.wait_for(self.process.wait(), 3)
+            except (asyncio.TimeoutError, ConnectionError):
+                self.process.kill()
+        self.process = None
+
+
+class FakeCecBackend:
+    """In-memory TV used for development and tests on a normal Linux box"""
+
+    def __init__(self, power: str = POWER_ON):
+        self.power = power
+        self.commands: List[str] = []
+
+    async def start(self):
+        """Nothing to open"""
+
+    async def standby(self):
+        """Record a standby command"""
+        self.commands.append("standby")
+        self.power = POWER_STANDBY
+
+    async def power_on(self):
+        """Record an on command"""
+        self.commands.append("on")
+        self.power = POWER_ON
+
+    async def query_power(self) -> str:
+        """Report the simulated power state"""
+        self.commands.append("pow")
+        return self.power
+
+    async def close(self):
+        """Nothing to close"""
+
+
+class CecController:
+    """Edge-triggered TV power control on top of a CEC backend"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or CecClientBackend()
+        self.power_state = POWER_UNKNOWN
+
+    @classmethod
+    def from_name(cls, name: str) -> "CecController":
+        """Build a controller for a configured backend name ("cec-client" or "fake")"""
+        if name == "fake":
+            return cls(FakeCecBackend())
+        return cls(CecClientBackend())
+
+    async def set_power(self, on: bool) -> bool:
+        """Move the TV to the desired state, sending a command only on transitions"""
+        desired = POWER_ON if on else POWER_STANDBY
+        if self.power_state == desired:
+            return False
+
+        try:
+            if on:
+                await self.backend.power_on()
+            else:
+                await self.backend.standby()
+        except Exception as e:
+            logger.error(f"Error sending TV {desired} command: {e}")
+            self.power_state = POWER_UNKNOWN
+            return False
+
+        logger.info(f"TV power: {self.power_state} -> {desired}")
+        self.power_state = desired
+        return True
+
+    async def refresh(self):
+        """Re-read the power state from the TV (e.g. after it was switched by hand)"""
+        try:
+            state = await self.backend.query_power()
+        except Exception as e:
+            logger.error(f"Error querying TV power status: {e}")
+            return
+
+        # TVs that do not answer keep the state we last commanded
+        if state != POWER_UNKNOWN and state != self.power_state:
+            logger.info(f"TV reported power {state} (expected {self.power_state})")
+            self.power_state = state
+
+    async def close(self):
+        """Close the CEC session"""
+        await self.backend.close()
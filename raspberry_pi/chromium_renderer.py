@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Persistent Chromium renderer for the Raspberry Pi player
+Sicoob Credisete - Sistema de Sinalização Digital
+
+Instead of launching a new kiosk browser for every link, one Chromium
+instance is kept alive and driven through the DevTools protocol:
+- Each page is opened in a tab and the previous tab is closed
+- The next page can be preloaded in a background tab and brought to the
+  front at the slot boundary, so a switch takes milliseconds
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import subprocess
+import time
+from typing import Dict, Optional
+
+import httpx
+import websockets
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEBUGGING_PORT = 9222
+DEFAULT_USER_DATA_DIR = "/home/pi/.config/chromium-signage"
+STARTUP_TIMEOUT = 30  # seconds
+COMMAND_TIMEOUT = 10  # seconds
+
+CHROMIUM_FLAGS = [
+    "--kiosk",
+    "--no-sandbox",
+    "--disable-gpu",
+    "--disable-software-rasterizer",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-plugins",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--disable-default-apps",
+    "--disable-translate",
+    "--disable-background-timer-throttling",
+    "--disable-renderer-backgrounding",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-ipc-flooding-protection",
+]
+
+
+class DevToolsError(Exception):
+    """Error returned by a DevTools protocol command"""
+
+
+class ChromiumRenderer:
+    """Long-lived Chromium kiosk controlled over the remote-debugging protocol"""
+
+    def __init__(
+        self,
+        debugging_port: int = DEFAULT_DEBUGGING_PORT,
+        user_data_dir: str = DEFAULT_USER_DATA_DIR,
+        executable: str = "chromium-browser",
+    ):
+        self.debugging_port = debugging_port
+        self.user_data_dir = user_data_dir
+        self.executable = executable
+
+        self.process: Optional[subprocess.Popen] = None
+        self.current_target: Optional[str] = None
+        self.current_url: Optional[str] = None
+        self.preloaded: Dict[str, str] = {}  # url -> target id
+
+        self._websocket = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def is_running(self) -> bool:
+        """Check if the browser and its DevTools connection are alive"""
+        return (
+            self.process is not None
+            and self.process.poll() is None
+            and self._websocket is not None
+            and self._reader_task is not None
+            and not self._reader_task.done()
+        )
+
+    async def start(self):
+        """Launch Chromium once and connect to its DevTools endpoint"""
+        await self.stop()
+
+        logger.info("Starting persistent Chromium renderer")
+        self.process = subprocess.Popen([
+            self.executable,
+            *CHROMIUM_FLAGS,
+            f"--remote-debugging-port={self.debugging_port}",
+            "--remote-debugging-address=127.0.0.1",
+            f"--user-data-dir={self.user_data_dir}",
+            "about:blank"
+        ])
+
+        browser_url = await self._wait_for_devtools()
+        self._websocket = await websockets.connect(browser_url, max_size=None)
+        self._reader_task = asyncio.create_task(self._read_messages())
+
+        # Adopt the initial about:blank tab as the visible page
+        targets = await self.send("Target.getTargets")
+        pages = [t for t in targets.get("targetInfos", []) if t.get("type") == "page"]
+        self.current_target = pages[0]["targetId"] if pages else None
+        self.current_url = "about:blank"
+
+        logger.info("Chromium renderer ready")
+
+    async def _wait_for_devtools(self) -> str:
+        """Wait until the DevTools HTTP endpoint answers and return the browser socket URL"""
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        async with httpx.AsyncClient(timeout=2) as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError("Chromium exited during startup")
+                try:
+                    response = await client.get(f"http://127.0.0.1:{self.debugging_port}/json/version")
+                    return response.json()["webSocketDebuggerUrl"]
+                except (httpx.HTTPError, KeyError, ValueError):
+                    await asyncio.sleep(0.5)
+        raise RuntimeError("Timed out waiting for Chromium DevTools endpoint")
+
+    async def _read_messages(self):
+        """Dispatch DevTools responses to the commands waiting for them"""
+        try:
+            async for message in self._websocket:
+                data = json.loads(message)
+                future = self._pending.pop(data.get("id"), None)
+                if future and not future.done():
+                    if "error" in data:
+                        future.set_exception(DevToolsError(data["error"].get("message")))
+                    else:
+                        future.set_result(data.get("result", {}))
+        except websockets.ConnectionClosed:
+            logger.warning("DevTools connection closed")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(DevToolsError("DevTools connection closed"))
+            self._pending.clear()
+
+    async def send(self, method: str, params: Dict = None) -> Dict:
+        """Send a DevTools command and wait for its result"""
+        message_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+
+        await self._websocket.send(json.dumps({"id": message_id, "method": method, "params": params or {}}))
+        return await asyncio.wait_for(future, COMMAND_TIMEOUT)
+
+    async def _ensure_running(self):
+        """Restart the browser if it crashed or was never started"""
+        if not self.is_running:
+            self.preloaded.clear()
+            await self.start()
+
+    async def preload(self, url: str):
+        """Open a page in a hidden tab so it is already rendered when shown"""
+        if url == self.current_url or url in self.preloaded:
+            return
+
+        await self._ensure_running()
+        result = await self.send("Target.createTarget", {"url": url, "background": True})
+        self.preloaded[url] = result["targetId"]
+        logger.info(f"Preloaded page: {url}")
+
+    async def show(self, url: str):
+        """Bring a page to the screen, reusing a preloaded tab when available"""
+        if url == self.current_url and self.is_running:
+            return
+
+        await self._ensure_running()
+        started = time.monotonic()
+
+        target_id = self.preloaded.pop(url, None)
+        if target_id is None:
+            result = await self.send("Target.createTarget", {"url": url})
+            target_id = result["targetId"]
+
+        await self.send("Target.activateTarget", {"targetId": target_id})
+
+        previous_target = self.current_target
+        self.current_target = target_id
+        self.current_url = url
+
+        if previous_target and previous_target != target_id:
+            await self._close_target(previous_target)
+
+        # Drop preloaded tabs that were not used
+        for stale_url, stale_target in list(self.preloaded.items()):
+            if stale_url != url:
+                del self.preloaded[stale_url]
+                await self._close_target(stale_target)
+
+        logger.info(f"Page shown in {(time.monotonic() - started) * 1000:.0f} ms: {url}")
+
+    async def blank(self):
+        """Show an empty page, releasing the resources of the current one"""
+        if self.is_running:
+            await self.show("about:blank")
+
+    async def _close_target(self, target_id: str):
+        """Close a tab, ignoring tabs that are already gone"""
+        try:
+            await self.send("Target.closeTarget", {"targetId": target_id})
+        except (DevToolsError, asyncio.TimeoutError) as e:
+            logger.debug(f"Could not close tab {target_id}: {e}")
+
+    async def stop(self):
+        """Close the DevTools connection and terminate the browser"""
+        if self._websocket is not None:
+            await self._websocket.close()
+            self._websocket = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                await asyncio.to_thread(self.process.wait, 5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+        self.process = None
+        self.current_target = None
+        self.current_url = None
+        self.preloaded.clear()
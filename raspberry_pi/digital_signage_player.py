@@ -4,7 +4,8 @@ Digital Signage Player para Raspberry Pi
 Sicoob Credisete - Sistema de Sinalização Digital
 
 Este script é responsável por:
-- Consultar a API para obter conteúdo agendado
+- Baixar o manifesto semanal da agência e resolver o conteúdo localmente
+- Receber alterações da agência por push (WebSocket) e ressincronizar
 - Exibir conteúdo em tela cheia (Chromium kiosk mode)
 - Reproduzir vídeos com VLC
 - Controlar hibernação via HDMI-CEC
@@ -18,19 +19,34 @@ import logging
 import os
 import subprocess
 import time
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-import requests
-import psutil
+from datetime import datetime
+from typing import Dict, Optional, Any
 import signal
 import sys
 from pathlib import Path
 
+from api_client import ApiClient, device_id_from_key
+from cec_controller import CecController
+from chromium_renderer import ChromiumRenderer
+from vlc_controller import VlcController
+from media_cache import MediaCache, DEFAULT_CACHE_MAX_BYTES
+from playlist_manifest import PlaylistManifest
+from push_channel import PushChannel
+from system_metrics import MetricsSampler
+
 # Configuration
 CONFIG_FILE = "/home/pi/digital_signage_config.json"
 LOG_FILE = "/home/pi/digital_signage.log"
 API_BASE_URL = "http://localhost:8000/api/v1"  # Change to your API URL
 DEVICE_ID = "raspberry_pi_001"  # Should be set from API
+MEDIA_CACHE_DIR = "/home/pi/digital_signage_cache"
+MANIFEST_FILE = "/home/pi/digital_signage_manifest.json"
+MANIFEST_CHECK_INTERVAL = 300  # seconds
+# Safety resync while the push channel is up, in case an event was lost
+PUSH_RESYNC_INTERVAL = 3600  # seconds
+STATUS_INTERVAL = 300  # seconds
+CEC_REFRESH_INTERVAL = 600  # seconds between TV power status queries
+PRELOAD_AHEAD = 60  # seconds before a slot starts to preload its content
 
 # Setup logging
 logging.basicConfig(
@@ -48,8 +64,33 @@ class DigitalSignagePlayer:
         self.current_content = None
         self.current_process = None
         self.is_running = True
+        self.is_hibernating = False
         self.agency_config = {}
+        self.api = None
+        self.push = None
         self.load_config()
+        self.cec = CecController.from_name(self.agency_config.get("cec_backend", "cec-client"))
+        self.metrics = MetricsSampler(
+            interval=self.agency_config.get("metrics_interval", 5)
+        )
+        self.manifest = PlaylistManifest(self.agency_config.get("manifest_file", MANIFEST_FILE))
+        self.media_cache = MediaCache(
+            self.agency_config.get("cache_dir", MEDIA_CACHE_DIR),
+            API_BASE_URL.rsplit("/api/", 1)[0],
+            max_bytes=self.agency_config.get("cache_max_bytes", DEFAULT_CACHE_MAX_BYTES)
+        )
+
+        # "devtools" keeps one browser alive; "kiosk" relaunches it for every link
+        self.chromium = None
+        if self.agency_config.get("renderer", "devtools") == "devtools":
+            self.chromium = ChromiumRenderer(
+                debugging_port=self.agency_config.get("chromium_debugging_port", 9222)
+            )
+
+        # "vlc-rc" keeps one VLC alive; "process" relaunches it for every video
+        self.vlc = None
+        if self.agency_config.get("video_backend", "vlc-rc") == "vlc-rc":
+            self.vlc = VlcController(rc_port=self.agency_config.get("vlc_rc_port", 4212))
 
     def load_config(self):
         """Load configuration from file"""
@@ -79,59 +120,55 @@ class DigitalSignagePlayer:
         except Exception as e:
             logger.error(f"Error saving configuration: {e}")
 
-    def send_status_update(self, status: str, details: Dict = None):
+    async def send_status_update(self, status: str, details: Dict = None, retries: int = None):
         """Send status update to API"""
-        try:
-            payload = {
-                "device_id": DEVICE_ID,
-                "status": status,
-                "last_seen": datetime.now().isoformat(),
-                "details": details or {}
-            }
-
-            response = requests.post(
-                f"{API_BASE_URL}/devices/status",
-                json=payload,
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                logger.info(f"Status update sent: {status}")
-            else:
-                logger.warning(f"Failed to send status update: {response.status_code}")
-
-        except Exception as e:
-            logger.error(f"Error sending status update: {e}")
-
-    def get_current_schedule(self) -> List[Dict]:
-        """Get current schedule from API"""
-        try:
-            now = datetime.now()
-            current_time = now.strftime("%H:%M")
-            current_weekday = str(now.weekday())
-
-            params = {
-                "current_time": current_time,
-                "current_weekday": current_weekday
-            }
-
-            response = requests.get(
-                f"{API_BASE_URL}/schedules/current",
-                params=params,
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                schedules = response.json()
-                logger.info(f"Retrieved {len(schedules)} active schedules")
-                return schedules
-            else:
-                logger.warning(f"Failed to get schedules: {response.status_code}")
-                return []
-
-        except Exception as e:
-            logger.error(f"Error getting schedules: {e}")
-            return []
+        payload = {
+            "device_id": DEVICE_ID,
+            "status": status,
+            "last_seen": datetime.now().isoformat(),
+            "details": details or {}
+        }
+
+        # Keys carry the server id of the device; without one, fall back to the legacy route
+        device_id = device_id_from_key(self.agency_config.get("device_key"))
+        path = f"/devices/{device_id}/status" if device_id else "/devices/status"
+        response = await self.api.post_json(path, payload, retries=retries)
+
+        if response is None:
+            logger.error("Error sending status update: API unreachable")
+        elif response.status_code == 200:
+            logger.info(f"Status update sent: {status}")
+        else:
+            logger.warning(f"Failed to send status update: {response.status_code}")
+
+    async def refresh_manifest(self):
+        """Download the agency manifest when the server reports a new version"""
+        agency_id = self.agency_config.get("agency_id")
+
+        remote = await self.api.get_json(f"/schedules/agency/{agency_id}/manifest/version")
+        if remote is None:
+            logger.warning("Could not check manifest version, playing from local copy")
+            return
+
+        if remote.get("version") == self.manifest.version:
+            return
+
+        manifest = await self.api.get_json(f"/schedules/agency/{agency_id}/manifest", timeout=30)
+        if manifest is not None:
+            self.apply_manifest(manifest)
+
+    def apply_manifest(self, manifest: Dict):
+        """Store a new manifest and take over its agency settings"""
+        self.manifest.update(manifest)
+
+        agency = self.manifest.agency
+        if agency:
+            self.agency_config.update({
+                key: agency[key]
+                for key in ("hibernation_enabled", "hibernation_start", "hibernation_end")
+                if key in agency
+            })
+            self.save_config()
 
     def apply_screen_rotation(self, orientation: str):
         """Apply screen rotation"""
@@ -289,70 +326,57 @@ class DigitalSignagePlayer:
             logger.error(f"Error checking hibernation: {e}")
             return False
 
-    def hibernate_tv(self):
-        """Put TV in standby mode using HDMI-CEC"""
-        try:
-            logger.info("Sending TV to standby")
-            subprocess.run(["echo", "standby 0", "|", "cec-client", "-s"], check=True)
-            logger.info("TV sent to standby")
-        except Exception as e:
-            logger.error(f"Error sending TV to standby: {e}")
+    async def hibernate_tv(self):
+        """Put TV in standby mode using HDMI-CEC (only if it is not already)"""
+        if await self.cec.set_power(False):
+            logger.info("TV hibernated")
 
-    def wake_tv(self):
-        """Wake up TV from standby using HDMI-CEC"""
-        try:
-            logger.info("Waking up TV")
-            subprocess.run(["echo", "on 0", "|", "cec-client", "-s"], check=True)
-            logger.info("TV wake command sent")
-        except Exception as e:
-            logger.error(f"Error waking up TV: {e}")
+    async def wake_tv(self):
+        """Wake up TV from standby using HDMI-CEC (only if it is not already on)"""
+        if await self.cec.set_power(True):
+            logger.info("TV active")
 
     def get_system_info(self) -> Dict:
-        """Get system information"""
+        """Get system information summarised from the metrics ring buffer"""
         try:
-            return {
-                "cpu_percent": psutil.cpu_percent(interval=1),
-                "memory_percent": psutil.virtual_memory().percent,
-                "disk_usage": psutil.disk_usage('/').percent,
-                "temperature": self.get_cpu_temperature(),
-                "uptime": self.get_uptime()
-            }
+            window = self.agency_config.get("status_interval", STATUS_INTERVAL)
+            return self.metrics.summary(window)
         except Exception as e:
             logger.error(f"Error getting system info: {e}")
             return {}
 
-    def get_cpu_temperature(self) -> float:
-        """Get CPU temperature"""
-        try:
-            with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-                temp = float(f.read()) / 1000
-            return round(temp, 1)
-        except:
-            return 0.0
-
-    def get_uptime(self) -> str:
-        """Get system uptime"""
-        try:
-            with open('/proc/uptime', 'r') as f:
-                uptime_seconds = float(f.readline().split()[0])
-                uptime = timedelta(seconds=uptime_seconds)
-                return str(uptime).split('.')[0]  # Remove microseconds
-        except:
-            return "Unknown"
-
-    def play_content(self, content: Dict):
+    async def play_content(self, content: Dict):
         """Play specific content"""
         try:
-            content_type = content.get("type", "link")
+            content_type = content.get("type", content.get("content_type", "link"))
             url = content.get("url", "")
 
+            if content_type in ("video", "image"):
+                # Replays come from the SD card; first plays stream while the cache fills
+                url = self.media_cache.get(content)
+                if not url:
+                    url = self.media_cache.resolve_url(content)
+                    self.media_cache.prefetch(content)
+
             logger.info(f"Playing content: {content.get('title')} ({content_type})")
 
             if content_type == "link":
-                self.start_chromium_kiosk(url)
+                await self.stop_video()
+                if self.chromium:
+                    self.stop_current_process()
+                    await self.chromium.show(url)
+                else:
+                    self.start_chromium_kiosk(url)
             elif content_type == "video":
-                self.start_vlc_player(url)
+                await self.clear_browser()
+                if self.vlc:
+                    self.stop_current_process()
+                    await self.vlc.play(url)
+                else:
+                    self.start_vlc_player(url)
             elif content_type == "image":
+                await self.clear_browser()
+                await self.stop_video()
                 self.start_image_viewer(url)
             else:
                 logger.warning(f"Unknown content type: {content_type}")
@@ -362,64 +386,146 @@ class DigitalSignagePlayer:
         except Exception as e:
             logger.error(f"Error playing content: {e}")
 
+    async def stop_content(self):
+        """Stop whatever is on screen"""
+        self.stop_current_process()
+        await self.stop_video()
+        await self.clear_browser()
+        self.current_content = None
+
+    async def stop_video(self):
+        """Stop the persistent video backend when it is not the active content"""
+        if self.vlc:
+            try:
+                await self.vlc.stop()
+            except Exception as e:
+                logger.error(f"Error stopping video: {e}")
+
+    async def clear_browser(self):
+        """Blank the persistent browser page when it is not the active content"""
+        if self.chromium:
+            try:
+                await self.chromium.blank()
+            except Exception as e:
+                logger.error(f"Error clearing browser page: {e}")
+
+    async def preload_next_content(self):
+        """Prepare the content of the next slot shortly before it starts"""
+        now = datetime.now()
+        transition = self.manifest.next_transition(now)
+        if not transition:
+            return
+
+        starts_at, content = transition
+        if not content or (starts_at - now).total_seconds() > PRELOAD_AHEAD:
+            return
+
+        content_type = content.get("content_type", content.get("type"))
+        try:
+            if content_type == "link" and self.chromium:
+                # Open the page in a hidden tab
+                await self.chromium.preload(content.get("url", ""))
+            elif content_type == "video" and self.vlc and self.current_content:
+                # Enqueue the video behind the current one
+                url = self.media_cache.peek(content) or self.media_cache.resolve_url(content)
+                await self.vlc.preload(url)
+        except Exception as e:
+            logger.error(f"Error preloading next content: {e}")
+
+    async def sync_manifest(self):
+        """Refresh the manifest and prefetch the media of the next slots"""
+        await self.refresh_manifest()
+
+        # Download the media of the next slots before they start
+        self.media_cache.prefetch_many(self.manifest.upcoming_contents(datetime.now()))
+
+    async def manifest_worker(self):
+        """Resync the manifest on pushed changes, polling only while the push channel is down"""
+        poll_interval = self.agency_config.get("manifest_check_interval", MANIFEST_CHECK_INTERVAL)
+        while self.is_running:
+            try:
+                await self.sync_manifest()
+            except Exception as e:
+                logger.error(f"Error in sync_manifest: {e}")
+
+            if self.push:
+                timeout = PUSH_RESYNC_INTERVAL if self.push.connected else poll_interval
+                await self.push.wait_for_resync(timeout)
+            else:
+                await asyncio.sleep(poll_interval)
+
+    async def report_status(self):
+        """Send the periodic online status"""
+        system_info = self.get_system_info()
+        system_info["tv_power"] = self.cec.power_state
+        if self.vlc:
+            system_info["video_switch_latency_ms"] = self.vlc.last_switch_latency_ms
+        await self.send_status_update("online", system_info)
+
+    async def run_periodic(self, job, interval: float):
+        """Run a job forever at a fixed interval, independently of the main loop"""
+        while self.is_running:
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in {job.__name__}: {e}")
+            await asyncio.sleep(interval)
+
     async def main_loop(self):
         """Main application loop"""
         logger.info("Starting Digital Signage Player")
 
-        # Send initial status
-        self.send_status_update("online", self.get_system_info())
+        self.api = ApiClient(API_BASE_URL, device_key=self.agency_config.get("device_key"))
+
+        if self.agency_config.get("push_enabled", True):
+            self.push = PushChannel(
+                PushChannel.events_url(API_BASE_URL, self.agency_config.get("agency_id")),
+                device_key=self.agency_config.get("device_key")
+            )
+
+        # Network work runs in its own tasks so it never stalls playback or hibernation
+        status_interval = self.agency_config.get("status_interval", STATUS_INTERVAL)
+        cec_refresh_interval = self.agency_config.get("cec_refresh_interval", CEC_REFRESH_INTERVAL)
+        background_tasks = [
+            asyncio.create_task(self.run_periodic(self.metrics.collect, self.metrics.interval)),
+            asyncio.create_task(self.manifest_worker()),
+            asyncio.create_task(self.run_periodic(self.report_status, status_interval)),
+            asyncio.create_task(self.run_periodic(self.cec.refresh, cec_refresh_interval)),
+        ]
+        if self.push:
+            background_tasks.append(asyncio.create_task(self.push.run()))
 
-        last_schedule_check = 0
-        last_status_update = 0
         last_hibernation_check = 0
 
         try:
             while self.is_running:
                 current_time = time.time()
 
-                # Check for new schedules every 30 seconds
-                if current_time - last_schedule_check > 30:
-                    schedules = self.get_current_schedule()
-
-                    if schedules:
-                        # Find highest priority schedule
-                        best_schedule = max(schedules, key=lambda x: x.get("priority", 1))
-                        content_id = best_schedule.get("content_id")
+                # Resolve what plays now from the local manifest
+                if not self.is_hibernating:
+                    content = self.manifest.resolve(datetime.now())
 
+                    if content:
                         # Check if we need to change content
-                        if not self.current_content or self.current_content.get("id") != content_id:
-                            # Get content details
-                            try:
-                                response = requests.get(f"{API_BASE_URL}/contents/{content_id}")
-                                if response.status_code == 200:
-                                    content = response.json()
-                                    self.play_content(content)
-                            except Exception as e:
-                                logger.error(f"Error getting content details: {e}")
-                    else:
+                        if not self.current_content or self.current_content.get("id") != content.get("id"):
+                            await self.play_content(content)
+                    elif self.current_content:
                         # No active schedules, show default content or blank screen
-                        if self.current_content:
-                            self.stop_current_process()
-                            self.current_content = None
-
-                    last_schedule_check = current_time
+                        await self.stop_content()
 
-                # Send status update every 5 minutes
-                if current_time - last_status_update > 300:
-                    self.send_status_update("online", self.get_system_info())
-                    last_status_update = current_time
+                    await self.preload_next_content()
 
                 # Check hibernation every minute
                 if current_time - last_hibernation_check > 60:
-                    if self.should_hibernate():
+                    self.is_hibernating = self.should_hibernate()
+                    if self.is_hibernating:
                         if self.current_content:
-                            self.stop_current_process()
-                            self.current_content = None
-                        self.hibernate_tv()
-                        logger.info("TV hibernated")
+                            await self.stop_content()
+                        await self.hibernate_tv()
                     else:
-                        self.wake_tv()
-                        logger.info("TV active")
+                        await self.wake_tv()
 
                     last_hibernation_check = current_time
 
@@ -430,6 +536,23 @@ class DigitalSignagePlayer:
         except Exception as e:
             logger.error(f"Error in main loop: {e}")
         finally:
+            for task in background_tasks:
+                task.cancel()
+            await asyncio.gather(*background_tasks, return_exceptions=True)
+
+            # Send final status, without retrying so shutdown stays quick
+            await self.send_status_update("offline", retries=0)
+            await self.api.close()
+
+            if self.chromium:
+                await self.chromium.stop()
+            if self.vlc:
+                await self.vlc.stop_process()
+
+            # Wake TV if hibernated
+            await self.wake_tv()
+            await self.cec.close()
+
             self.cleanup()
 
     def cleanup(self):
@@ -439,11 +562,8 @@ class DigitalSignagePlayer:
         # Stop current process
         self.stop_current_process()
 
-        # Wake TV if hibernated
-        self.wake_tv()
-
-        # Send final status
-        self.send_status_update("offline")
+        # Stop background downloads
+        self.media_cache.shutdown()
 
         logger.info("Cleanup completed")
 
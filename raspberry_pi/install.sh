@@ -37,7 +37,7 @@ sudo apt install -y \
 
 # Install Python dependencies
 echo "Installing Python dependencies..."
-pip3 install requests psutil
+pip3 install requests psutil httpx websockets
 
 # Create digital signage directory
 echo "Creating digital signage directory..."
@@ -50,6 +50,9 @@ echo "Setting up player script..."
 # You can also clone from a repository:
 # git clone https://github.com/your-repo/digital-signage.git .
 
+# The player imports its helper modules (media_cache.py, ...) from this
+# same directory, so copy the whole raspberry_pi folder here
+
 # Make script executable
 chmod +x digital_signage_player.py
 
@@ -129,7 +132,15 @@ tee digital_signage_config.json > /dev/null <<EOF
     "hibernation_start": "18:00",
     "hibernation_end": "08:00",
     "check_interval": 30,
-    "status_interval": 300
+    "status_interval": 300,
+    "manifest_check_interval": 300,
+    "push_enabled": true,
+    "device_key": "",
+    "renderer": "devtools",
+    "video_backend": "vlc-rc",
+    "cec_backend": "cec-client",
+    "cache_dir": "$HOME/digital_signage_cache",
+    "cache_max_bytes": 17179869184
 }
 EOF
 
@@ -70,6 +70,8 @@ cd ~/sinalizacao_digital
 # Baixar script do player otimizado
 echo "⬇️  Baixando script do player..."
 curl -o player.py https://raw.githubusercontent.com/bmrocha/Sinalizado_Digital_Facilita_TI/main/raspberry_pi/player_lite.py
+curl -o media_cache.py https://raw.githubusercontent.com/bmrocha/Sinalizado_Digital_Facilita_TI/main/raspberry_pi/media_cache.py
+curl -o playlist_manifest.py https://raw.githubusercontent.com/bmrocha/Sinalizado_Digital_Facilita_TI/main/raspberry_pi/playlist_manifest.py
 
 # Tornar executável
 chmod +x player.py
@@ -81,11 +83,15 @@ cat > config.json << 'EOF'
     "agency_id": 1,
     "device_id": "raspberry_$(hostname)",
     "api_url": "http://SEU_SERVIDOR:8000/api/v1",
+    "device_key": "",
     "orientation": "horizontal",
     "hibernation_enabled": true,
     "hibernation_start": "18:00",
     "hibernation_end": "08:00",
-    "check_interval": 30
+    "check_interval": 30,
+    "status_interval": 300,
+    "manifest_check_interval": 300,
+    "cache_dir": "/home/pi/sinalizacao_digital/cache"
 }
 EOF
 
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Media cache for the Raspberry Pi player
+Sicoob Credisete - Sistema de Sinalização Digital
+
+Keeps downloaded videos and images on the SD card so that replays are served
+from local disk instead of the branch uplink:
+- Entries are keyed by content id and content version
+- Downloads run in a background worker, ahead of the scheduled slot
+- A byte budget sized for the 32GB cards used by install_lite.sh is enforced
+- The least recently played entries are evicted first
+- Interrupted downloads resume with HTTP Range requests
+- The index is written every INDEX_SAVE_INTERVAL when it changed, and on
+  shutdown, instead of on every play
+"""
+
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# 32GB card: ~2GB for Raspberry Pi OS Lite + player, half the card for media
+DEFAULT_CACHE_MAX_BYTES = 16 * 1024 ** 3
+# Never let the cache push the card below this amount of free space
+DEFAULT_MIN_FREE_BYTES = 2 * 1024 ** 3
+
+CACHEABLE_TYPES = ("video", "image")
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_RETRIES = 5
+RESUME_BACKOFF_BASE = 2  # seconds
+RESUME_BACKOFF_MAX = 60  # seconds
+# Interrupted downloads older than this are not resumed anymore
+PARTIAL_MAX_AGE = 24 * 60 * 60  # seconds
+INDEX_FILE_NAME = "index.json"
+# Changes to the index (plays, downloads, evictions) are written this often
+INDEX_SAVE_INTERVAL = 60  # seconds
+
+
+class MediaCache:
+    """Persistent on-disk LRU cache of media files"""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        server_url: str,
+        max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+        min_free_bytes: int = DEFAULT_MIN_FREE_BYTES,
+        timeout: int = 30,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.server_url = server_url.rstrip("/")
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.timeout = timeout
+
+        self.entries: Dict[str, Dict] = {}
+        self.pinned_key: Optional[str] = None
+        self._pending = set()
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._stopped = threading.Event()
+        self._session = requests.Session()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="media-cache")
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.load_index()
+
+        self._saver = threading.Thread(target=self._save_periodically, name="media-cache-index", daemon=True)
+        self._saver.start()
+
+    @staticmethod
+    def cache_key(content: Dict) -> str:
+        """Build the cache key from content id and version"""
+        version = (
+            content.get("checksum")
+            or content.get("updated_at")
+            or content.get("created_at")
+            or "0"
+        )
+        version = re.sub(r"[^A-Za-z0-9]", "", str(version))
+        return f"{content.get('id')}-{version}"
+
+    def resolve_url(self, content: Dict) -> str:
+        """Get the remote URL of a content, resolving uploaded files against the server"""
+        url = content.get("url") or ""
+        if url.startswith("http"):
+            return url
+
+        path = url or content.get("file_path") or ""
+        if path.startswith("/"):
+            return f"{self.server_url}{path}"
+        return path
+
+    def is_cacheable(self, content: Dict) -> bool:
+        """Check if the content is a media file that can be cached"""
+        return (
+            content.get("type", content.get("content_type")) in CACHEABLE_TYPES
+            and self.resolve_url(content).startswith("http")
+        )
+
+    def load_index(self):
+        """Load the cache index, dropping entries whose files are gone"""
+        index_file = self.cache_dir / INDEX_FILE_NAME
+        try:
+            if index_file.exists():
+                with open(index_file, "r") as f:
+                    entries = json.load(f)
+                self.entries = {
+                    key: entry for key, entry in entries.items()
+                    if (self.cache_dir / entry["file"]).exists()
+                }
+        except Exception as e:
+            logger.error(f"Error loading media cache index: {e}")
+            self.entries = {}
+
+        # Remove untracked files, keeping recent interrupted downloads to resume
+        known_files = {entry["file"] for entry in self.entries.values()}
+        for path in self.cache_dir.iterdir():
+            if path.name == INDEX_FILE_NAME or path.name in known_files:
+                continue
+            if (
+                path.name.endswith((".part", ".part.etag"))
+                and time.time() - path.stat().st_mtime < PARTIAL_MAX_AGE
+            ):
+                continue
+            path.unlink(missing_ok=True)
+
+        logger.info(f"Media cache loaded: {len(self.entries)} items, {self.total_bytes()} bytes")
+
+    def save_index(self):
+        """Atomically persist the cache index"""
+        index_file = self.cache_dir / INDEX_FILE_NAME
+        tmp_file = index_file.with_suffix(".tmp")
+        try:
+            with self._lock:
+                self._dirty = False
+                with open(tmp_file, "w") as f:
+                    json.dump(self.entries, f)
+                os.replace(tmp_file, index_file)
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"Error saving media cache index: {e}")
+
+    def save_if_dirty(self):
+        """Persist the index if it changed since it was last saved"""
+        if self._dirty:
+            self.save_index()
+
+    def _save_periodically(self):
+        """Save the changed index every INDEX_SAVE_INTERVAL until shutdown"""
+        while not self._stopped.wait(INDEX_SAVE_INTERVAL):
+            self.save_if_dirty()
+
+    def total_bytes(self) -> int:
+        """Get the number of bytes used by cached files"""
+        with self._lock:
+            return sum(entry["size"] for entry in self.entries.values())
+
+    def get(self, content: Dict) -> Optional[str]:
+        """Get the local path of a cached content and mark it as played"""
+        key = self.cache_key(content)
+        with self._lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+
+            path = self.cache_dir / entry["file"]
+            if not path.exists():
+                del self.entries[key]
+                self._dirty = True
+                return None
+
+            # Played on every slot: only a periodic save writes it to the SD card
+            entry["last_played"] = time.time()
+            self.pinned_key = key
+            self._dirty = True
+
+        return str(path)
+
+    def peek(self, content: Dict) -> Optional[str]:
+        """Get the local path of a cached content without marking it as played"""
+        with self._lock:
+            entry = self.entries.get(self.cache_key(content))
+            if entry and (self.cache_dir / entry["file"]).exists():
+                return str(self.cache_dir / entry["file"])
+        return None
+
+    def prefetch(self, content: Dict):
+        """Download a content in the background if it is not cached yet"""
+        if not self.is_cacheable(content):
+            return
+
+        key = self.cache_key(content)
+        with self._lock:
+            if key in self.entries or key in self._pending:
+                return
+            self._pending.add(key)
+
+        self._executor.submit(self._download, key, content)
+
+    def prefetch_many(self, contents: Iterable[Dict]):
+        """Queue downloads for several contents, in the given order"""
+        for content in contents:
+            self.prefetch(content)
+
+    def _download(self, key: str, content: Dict):
+        """Download a content into the cache (runs in the worker thread)
+
+        Interrupted transfers keep their .part file and the ETag it was
+        started with, and are resumed with a Range request guarded by
+        If-Range, so a dropped link costs only the missing bytes.
+        """
+        url = self.resolve_url(content)
+        extension = os.path.splitext(urlparse(url).path)[1][:10]
+        if not extension and content.get("media_type"):
+            # Blobs are named after their hash alone, the player needs an extension
+            extension = mimetypes.guess_extension(content["media_type"]) or ""
+        file_name = f"{key}{extension}"
+        part_path = self.cache_dir / f"{file_name}.part"
+        etag_path = self.cache_dir / f"{file_name}.part.etag"
+        completed = False
+
+        try:
+            logger.info(f"Caching content {content.get('id')}: {url}")
+
+            for attempt in range(DOWNLOAD_RETRIES):
+                try:
+                    size = self._fetch(content, url, part_path, etag_path)
+                    break
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                    if attempt == DOWNLOAD_RETRIES - 1:
+                        raise
+                    delay = min(RESUME_BACKOFF_MAX, RESUME_BACKOFF_BASE * 2 ** attempt)
+                    logger.warning(
+                        f"Download of content {content.get('id')} interrupted at "
+                        f"{part_path.stat().st_size if part_path.exists() else 0} bytes ({e}), "
+                        f"resuming in {delay}s"
+                    )
+                    time.sleep(delay)
+
+            if size is None:
+                completed = True
+                return
+
+            checksum = content.get("checksum")
+            if checksum and self._sha256(part_path) != checksum:
+                # Corrupt or mixed-up parts are not worth resuming
+                completed = True
+                raise ValueError("checksum mismatch")
+
+            os.replace(part_path, self.cache_dir / file_name)
+            completed = True
+
+            with self._lock:
+                self._drop_other_versions(content.get("id"), key)
+                self.entries[key] = {
+                    "file": file_name,
+                    "size": size,
+                    "content_id": content.get("id"),
+                    "cached_at": time.time(),
+                    "last_played": 0,
+                }
+                self._dirty = True
+
+            logger.info(f"Content {content.get('id')} cached ({size} bytes)")
+
+        except Exception as e:
+            logger.error(f"Error caching content {content.get('id')}: {e}")
+        finally:
+            if completed:
+                part_path.unlink(missing_ok=True)
+                etag_path.unlink(missing_ok=True)
+            with self._lock:
+                self._pending.discard(key)
+
+    def _fetch(self, content: Dict, url: str, part_path: Path, etag_path: Path) -> Optional[int]:
+        """Download or resume one file into part_path, returning its size
+
+        Returns None when the cache has no room for it.
+        """
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        etag = etag_path.read_text().strip() if etag_path.exists() else ""
+
+        headers = {}
+        if offset and etag:
+            headers = {"Range": f"bytes={offset}-", "If-Range": etag}
+        else:
+            offset = 0
+
+        with self._session.get(url, stream=True, timeout=self.timeout, headers=headers) as response:
+            if response.status_code == 416:
+                # The part is already complete, or belongs to another file
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                if total.isdigit() and int(total) == offset:
+                    return offset
+                part_path.unlink(missing_ok=True)
+                etag_path.unlink(missing_ok=True)
+                response.raise_for_status()
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                content_range = response.headers.get("Content-Range", "")
+                match = re.match(r"bytes (\d+)-\d+/(\d+)", content_range)
+                if not match or int(match.group(1)) != offset:
+                    part_path.unlink(missing_ok=True)
+                    etag_path.unlink(missing_ok=True)
+                    raise ValueError(f"unexpected Content-Range {content_range!r}")
+                expected_size = int(match.group(2))
+                mode = "ab"
+            else:
+                # Full body: a fresh download, or the file changed since the part was started
+                expected_size = int(response.headers.get("Content-Length") or 0)
+                offset = 0
+                mode = "wb"
+
+            if expected_size and not self._make_room(expected_size):
+                logger.warning(f"Not enough cache space for content {content.get('id')}")
+                return None
+
+            # Only strong validators can safely resume a download
+            new_etag = response.headers.get("ETag", "")
+            if new_etag and not new_etag.startswith("W/"):
+                etag_path.write_text(new_etag)
+            else:
+                etag_path.unlink(missing_ok=True)
+
+            # Without a Content-Length the size is only known while receiving:
+            # give up as soon as the file could not fit the cache anyway
+            limit = expected_size or self._budget()
+
+            size = offset
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if not expected_size and size > limit:
+                        logger.warning(f"Not enough cache space for content {content.get('id')}")
+                        return None
+                    f.write(chunk)
+
+        if expected_size and size != expected_size:
+            raise requests.ConnectionError(f"transfer ended at {size} of {expected_size} bytes")
+        if not expected_size and not self._make_room(size):
+            logger.warning(f"Not enough cache space for content {content.get('id')}")
+            return None
+        return size
+
+    @staticmethod
+    def _sha256(path: Path) -> str:
+        """SHA-256 of a downloaded file"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _drop_other_versions(self, content_id, keep_key: str):
+        """Remove outdated versions of a content"""
+        for key, entry in list(self.entries.items()):
+            if entry.get("content_id") == content_id and key != keep_key and key != self.pinned_key:
+                self._remove(key)
+
+    def _budget(self) -> int:
+        """Bytes the cache may use: the byte budget, within the free space of the card"""
+        with self._lock:
+            free_bytes = shutil.disk_usage(self.cache_dir).free
+            return min(self.max_bytes, self.total_bytes() + free_bytes - self.min_free_bytes)
+
+    def _make_room(self, size: int) -> bool:
+        """Evict least recently played entries until the new file fits the budget"""
+        with self._lock:
+            budget = self._budget()
+
+            if size > budget:
+                return False
+
+            for key in sorted(self.entries, key=lambda k: self.entries[k]["last_played"]):
+                if self.total_bytes() + size <= budget:
+                    break
+                if key == self.pinned_key:
+                    continue
+                logger.info(f"Evicting cached content {self.entries[key].get('content_id')}")
+                self._remove(key)
+
+            fits = self.total_bytes() + size <= budget
+            self._dirty = True
+
+        return fits
+
+    def _remove(self, key: str):
+        """Delete an entry and its file"""
+        entry = self.entries.pop(key, None)
+        if entry:
+            (self.cache_dir / entry["file"]).unlink(missing_ok=True)
+
+    def shutdown(self):
+        """Stop the download worker and save the pending index changes"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._session.close()
+        self._stopped.set()
+        self.save_if_dirty()
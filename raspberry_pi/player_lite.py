@@ -16,11 +16,16 @@ import requests
 import signal
 import sys
 
+from media_cache import MediaCache
+from playlist_manifest import PlaylistManifest
+
 # Configuração
 CONFIG_FILE = "/home/pi/sinalizacao_digital/config.json"
 LOG_FILE = "/home/pi/sinalizacao_digital/player.log"
 API_BASE_URL = "http://localhost:8000/api/v1"
 DEVICE_ID = "raspberry_pi_lite"
+CACHE_DIR = "/home/pi/sinalizacao_digital/cache"
+MANIFEST_FILE = "/home/pi/sinalizacao_digital/manifest.json"
 
 # Configurar logging simples
 logging.basicConfig(
@@ -33,11 +38,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def device_id_from_key(device_key):
+    """Id do dispositivo no servidor, tirado da chave (dk1.<id>.<serial>.<kid>.<mac>)"""
+    parts = (device_key or "").split(".")
+    if len(parts) == 5 and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
 class PlayerLite:
     def __init__(self):
         self.current_process = None
+        self.current_content_id = None
+        self.version_etag = None
         self.is_running = True
         self.config = self.load_config()
+        # Chave emitida no provisionamento (POST /devices/{id}/key)
+        device_key = self.config.get("device_key")
+        self.auth_headers = {"Authorization": f"Device {device_key}"} if device_key else {}
+        self.manifest = PlaylistManifest(self.config.get("manifest_file", MANIFEST_FILE))
+        self.media_cache = MediaCache(
+            self.config.get("cache_dir", CACHE_DIR),
+            self.config.get("api_url", API_BASE_URL).rsplit("/api/", 1)[0]
+        )
 
     def load_config(self):
         """Carregar configuração"""
@@ -64,40 +86,69 @@ class PlayerLite:
                 "status": status,
                 "last_seen": datetime.now().isoformat()
             }
+            # A chave do dispositivo traz o id dele no servidor
+            device_id = device_id_from_key(self.config.get("device_key"))
+            path = f"/devices/{device_id}/status" if device_id else "/devices/status"
             requests.post(
-                f"{self.config.get('api_url', API_BASE_URL)}/devices/status",
+                f"{self.config.get('api_url', API_BASE_URL)}{path}",
                 json=payload,
+                headers=self.auth_headers,
                 timeout=5
             )
         except:
             pass  # Não falhar se API não estiver disponível
 
-    def get_schedule(self):
-        """Obter agendamento atual"""
+    def refresh_manifest(self):
+        """Baixar o manifesto da agência apenas quando a versão mudar"""
+        api_url = self.config.get('api_url', API_BASE_URL)
+        agency_id = self.config.get("agency_id")
         try:
-            now = datetime.now()
-            params = {
-                "current_time": now.strftime("%H:%M"),
-                "current_weekday": str(now.weekday())
-            }
+            # Com o ETag da última resposta, versão inalterada volta 304 sem corpo
+            headers = dict(self.auth_headers)
+            if self.version_etag:
+                headers["If-None-Match"] = self.version_etag
             response = requests.get(
-                f"{self.config.get('api_url', API_BASE_URL)}/schedules/current",
-                params=params,
+                f"{api_url}/schedules/agency/{agency_id}/manifest/version",
+                headers=headers,
                 timeout=5
             )
+            if response.status_code != 200:
+                return
+            etag = response.headers.get("ETag")
+            if response.json().get("version") == self.manifest.version:
+                self.version_etag = etag
+                return
+
+            response = requests.get(
+                f"{api_url}/schedules/agency/{agency_id}/manifest",
+                headers=self.auth_headers,
+                timeout=30
+            )
             if response.status_code == 200:
-                return response.json()
+                self.manifest.update(response.json())
+                self.version_etag = etag
+                self.config.update({
+                    key: value for key, value in self.manifest.agency.items()
+                    if key.startswith("hibernation_")
+                })
         except:
-            pass
-        return []
+            pass  # Sem API, continua tocando o manifesto salvo
 
     def play_content(self, content):
         """Reproduzir conteúdo"""
         self.stop_current()
+        self.current_content_id = content.get("id")
 
-        content_type = content.get("type", "link")
+        content_type = content.get("type", content.get("content_type", "link"))
         url = content.get("url", "")
 
+        # Vídeos e imagens já baixados tocam direto do cartão SD
+        if content_type in ("video", "image"):
+            url = self.media_cache.get(content)
+            if not url:
+                url = self.media_cache.resolve_url(content)
+                self.media_cache.prefetch(content)
+
         logger.info(f"Reproduzindo: {content.get('title')} ({content_type})")
 
         try:
@@ -126,6 +177,7 @@ class PlayerLite:
             except:
                 self.current_process.kill()
         self.current_process = None
+        self.current_content_id = None
 
     def should_hibernate(self):
         """Verificar se deve hibernar"""
@@ -159,37 +211,37 @@ class PlayerLite:
         self.send_status("online")
 
         last_check = 0
+        last_manifest_check = 0
+        last_status = time.time()
 
         try:
             while self.is_running:
                 current_time = time.time()
 
-                # Verificar agendamento a cada 30 segundos
-                if current_time - last_check > 30:
-                    schedules = self.get_schedule()
-
-                    if schedules:
-                        best = max(schedules, key=lambda x: x.get("priority", 1))
-                        content_id = best.get("content_id")
-
-                        # Buscar detalhes do conteúdo
-                        try:
-                            response = requests.get(
-                                f"{self.config.get('api_url', API_BASE_URL)}/contents/{content_id}",
-                                timeout=5
-                            )
-                            if response.status_code == 200:
-                                content = response.json()
-                                self.play_content(content)
-                        except:
-                            pass
-                    else:
-                        self.stop_current()
+                # Verificar nova versão do manifesto a cada 5 minutos
+                if current_time - last_manifest_check > self.config.get("manifest_check_interval", 300):
+                    self.refresh_manifest()
+                    self.media_cache.prefetch_many(self.manifest.upcoming_contents(datetime.now()))
+                    last_manifest_check = current_time
 
+                # Sinal de vida periódico; sem ele a API marca o dispositivo como offline
+                if current_time - last_status > self.config.get("status_interval", 300):
+                    self.send_status("online")
+                    last_status = current_time
+
+                # Resolver o conteúdo atual localmente a cada 30 segundos
+                if current_time - last_check > self.config.get("check_interval", 30):
                     # Verificar hibernação
                     if self.should_hibernate():
                         self.stop_current()
                         self.hibernate_tv()
+                    else:
+                        content = self.manifest.resolve(datetime.now())
+
+                        if not content:
+                            self.stop_current()
+                        elif content.get("id") != self.current_content_id:
+                            self.play_content(content)
 
                     last_check = current_time
 
@@ -203,6 +255,7 @@ class PlayerLite:
     def cleanup(self):
         """Limpeza"""
         self.stop_current()
+        self.media_cache.shutdown()
         self.send_status("offline")
         logger.info("Limpeza concluída")
 
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Offline playlist manifest for the Raspberry Pi player
+Sicoob Credisete - Sistema de Sinalização Digital
+
+The player downloads the weekly manifest of its agency (schedules, contents
+and hibernation window), keeps it on disk and resolves what plays now
+without asking the API, so the screen keeps working through WAN outages.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_time(value: str) -> int:
+    """Convert "HH:MM" or "HH:MM:SS" into seconds since midnight"""
+    parts = [int(part) for part in value.split(":")]
+    while len(parts) < 3:
+        parts.append(0)
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+class PlaylistManifest:
+    """Weekly manifest persisted on disk and resolved locally"""
+
+    def __init__(self, manifest_file: str):
+        self.manifest_file = manifest_file
+        self.data: Dict = {}
+        self.load()
+
+    @property
+    def version(self) -> Optional[str]:
+        """Version of the stored manifest"""
+        return self.data.get("version")
+
+    @property
+    def agency(self) -> Dict:
+        """Agency display settings (orientation and hibernation window)"""
+        return self.data.get("agency", {})
+
+    def load(self):
+        """Load the manifest saved by a previous run"""
+        try:
+            if os.path.exists(self.manifest_file):
+                with open(self.manifest_file, 'r') as f:
+                    self.data = json.load(f)
+                logger.info(f"Manifest loaded: version {self.version}")
+        except Exception as e:
+            logger.error(f"Error loading manifest: {e}")
+            self.data = {}
+
+    def update(self, data: Dict):
+        """Replace the manifest and persist it atomically"""
+        tmp_file = f"{self.manifest_file}.tmp"
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.manifest_file)
+        except Exception as e:
+            logger.error(f"Error saving manifest: {e}")
+
+        self.data = data
+        logger.info(f"Manifest updated: version {self.version}, {len(data.get('schedules', []))} schedules")
+
+    def get_content(self, content_id) -> Optional[Dict]:
+        """Get a content of the manifest by id"""
+        return self.data.get("contents", {}).get(str(content_id))
+
+    def active_schedules(self, now: datetime) -> List[Dict]:
+        """Get the schedules active at the given moment, highest priority first"""
+        weekday = now.isoweekday()  # Monday = 1, Sunday = 7
+        seconds = now.hour * 3600 + now.minute * 60 + now.second
+
+        schedules = [
+            schedule for schedule in self.data.get("schedules", [])
+            if weekday in schedule.get("days_of_week", [])
+            and parse_time(schedule["start_time"]) <= seconds <= parse_time(schedule["end_time"])
+        ]
+        return sorted(schedules, key=lambda x: (-x.get("priority", 1), x.get("id", 0)))
+
+    def resolve(self, now: datetime) -> Optional[Dict]:
+        """Get the content that should be playing at the given moment"""
+        for schedule in self.active_schedules(now):
+            content = self.get_content(schedule["content_id"])
+            if content:
+                return content
+        return None
+
+    def next_transition(self, now: datetime, hours: int = 24) -> Optional[Tuple[datetime, Optional[Dict]]]:
+        """Get the next moment the resolved content changes and the content from then on"""
+        current = self.resolve(now)
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        boundaries = set()
+        for day_offset in range(hours // 24 + 2):
+            day = day_start + timedelta(days=day_offset)
+            for schedule in self.data.get("schedules", []):
+                if day.isoweekday() not in schedule.get("days_of_week", []):
+                    continue
+                # Schedules include their end second, so they stop one second later
+                boundaries.add(day + timedelta(seconds=parse_time(schedule["start_time"])))
+                boundaries.add(day + timedelta(seconds=parse_time(schedule["end_time"]) + 1))
+
+        horizon = now + timedelta(hours=hours)
+        for boundary in sorted(b for b in boundaries if now < b <= horizon):
+            content = self.resolve(boundary)
+            if (content or {}).get("id") != (current or {}).get("id"):
+                return boundary, content
+        return None
+
+    def upcoming_contents(self, now: datetime, hours: int = 24) -> List[Dict]:
+        """Get the contents scheduled from now until the given horizon, in play order"""
+        contents = []
+        seen = set()
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        horizon = now + timedelta(hours=hours)
+
+        for day_offset in range(hours // 24 + 2):
+            day = day_start + timedelta(days=day_offset)
+            schedules = [
+                schedule for schedule in self.data.get("schedules", [])
+                if day.isoweekday() in schedule.get("days_of_week", [])
+            ]
+            for schedule in sorted(schedules, key=lambda x: parse_time(x["start_time"])):
+                start = day + timedelta(seconds=parse_time(schedule["start_time"]))
+                end = day + timedelta(seconds=parse_time(schedule["end_time"]))
+                if end < now or start > horizon or schedule["content_id"] in seen:
+                    continue
+                content = self.get_content(schedule["content_id"])
+                if content:
+                    seen.add(schedule["content_id"])
+                    contents.append(content)
+
+        return contents
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Server push channel for the Raspberry Pi player
+Sicoob Credisete - Sistema de Sinalização Digital
+
+Keeps a WebSocket open to the agency events endpoint. Every change event,
+and every (re)connection, asks the player to resync its manifest, so edits
+made in the panel reach the screen in seconds instead of at the next poll.
+While the channel is down the player falls back to polling.
+"""
+
+import asyncio
+import json
+import logging
+import random
+from typing import Optional
+
+import websockets
+
+from api_client import device_auth_headers
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_BASE = 1  # seconds
+RECONNECT_MAX = 60  # seconds
+# Server pings every 30s; missing a few means the connection is dead
+RECEIVE_TIMEOUT = 90  # seconds
+
+
+class PushChannel:
+    """Reconnecting WebSocket subscription to the change events of an agency"""
+
+    def __init__(self, url: str, device_key: Optional[str] = None):
+        self.url = url
+        self.device_key = device_key
+        self.connected = False
+        self.resync_needed = asyncio.Event()
+        self.last_event: Optional[dict] = None
+
+    @staticmethod
+    def events_url(api_base_url: str, agency_id: int) -> str:
+        """Build the events URL of an agency from the HTTP API URL"""
+        base = api_base_url.rstrip("/")
+        if base.startswith("https://"):
+            base = "wss://" + base[len("https://"):]
+        elif base.startswith("http://"):
+            base = "ws://" + base[len("http://"):]
+        return f"{base}/devices/agency/{agency_id}/events"
+
+    def request_resync(self):
+        """Ask the player to resync its manifest"""
+        self.resync_needed.set()
+
+    async def wait_for_resync(self, timeout: float) -> bool:
+        """Wait until a resync is requested or the timeout expires"""
+        try:
+            await asyncio.wait_for(self.resync_needed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.resync_needed.clear()
+
+    async def run(self):
+        """Keep the channel connected until cancelled"""
+        attempt = 0
+        while True:
+            try:
+                # The server closes unauthenticated subscriptions with code 1008
+                headers = device_auth_headers(self.device_key)
+                async with websockets.connect(self.url, additional_headers=headers) as websocket:
+                    self.connected = True
+                    attempt = 0
+                    logger.info(f"Push channel connected: {self.url}")
+
+                    # Changes made while disconnected are picked up by a resync
+                    self.request_resync()
+                    await self._receive(websocket)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Push channel error: {e}")
+            finally:
+                if self.connected:
+                    logger.info("Push channel disconnected, falling back to polling")
+                self.connected = False
+
+            delay = random.uniform(0, min(RECONNECT_MAX, RECONNECT_BASE * 2 ** attempt))
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _receive(self, websocket):
+        """Handle incoming events until the connection drops"""
+        while True:
+            message = await asyncio.wait_for(websocket.recv(), RECEIVE_TIMEOUT)
+            event = json.loads(message)
+
+            if event.get("type") == "changed":
+                self.last_event = event
+                logger.info(
+                    f"Agency change pushed: {event.get('entity')} {event.get('entity_id')} {event.get('action')}"
+                )
+                self.request_resync()
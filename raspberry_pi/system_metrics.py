@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+System metrics sampler for the Raspberry Pi player
+Sicoob Credisete - Sistema de Sinalização Digital
+
+CPU, memory, disk, temperature and throttling state are sampled at a fixed
+cadence into a fixed-size in-memory ring buffer. Status reports read
+min/avg/max windows from the buffer instead of sampling synchronously.
+"""
+
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Dict, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_INTERVAL = 5  # seconds
+DEFAULT_CAPACITY = 720  # one hour of samples at the default interval
+
+TEMPERATURE_FILE = "/sys/class/thermal/thermal_zone0/temp"
+THROTTLED_FILE = "/sys/devices/platform/soc/soc:firmware/get_throttled"
+
+NUMERIC_METRICS = ("cpu_percent", "memory_percent", "disk_usage", "temperature")
+
+# Bits of the firmware throttling state (same as `vcgencmd get_throttled`)
+THROTTLED_FLAGS = {
+    "under_voltage": 0,
+    "frequency_capped": 1,
+    "throttled": 2,
+    "soft_temperature_limit": 3,
+    "under_voltage_occurred": 16,
+    "frequency_capped_occurred": 17,
+    "throttled_occurred": 18,
+    "soft_temperature_limit_occurred": 19,
+}
+
+
+class MetricsSampler:
+    """Fixed-cadence sampler keeping the latest samples in a ring buffer"""
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL, capacity: int = DEFAULT_CAPACITY):
+        self.interval = interval
+        self.samples = deque(maxlen=capacity)
+        self.boot_time = psutil.boot_time()
+
+        # The first non-blocking reading only sets the baseline for the next ones
+        psutil.cpu_percent(interval=None)
+
+    @staticmethod
+    def read_temperature() -> Optional[float]:
+        """Read the CPU temperature in Celsius"""
+        try:
+            with open(TEMPERATURE_FILE, 'r') as f:
+                return round(float(f.read()) / 1000, 1)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def read_throttled() -> Optional[int]:
+        """Read the firmware throttling bit field"""
+        try:
+            with open(THROTTLED_FILE, 'r') as f:
+                return int(f.read().strip(), 16)
+        except (OSError, ValueError):
+            return None
+
+    def sample(self) -> Dict:
+        """Take one sample without blocking"""
+        sample = {
+            "timestamp": time.time(),
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": psutil.virtual_memory().percent,
+            "disk_usage": psutil.disk_usage('/').percent,
+            "temperature": self.read_temperature(),
+            "throttled": self.read_throttled(),
+        }
+        self.samples.append(sample)
+        return sample
+
+    async def collect(self):
+        """Take one sample (scheduled periodically by the player)"""
+        try:
+            self.sample()
+        except Exception as e:
+            logger.error(f"Error sampling system metrics: {e}")
+
+    def summary(self, window: float = 300) -> Dict:
+        """Get min/avg/max of each metric over the last window seconds"""
+        if not self.samples:
+            self.sample()
+
+        since = time.time() - window
+        samples = [sample for sample in self.samples if sample["timestamp"] >= since]
+        samples = samples or [self.samples[-1]]
+        latest = samples[-1]
+
+        summary = {
+            metric: latest[metric] for metric in NUMERIC_METRICS
+        }
+        summary["window_seconds"] = window
+        summary["samples"] = len(samples)
+
+        for metric in NUMERIC_METRICS:
+            values = [sample[metric] for sample in samples if sample[metric] is not None]
+            if values:
+                summary[f"{metric}_window"] = {
+                    "min": min(values),
+                    "avg": round(sum(values) / len(values), 1),
+                    "max": max(values),
+                }
+
+        throttled = latest["throttled"]
+        if throttled is not None:
+            summary["throttling"] = {
+                flag: bool(throttled & (1 << bit)) for flag, bit in THROTTLED_FLAGS.items()
+            }
+
+        uptime = timedelta(seconds=int(time.time() - self.boot_time))
+        summary["uptime"] = str(uptime)
+        return summary
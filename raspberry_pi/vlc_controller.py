@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Long-lived VLC video backend for the Raspberry Pi player
+Sicoob Credisete - Sistema de Sinalização Digital
+
+One VLC instance is started with its RC control interface and kept running.
+Videos are switched by playlist commands instead of relaunching the process,
+the next video can be enqueued ahead of its slot, and every switch reports
+how long it took until the new video was playing.
+"""
+
+import asyncio
+import logging
+import os
+import subprocess
+import time
+from typing import Optional
+from urllib.parse import unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RC_PORT = 4212
+CONNECT_TIMEOUT = 15  # seconds
+COMMAND_TIMEOUT = 2  # seconds
+SWITCH_TIMEOUT = 5  # seconds
+# Playlist entries kept before the next switch clears the playlist
+MAX_PLAYLIST_LENGTH = 20
+
+PROMPT = b"> "
+
+
+class VlcController:
+    """VLC process driven through its RC interface over a local TCP socket"""
+
+    def __init__(self, rc_port: int = DEFAULT_RC_PORT, executable: str = "vlc"):
+        self.rc_port = rc_port
+        self.executable = executable
+
+        self.process: Optional[subprocess.Popen] = None
+        self.current_mrl: Optional[str] = None
+        self.preloaded_mrl: Optional[str] = None
+        self.playlist_length = 0
+        self.last_switch_latency_ms: Optional[float] = None
+
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        """Check if VLC and its control connection are alive"""
+        return (
+            self.process is not None
+            and self.process.poll() is None
+            and self._writer is not None
+            and not self._writer.is_closing()
+        )
+
+    async def start(self):
+        """Launch VLC idle with the RC interface and connect to it"""
+        await self.stop_process()
+
+        logger.info("Starting persistent VLC backend")
+        self.process = subprocess.Popen([
+            self.executable,
+            "--intf", "rc",
+            "--rc-host", f"127.0.0.1:{self.rc_port}",
+            "--rc-fake-tty",
+            "--fullscreen",
+            "--no-video-title-show",
+            "--no-osd",
+            "--no-play-and-exit",
+        ], stdin=subprocess.DEVNULL)
+
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while True:
+            try:
+                self._reader, self._writer = await asyncio.open_connection("127.0.0.1", self.rc_port)
+                break
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("Could not connect to the VLC RC interface")
+                await asyncio.sleep(0.3)
+
+        await self._read_response()
+        self.current_mrl = None
+        self.preloaded_mrl = None
+        self.playlist_length = 0
+        logger.info("VLC backend ready")
+
+    async def _read_response(self) -> str:
+        """Read the output of the last command, up to the next prompt"""
+        data = b""
+        deadline = time.monotonic() + COMMAND_TIMEOUT
+        while not data.endswith(PROMPT):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(self._reader.read(4096), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        return data.decode(errors="replace")
+
+    async def command(self, line: str) -> str:
+        """Send one RC command and return its output"""
+        async with self._lock:
+            self._writer.write(f"{line}\n".encode())
+            await self._writer.drain()
+            return await self._read_response()
+
+    async def _ensure_running(self):
+        """Restart VLC if it crashed or was never started"""
+        if not self.is_running:
+            await self.start()
+
+    @staticmethod
+    def _title_of(mrl: str) -> str:
+        """Title VLC reports for a media, used to detect the switch"""
+        path = urlparse(mrl).path if "://" in mrl else mrl
+        return unquote(os.path.basename(path))
+
+    async def preload(self, mrl: str):
+        """Enqueue the next video so the switch does not rebuild the playlist"""
+        if mrl in (self.current_mrl, self.preloaded_mrl):
+            return
+
+        await self._ensure_running()
+        if self.preloaded_mrl or self.playlist_length >= MAX_PLAYLIST_LENGTH:
+            return
+
+        await self.command(f"enqueue {mrl}")
+        self.preloaded_mrl = mrl
+        self.playlist_length += 1
+        logger.info(f"Video preloaded: {mrl}")
+
+    async def play(self, mrl: str):
+        """Switch to a video, looping it until the next switch"""
+        if mrl == self.current_mrl and self.is_running:
+            return
+
+        await self._ensure_running()
+        started = time.monotonic()
+
+        if mrl == self.preloaded_mrl:
+            await self.command("next")
+        else:
+            await self.command("clear")
+            await self.command(f"add {mrl}")
+            self.playlist_length = 1
+
+        await self.command("repeat on")
+        self.current_mrl = mrl
+        self.preloaded_mrl = None
+
+        await self._wait_until_playing(mrl, started)
+
+    async def _wait_until_playing(self, mrl: str, started: float):
+        """Measure the time until VLC reports the new video as playing"""
+        title = self._title_of(mrl)
+        while time.monotonic() - started < SWITCH_TIMEOUT:
+            if title in await self.command("get_title") and "1" in await self.command("is_playing"):
+                self.last_switch_latency_ms = round((time.monotonic() - started) * 1000, 1)
+                logger.info(f"Video switch took {self.last_switch_latency_ms} ms: {mrl}")
+                return
+            await asyncio.sleep(0.05)
+
+        self.last_switch_latency_ms = None
+        logger.warning(f"VLC did not report playback of {mrl} within {SWITCH_TIMEOUT}s")
+
+    async def stop(self):
+        """Stop playback but keep VLC running for the next video"""
+        if self.is_running and self.current_mrl:
+            await self.command("stop")
+            await self.command("clear")
+        self.current_mrl = None
+        self.preloaded_mrl = None
+        self.playlist_length = 0
+
+    async def stop_process(self):
+        """Close the control connection and terminate VLC"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                await asyncio.to_thread(self.process.wait, 5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+        self.process = None
+        self.current_mrl = None
+        self.preloaded_mrl = None